@@ -1,29 +1,65 @@
 from flask import Flask
 from config import Config
 from extensions import db, bcrypt, jwt
+from database import init_database
 from auth.routes import auth_bp
 from lawyers.routes import lawyers_bp
 from infohub import infohub_bp
 from appointments.routes import appointments_bp
+from messages.routes import messages_bp
 from flask_migrate import Migrate
+from search import search_index
+from cache import response_cache
+from pubsub import message_broker
+from pagination import InvalidCursor, invalid_cursor_response
+from query_plans import check_query_plans_command
+from booking_stress import stress_booking_command
+from counters import rebuild_unread_counters_command
+from uploads import expire_uploads_command
+from hashing import HasherBusy, hasher_busy_response, password_hasher
+from ratelimit import RateLimited, rate_limited_response, rate_limiter
+from replicas import replica_router
+from querystats import query_stats
+from metrics import metrics
+from bench import bench_command, bench_seed_command
 
 migrate = Migrate()
 
-def create_app():
+def create_app(config_class=Config):
     app = Flask(__name__)
-    app.config.from_object(Config)
+    app.config.from_object(config_class)
 
     # init extensions
-    db.init_app(app)
+    init_database(app)        # db.init_app plus pool options and SQLite pragmas
+    query_stats.init_app(app) # after the engines exist
     bcrypt.init_app(app)
     jwt.init_app(app)
     migrate.init_app(app, db)
+    search_index.init_app(app)
+    response_cache.init_app(app)
+    message_broker.init_app(app)
+    password_hasher.init_app(app)
+    rate_limiter.init_app(app)
+    replica_router.init_app(app)
+    metrics.init_app(app)
 
     # register blueprints
     app.register_blueprint(auth_bp)
     app.register_blueprint(lawyers_bp)
     app.register_blueprint(infohub_bp)
     app.register_blueprint(appointments_bp)
+    app.register_blueprint(messages_bp)
+
+    app.register_error_handler(InvalidCursor, invalid_cursor_response)
+    app.register_error_handler(HasherBusy, hasher_busy_response)
+    app.register_error_handler(RateLimited, rate_limited_response)
+
+    app.cli.add_command(check_query_plans_command)
+    app.cli.add_command(stress_booking_command)
+    app.cli.add_command(rebuild_unread_counters_command)
+    app.cli.add_command(expire_uploads_command)
+    app.cli.add_command(bench_seed_command)
+    app.cli.add_command(bench_command)
 
     return app
 
@@ -0,0 +1,51 @@
+"""Appointment status state machine.
+
+::
+
+    pending ──> confirmed ──> completed
+       │            │
+       └────────────┴──────> cancelled
+
+``completed`` and ``cancelled`` are final. Status changes go through
+``transition``, a single conditional UPDATE whose WHERE clause only matches
+rows in a state that may move to the target, so concurrent changes (a
+client cancelling while the lawyer confirms) can't overwrite each other
+and a batch of any size costs one statement.
+"""
+from sqlalchemy import update
+
+from extensions import db
+from models import Appointment
+
+TRANSITIONS = {
+    'pending': {'confirmed', 'cancelled'},
+    'confirmed': {'completed', 'cancelled'},
+    'completed': set(),
+    'cancelled': set(),
+}
+
+
+def can_transition(current, target):
+    return target in TRANSITIONS.get(current, ())
+
+
+def sources(target):
+    """States an appointment may be in to move to ``target``."""
+    return [state for state, targets in TRANSITIONS.items() if target in targets]
+
+
+def transition(target, *conditions):
+    """Move every appointment matching ``conditions`` that is allowed to move to ``target``.
+
+    Returns the ids that changed; the caller commits.
+    """
+    if target not in TRANSITIONS:
+        raise ValueError(f'unknown appointment status {target!r}')
+    conditions = list(conditions) + [Appointment.status.in_(sources(target))]
+    stmt = update(Appointment).where(*conditions).values(status=target)
+    if db.session.get_bind().dialect.update_returning:
+        return [row.id for row in db.session.execute(stmt.returning(Appointment.id))]
+    ids = [row.id for row in db.session.query(Appointment.id).filter(*conditions)]
+    if ids:
+        db.session.execute(update(Appointment).where(Appointment.id.in_(ids), *conditions).values(status=target))
+    return ids
@@ -1,99 +1,287 @@
-from flask import Blueprint, request, jsonify
+from datetime import datetime, timedelta
+from flask import Blueprint, current_app, request, jsonify
+from sqlalchemy import and_, case, func, select
+from sqlalchemy.exc import IntegrityError
 from extensions import db
-from models import Appointment, User, LawyerProfile
-from flask_jwt_extended import get_jwt_identity
+from models import Appointment, AvailabilityWindow
 from decorators import role_required
-import json
+from dates import format_datetime, parse_datetime
+from availability import INACTIVE_STATUSES, containing_window, lock_lawyer, on_slot_grid, overlaps
+from appointment_status import TRANSITIONS, transition
+from cache import response_cache
+from counters import unread_total
+from exports import FORMATS as EXPORT_FORMATS, export_response
+from identity import current_identity, current_lawyer_profile_id
+from pagination import keyset_page, page_params, page_response
+from validators import is_id
 
 appointments_bp = Blueprint('appointments', __name__, url_prefix='/appointments')
 
 
+def _key(appt):
+    return [appt.id]
+
+
+def _calendar_key(appt):
+    return [appt.appointment_date, appt.id]
+
+
+def _date_range(query):
+    """Apply optional ?from=&to= (ISO datetimes, to is exclusive) to an appointment query.
+
+    Returns the filtered query, or None if either bound can't be parsed.
+    """
+    start, end = request.args.get('from'), request.args.get('to')
+    if start:
+        start = parse_datetime(start)
+        if start is None:
+            return None
+        query = query.filter(Appointment.appointment_date >= start)
+    if end:
+        end = parse_datetime(end)
+        if end is None:
+            return None
+        query = query.filter(Appointment.appointment_date < end)
+    return query
+
+
 @appointments_bp.route('/new', methods=['POST'])
 @role_required('Client')
 def create_appointment():
     """Client creates an appointment with a lawyer.
-    Expected JSON: { lawyer_id: int, appointment_date: str (ISO), problem_description: str }
+    Expected JSON: { lawyer_id: int, appointment_date: str (ISO), problem_description: str,
+                     duration_minutes: int (optional) }
+
+    appointment_date is taken as UTC when it has no offset. If the lawyer
+    has published availability the appointment must fit one of its
+    windows, start on one of that window's slots and defaults to the
+    window's slot length. It is
+    rejected with 409 if it overlaps another active appointment of the
+    lawyer; the check and the insert run under a per-lawyer lock.
     """
-    ident = json.loads(get_jwt_identity())
+    ident = current_identity()
     client_id = ident.get('id')
 
     data = request.get_json() or {}
     lawyer_id = data.get('lawyer_id')
     appointment_date = data.get('appointment_date')
     problem_description = data.get('problem_description')
+    duration = data.get('duration_minutes')
 
     if not lawyer_id or not appointment_date:
         return jsonify({'message': 'lawyer_id and appointment_date are required'}), 400
+    if not is_id(lawyer_id):
+        return jsonify({'message': 'lawyer_id must be an integer id'}), 400
+
+    appointment_date = parse_datetime(appointment_date)
+    if appointment_date is None:
+        return jsonify({'message': 'appointment_date must be an ISO 8601 datetime'}), 400
 
-    # check lawyer exists
-    if not LawyerProfile.query.get(lawyer_id):
+    max_minutes = current_app.config.get('APPOINTMENT_MAX_MINUTES', 240)
+    if duration is not None and (not isinstance(duration, int) or isinstance(duration, bool)
+                                 or not 0 < duration <= max_minutes):
+        return jsonify({'message': f'duration_minutes must be between 1 and {max_minutes}'}), 400
+
+    windows = AvailabilityWindow.query.filter_by(lawyer_id=lawyer_id).all()
+    if windows:
+        window = containing_window(windows, appointment_date, duration)
+        if window is None:
+            return jsonify({'message': 'Lawyer is not available at that time'}), 409
+        if not on_slot_grid(window, appointment_date):
+            return jsonify({'message': "appointment_date must be the start of one of the lawyer's slots"}), 409
+        duration = duration or window.slot_minutes
+    duration = duration or current_app.config.get('APPOINTMENT_DEFAULT_MINUTES', 60)
+
+    # check lawyer exists, and hold their calendar until commit
+    if not lock_lawyer(lawyer_id):
         return jsonify({'message': 'Lawyer not found'}), 404
+    if overlaps(lawyer_id, appointment_date, appointment_date + timedelta(minutes=duration)):
+        db.session.rollback()
+        return jsonify({'message': 'That time is already booked'}), 409
 
     appt = Appointment(
         client_id=client_id,
         lawyer_id=lawyer_id,
         appointment_date=appointment_date,
+        duration_minutes=duration,
         problem_description=problem_description,
         status='pending'
     )
     db.session.add(appt)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # the unique index caught a booking that raced past the lock
+        db.session.rollback()
+        return jsonify({'message': 'That time is already booked'}), 409
     return jsonify({'message': 'Appointment created', 'appointment_id': appt.id}), 201
 
 
 @appointments_bp.route('', methods=['GET'])
 @role_required('Client')
 def list_client_appointments():
-    """List appointments for authenticated client."""
-    ident = json.loads(get_jwt_identity())
+    """List appointments for authenticated client. Optional ?from=&to= date range."""
+    ident = current_identity()
     client_id = ident.get('id')
 
-    rows = Appointment.query.filter_by(client_id=client_id).all()
+    q = _date_range(Appointment.query.filter_by(client_id=client_id))
+    if q is None:
+        return jsonify({'message': 'from/to must be ISO 8601 datetimes'}), 400
+
+    limit, after = page_params()
+    rows, next_cursor = keyset_page(q, [Appointment.id], _key, limit, after)
     result = []
     for r in rows:
         result.append({
             'id': r.id,
             'client_id': r.client_id,
             'lawyer_id': r.lawyer_id,
-            'appointment_date': r.appointment_date,
+            'appointment_date': format_datetime(r.appointment_date),
+            'duration_minutes': r.duration_minutes,
             'status': r.status,
             'problem_description': r.problem_description,
             'notes': r.notes
         })
-    return jsonify(result)
+    return page_response(result, next_cursor)
 
 
 @appointments_bp.route('/lawyer', methods=['GET'])
 @role_required('Lawyer')
 def list_lawyer_appointments():
-    """List appointments for authenticated lawyer."""
-    ident = json.loads(get_jwt_identity())
-    user_id = ident.get('id')
-    # find lawyer_profile id for this user
-    lp = LawyerProfile.query.filter_by(user_id=user_id).first()
-    if not lp:
+    """List appointments for authenticated lawyer in calendar (date) order.
+
+    Optional ?from=&to= restricts to a date range, e.g. this week's calendar.
+    """
+    lawyer_id = current_lawyer_profile_id()
+    if lawyer_id is None:
         return jsonify({'message': 'Profile not found'}), 404
 
-    rows = Appointment.query.filter_by(lawyer_id=lp.id).all()
+    # with from/to this is a range scan on (lawyer_id, appointment_date)
+    q = _date_range(Appointment.query.filter_by(lawyer_id=lawyer_id))
+    if q is None:
+        return jsonify({'message': 'from/to must be ISO 8601 datetimes'}), 400
+
+    limit, after = page_params()
+    rows, next_cursor = keyset_page(
+        q, [Appointment.appointment_date, Appointment.id], _calendar_key, limit, after
+    )
     result = []
     for r in rows:
         result.append({
             'id': r.id,
             'client_id': r.client_id,
             'lawyer_id': r.lawyer_id,
-            'appointment_date': r.appointment_date,
+            'appointment_date': format_datetime(r.appointment_date),
+            'duration_minutes': r.duration_minutes,
             'status': r.status,
             'problem_description': r.problem_description,
             'notes': r.notes
         })
-    return jsonify(result)
+    return page_response(result, next_cursor)
+
+
+@appointments_bp.route('/lawyer/summary', methods=['GET'])
+@role_required('Lawyer')
+def lawyer_summary():
+    """Dashboard numbers for the authenticated lawyer.
+
+    Query param: days (1-31, default 7), the look-ahead for upcoming.
+    Response: { status_counts: { status: n }, upcoming: { days, total,
+    by_day: { "YYYY-MM-DD": n } }, unread_messages: n }
+    Every figure is a SQL aggregate, so the payload doesn't grow with the
+    lawyer's history. Cached per lawyer for SUMMARY_CACHE_TTL seconds.
+    """
+    lawyer_id = current_lawyer_profile_id()
+    if lawyer_id is None:
+        return jsonify({'message': 'Profile not found'}), 404
+    user_id = current_identity()['id']
+    days = max(1, min(request.args.get('days', 7, type=int), 31))
+
+    def compute():
+        counts = dict.fromkeys(TRANSITIONS, 0)
+        counts.update(
+            db.session.query(Appointment.status, func.count())
+            .filter(Appointment.lawyer_id == lawyer_id)
+            .group_by(Appointment.status)
+            .all()
+        )
+
+        # one SUM(CASE ...) per day instead of GROUP BY date(...): a single
+        # row from the (lawyer_id, appointment_date) range scan, no sort, and
+        # no dialect-specific date function
+        now = datetime.utcnow()
+        end = now + timedelta(days=days)
+        midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        buckets = [midnight + timedelta(days=i) for i in range(days + 1)]
+        date_col = Appointment.appointment_date
+        row = (
+            db.session.query(*[
+                func.coalesce(func.sum(case((and_(date_col >= lo, date_col < hi), 1), else_=0)), 0)
+                for lo, hi in zip(buckets, buckets[1:] + [end])
+            ])
+            .filter(
+                Appointment.lawyer_id == lawyer_id,
+                date_col >= now,
+                date_col < end,
+                Appointment.status.notin_(INACTIVE_STATUSES),
+            )
+            .one()
+        )
+        by_day = {b.date().isoformat(): int(n) for b, n in zip(buckets, row) if b < end}
+        return {
+            'status_counts': counts,
+            'upcoming': {'days': days, 'total': sum(by_day.values()), 'by_day': by_day},
+            'unread_messages': unread_total(user_id),
+        }
+
+    ttl = current_app.config.get('SUMMARY_CACHE_TTL', 15)
+    summary = response_cache.get_or_set(f'lawyer-summary:{lawyer_id}:{days}', compute, ttl) if ttl else compute()
+    return jsonify(summary)
+
+
+EXPORT_FIELDS = ['id', 'client_id', 'lawyer_id', 'appointment_date', 'duration_minutes', 'status',
+                 'problem_description', 'notes']
+
+
+def _export_row(r):
+    return [r.id, r.client_id, r.lawyer_id, format_datetime(r.appointment_date), r.duration_minutes,
+            r.status, r.problem_description, r.notes]
+
+
+@appointments_bp.route('/export', methods=['GET'])
+@role_required('Client', 'Lawyer')
+def export_appointments():
+    """Download the caller's appointment history as ?format=csv (default) or ndjson.
+
+    Lawyers get their calendar in date order, clients their bookings in id
+    order; optional ?from=&to= as for the lists. Rows are streamed from the
+    database, so memory use doesn't depend on how many there are.
+    """
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'message': f'format must be one of {", ".join(EXPORT_FORMATS)}'}), 400
+
+    stmt = select(Appointment.id, Appointment.client_id, Appointment.lawyer_id, Appointment.appointment_date,
+                  Appointment.duration_minutes, Appointment.status, Appointment.problem_description,
+                  Appointment.notes)
+    if current_identity()['role'] == 'Lawyer':
+        lawyer_id = current_lawyer_profile_id()
+        if lawyer_id is None:
+            return jsonify({'message': 'Profile not found'}), 404
+        stmt = stmt.where(Appointment.lawyer_id == lawyer_id).order_by(Appointment.appointment_date, Appointment.id)
+    else:
+        stmt = stmt.where(Appointment.client_id == current_identity()['id']).order_by(Appointment.id)
+    stmt = _date_range(stmt)
+    if stmt is None:
+        return jsonify({'message': 'from/to must be ISO 8601 datetimes'}), 400
+    return export_response(stmt, EXPORT_FIELDS, _export_row, fmt, 'appointments')
 
 
 @appointments_bp.route('/<int:appointment_id>', methods=['GET'])
 @role_required('Client')
 def get_appointment(appointment_id):
     """Get appointment details (client must own the appointment)."""
-    ident = json.loads(get_jwt_identity())
+    ident = current_identity()
     client_id = ident.get('id')
 
     appt = Appointment.query.get_or_404(appointment_id)
@@ -104,7 +292,8 @@ def get_appointment(appointment_id):
         'id': appt.id,
         'client_id': appt.client_id,
         'lawyer_id': appt.lawyer_id,
-        'appointment_date': appt.appointment_date,
+        'appointment_date': format_datetime(appt.appointment_date),
+        'duration_minutes': appt.duration_minutes,
         'status': appt.status,
         'problem_description': appt.problem_description,
         'notes': appt.notes
@@ -114,20 +303,28 @@ def get_appointment(appointment_id):
 @appointments_bp.route('/<int:appointment_id>', methods=['PUT'])
 @role_required('Lawyer')
 def update_appointment(appointment_id):
-    """Lawyer updates status and notes for an appointment assigned to them."""
-    ident = json.loads(get_jwt_identity())
-    user_id = ident.get('id')
-    lp = LawyerProfile.query.filter_by(user_id=user_id).first()
-    if not lp:
+    """Lawyer updates status and notes for an appointment assigned to them.
+
+    status may only move pending -> confirmed -> completed, or to cancelled
+    from either pending or confirmed; anything else is a 409.
+    """
+    lawyer_id = current_lawyer_profile_id()
+    if lawyer_id is None:
         return jsonify({'message': 'Profile not found'}), 404
 
     appt = Appointment.query.get_or_404(appointment_id)
-    if appt.lawyer_id != lp.id:
+    if appt.lawyer_id != lawyer_id:
         return jsonify({'message': 'Not authorized'}), 403
 
     data = request.get_json() or {}
-    if 'status' in data:
-        appt.status = data.get('status')
+    status = data.get('status')
+    if 'status' in data and status != appt.status:
+        if status not in TRANSITIONS:
+            return jsonify({'message': f'status must be one of {", ".join(TRANSITIONS)}'}), 400
+        # conditional on the current state, so a concurrent change wins cleanly
+        if not transition(status, Appointment.id == appt.id):
+            db.session.rollback()
+            return jsonify({'message': f'Cannot change status from {appt.status} to {status}'}), 409
     if 'notes' in data:
         appt.notes = data.get('notes')
 
@@ -135,17 +332,67 @@ def update_appointment(appointment_id):
     return jsonify({'message': 'Appointment updated'})
 
 
+@appointments_bp.route('/lawyer/status', methods=['POST'])
+@role_required('Lawyer')
+def update_appointment_status_bulk():
+    """Move many of the lawyer's appointments to one status in a single UPDATE.
+
+    Expected JSON: { status, and either ids: [appointment_id, ...] or
+    date: "YYYY-MM-DD" (every appointment on that day) }
+    Appointments that aren't the caller's, or whose current status can't
+    move to the target, are left alone and reported as skipped.
+    Response: { updated: [ids], skipped: [ids] } (skipped only with ids)
+    """
+    lawyer_id = current_lawyer_profile_id()
+    if lawyer_id is None:
+        return jsonify({'message': 'Profile not found'}), 404
+
+    data = request.get_json() or {}
+    status = data.get('status')
+    if status not in TRANSITIONS:
+        return jsonify({'message': f'status must be one of {", ".join(TRANSITIONS)}'}), 400
+
+    conditions = [Appointment.lawyer_id == lawyer_id]
+    ids = data.get('ids')
+    if ids is not None:
+        max_batch = current_app.config.get('APPOINTMENT_BATCH_MAX', 200)
+        if not isinstance(ids, list) or not all(isinstance(i, int) for i in ids):
+            return jsonify({'message': 'ids must be a list of appointment ids'}), 400
+        if len(ids) > max_batch:
+            return jsonify({'message': f'at most {max_batch} ids per request'}), 400
+        conditions.append(Appointment.id.in_(ids))
+    elif data.get('date'):
+        day = parse_datetime(data['date'])
+        if day is None:
+            return jsonify({'message': 'date must be an ISO 8601 date'}), 400
+        day = day.replace(hour=0, minute=0, second=0, microsecond=0)
+        conditions += [Appointment.appointment_date >= day,
+                       Appointment.appointment_date < day + timedelta(days=1)]
+    else:
+        return jsonify({'message': 'ids or date is required'}), 400
+
+    updated = transition(status, *conditions)
+    db.session.commit()
+    result = {'message': 'Appointments updated', 'updated': sorted(updated)}
+    if ids is not None:
+        changed = set(updated)
+        result['skipped'] = [i for i in ids if i not in changed]
+    return jsonify(result)
+
+
 @appointments_bp.route('/<int:appointment_id>/cancel', methods=['POST'])
 @role_required('Client')
 def cancel_appointment(appointment_id):
-    """Client cancels their appointment."""
-    ident = json.loads(get_jwt_identity())
+    """Client cancels their appointment (while it is pending or confirmed)."""
+    ident = current_identity()
     client_id = ident.get('id')
 
     appt = Appointment.query.get_or_404(appointment_id)
     if appt.client_id != client_id:
         return jsonify({'message': 'Not authorized'}), 403
 
-    appt.status = 'cancelled'
+    if not transition('cancelled', Appointment.id == appt.id):
+        db.session.rollback()
+        return jsonify({'message': f'Cannot cancel an appointment that is {appt.status}'}), 409
     db.session.commit()
     return jsonify({'message': 'Appointment cancelled'})
@@ -1,7 +1,10 @@
 from flask import Blueprint, request, jsonify
 from models import User, LawyerProfile, Specialty
-from extensions import db, bcrypt
-from flask_jwt_extended import create_access_token
+from extensions import db
+from hashing import HasherBusy, password_hasher
+from ratelimit import client_ip, rate_limiter
+from identity import create_token
+from dates import format_datetime
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/auth')
 
@@ -19,7 +22,7 @@ def signup():
         return jsonify({'message': 'Email already exists'}), 400
 
    
-    hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+    hashed_password = password_hasher.hash(password)
 
     
     user = User(
@@ -31,10 +34,7 @@ def signup():
     db.session.add(user)
     db.session.commit()
 
-    
-    import json
-    identity = json.dumps({'id': user.id, 'role': user.role})
-    token = create_access_token(identity=identity)
+    token = create_token(user)
 
     return jsonify({
         'message': 'User created successfully',
@@ -46,20 +46,34 @@ def signup():
 
 
 
+def _login_email():
+    data = request.get_json(silent=True) or {}
+    email = data.get('email')
+    return email.strip().lower() if isinstance(email, str) else None
+
+
 @auth_bp.route('/login', methods=['POST'])
+@rate_limiter.limit('LOGIN_RATE_LIMIT_IP', key=client_ip)
+@rate_limiter.limit('LOGIN_RATE_LIMIT_EMAIL', key=_login_email)
 def login():
     data = request.get_json()
     email = data.get('email')
     password = data.get('password')
 
     user = User.query.filter_by(email=email).first()
-    if not user or not bcrypt.check_password_hash(user.password, password):
+    if not user or not password_hasher.check(user.password, password):
         return jsonify({'message': 'Invalid credentials'}), 401
 
-    # Create JWT token: encode identity as JSON string
-    import json
-    identity = json.dumps({'id': user.id, 'role': user.role})
-    token = create_access_token(identity=identity)
+    # upgrade hashes made before BCRYPT_LOG_ROUNDS was raised; not worth
+    # failing the login over if the pool is busy, it will happen next time
+    if password_hasher.needs_rehash(user.password):
+        try:
+            user.password = password_hasher.hash(password)
+            db.session.commit()
+        except HasherBusy:
+            pass
+
+    token = create_token(user)
 
     return jsonify({
         'access_token': token,
@@ -98,7 +112,7 @@ def view_user(user_id):
         'f_name': user.f_name,
         'email': user.email,
         'role': user.role,
-        'created_at': user.created_at,
+        'created_at': format_datetime(user.created_at, 'seconds'),
         'profile': profile_data
     })
 
@@ -0,0 +1,146 @@
+"""Bookable slots from weekly availability windows.
+
+A lawyer's availability is a set of ``AvailabilityWindow`` rows (weekday,
+start/end minute, slot length), all in UTC like the rest of the stored
+datetimes. Bookings must start on a window's slot grid, so an
+appointment never straddles two advertised slots. ``expand_windows`` turns them into the
+concrete slots inside a date range, in time order; ``free_slots`` removes
+the slots that overlap a booking with a single merge sweep over the two
+sorted sequences, so the cost is linear in slots plus bookings rather than
+their product. ``free_slots_for`` does this for many lawyers at once with
+one query for windows and one index range scan for bookings.
+
+Bookings are ``Appointment`` rows whose status is not in
+``INACTIVE_STATUSES``; an appointment occupies
+``[appointment_date, appointment_date + duration_minutes)``.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from flask import current_app
+from sqlalchemy import update
+
+from extensions import db
+from models import Appointment, AvailabilityWindow, LawyerProfile
+
+# appointments in these states no longer hold their time slot
+INACTIVE_STATUSES = ('cancelled',)
+
+
+def max_duration():
+    return timedelta(minutes=current_app.config.get('APPOINTMENT_MAX_MINUTES', 240))
+
+
+def expand_windows(windows, start, end):
+    """Yield ``(slot_start, slot_end)`` for every slot of ``windows`` in ``[start, end)``."""
+    by_weekday = defaultdict(list)
+    for w in windows:
+        by_weekday[w.weekday].append(w)
+    for day_windows in by_weekday.values():
+        day_windows.sort(key=lambda w: w.start_minute)
+
+    day, last = start.date(), (end - timedelta(microseconds=1)).date()
+    while day <= last:
+        midnight = datetime.combine(day, time.min)
+        for w in by_weekday.get(day.weekday(), ()):
+            step = timedelta(minutes=w.slot_minutes)
+            slot = midnight + timedelta(minutes=w.start_minute)
+            stop = midnight + timedelta(minutes=w.end_minute)
+            while slot + step <= stop:
+                if slot >= start and slot + step <= end:
+                    yield slot, slot + step
+                slot += step
+        day += timedelta(days=1)
+
+
+def free_slots(windows, booked, start, end):
+    """Slots of ``windows`` in ``[start, end)`` that overlap none of ``booked``.
+
+    ``booked`` is a list of ``(start, end)`` sorted by start.
+    """
+    result = []
+    i = 0
+    for slot_start, slot_end in expand_windows(windows, start, end):
+        # bookings that ended before this slot can't touch any later slot
+        while i < len(booked) and booked[i][1] <= slot_start:
+            i += 1
+        j = i
+        busy = False
+        while j < len(booked) and booked[j][0] < slot_end:
+            if booked[j][1] > slot_start:
+                busy = True
+                break
+            j += 1
+        if not busy:
+            result.append((slot_start, slot_end))
+    return result
+
+
+def booked_intervals(lawyer_ids, start, end):
+    """``{lawyer_id: [(start, end), ...]}`` of active bookings touching ``[start, end)``."""
+    rows = (
+        db.session.query(Appointment.lawyer_id, Appointment.appointment_date, Appointment.duration_minutes)
+        .filter(
+            Appointment.lawyer_id.in_(lawyer_ids),
+            Appointment.appointment_date >= start - max_duration(),
+            Appointment.appointment_date < end,
+            Appointment.status.notin_(INACTIVE_STATUSES),
+        )
+        .order_by(Appointment.lawyer_id, Appointment.appointment_date)
+        .all()
+    )
+    booked = defaultdict(list)
+    for lawyer_id, appt_start, minutes in rows:
+        appt_end = appt_start + timedelta(minutes=minutes)
+        if appt_end > start:
+            booked[lawyer_id].append((appt_start, appt_end))
+    return booked
+
+
+def free_slots_for(lawyer_ids, start, end):
+    """``{lawyer_id: [(slot_start, slot_end), ...]}`` of free slots in ``[start, end)``."""
+    windows = defaultdict(list)
+    for w in AvailabilityWindow.query.filter(AvailabilityWindow.lawyer_id.in_(lawyer_ids)):
+        windows[w.lawyer_id].append(w)
+    booked = booked_intervals(lawyer_ids, start, end)
+    return {lid: free_slots(windows[lid], booked[lid], start, end) for lid in lawyer_ids}
+
+
+def containing_window(windows, start, minutes=None):
+    """The window an appointment at ``start`` fits in, or None.
+
+    ``minutes`` defaults to the window's own slot length.
+    """
+    offset = start.hour * 60 + start.minute + start.second / 60
+    for w in windows:
+        if w.weekday == start.weekday() and w.start_minute <= offset < w.end_minute:
+            if offset + (minutes or w.slot_minutes) <= w.end_minute:
+                return w
+    return None
+
+
+def on_slot_grid(window, start):
+    """True if ``start`` is the start of one of ``window``'s slots."""
+    if start.second or start.microsecond:
+        return False
+    offset = start.hour * 60 + start.minute
+    return (offset - window.start_minute) % window.slot_minutes == 0
+
+
+def lock_lawyer(lawyer_id):
+    """Serialize bookings for one lawyer until the transaction ends.
+
+    A no-op UPDATE of the profile row takes its row lock on PostgreSQL and
+    the database write lock on SQLite, so two bookings for the same lawyer
+    can't both pass the overlap check. Returns False if there is no such
+    lawyer.
+    """
+    result = db.session.execute(
+        update(LawyerProfile).where(LawyerProfile.id == lawyer_id).values(id=LawyerProfile.id)
+    )
+    return result.rowcount == 1
+
+
+def overlaps(lawyer_id, start, end):
+    """True if an active booking of ``lawyer_id`` overlaps ``[start, end)``."""
+    return bool(booked_intervals([lawyer_id], start, end).get(lawyer_id))
@@ -0,0 +1,770 @@
+"""Load test and benchmark for the API.
+
+``flask bench-seed`` fills a scratch database through the models at a
+given scale, for example ``--scale 10k``, ``100k`` or ``1m`` rows in
+total. The rows are spread over users, lawyer profiles, specialties,
+availability windows, appointments, messages and InfoHub entries in
+fixed proportions. The data is deterministic for a given ``--seed``.
+
+``flask bench`` sends ``--requests`` requests to each route of auth,
+lawyers, appointments, messages and InfoHub. It spreads them over
+``--threads`` threads and prints throughput and p50/p95/p99 latency
+per route. Modes:
+
+* ``client`` - Flask's test client, in process. This measures the app
+  and the database only.
+* ``http`` - the app behind werkzeug's threaded server on a free local
+  port, one keep-alive connection per thread. This adds the WSGI
+  server and real sockets.
+
+Without ``--database-url``, ``bench`` seeds a throwaway SQLite file at
+``--scale`` first. Otherwise it runs against a database seeded earlier
+by ``bench-seed``.
+
+``--save-baseline FILE`` stores the results as JSON. ``--baseline FILE``
+compares against a stored run. A route whose p95 grew, or whose
+throughput fell, by more than ``--tolerance`` is reported as a
+regression, and the command then exits non-zero. Compare runs made with
+the same scale, mode and thread count on the same machine.
+``benchmarks/baseline-10k-client.json`` is a reference run made with the
+defaults; its ``meta`` records where it came from::
+
+    flask bench --baseline benchmarks/baseline-10k-client.json
+
+Latencies depend on the machine, so re-record it with
+``--save-baseline`` on the machine that does the comparing.
+
+Writes go to fresh rows, so repeated runs don't conflict: new emails,
+appointment slots in weeks nobody has booked yet, and new uploads.
+The SSE stream endpoint is left out, because it is a long-lived
+connection rather than a request. Rate limiting is switched off and
+password hashing runs inline. That makes login cost the bcrypt work
+itself, not queueing for the hashing pool.
+"""
+import http.client
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import re
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+import click
+from sqlalchemy import func, insert, text
+
+BENCH_PASSWORD = 'bench-password'
+SPECIALTIES = ['Family', 'Criminal', 'Tax', 'Corporate', 'Property', 'Labour', 'Immigration', 'Banking']
+LOCATIONS = ['Dhaka', 'Chittagong', 'Khulna', 'Rajshahi', 'Sylhet', 'Barisal', 'Rangpur', 'Mymensingh']
+COURTS = ['Supreme Court', 'High Court', 'District Court', 'Magistrate Court']
+CATEGORIES = ['family', 'criminal', 'property', 'tax', 'labour', 'consumer']
+STATUSES = ['pending'] * 3 + ['confirmed'] * 3 + ['completed'] * 3 + ['cancelled']
+UPLOAD = b'%PDF-1.4 benchmark attachment\n' * 64
+
+# the seeded appointments are in the past; new bookings start no earlier than this
+SEED_START = datetime(2024, 1, 1)
+BOOKING_START = datetime(2031, 1, 6)          # a Monday
+
+_SCALE_RE = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([km]?)\s*$', re.IGNORECASE)
+
+
+def parse_scale(value):
+    """``'10k'`` -> 10000, ``'1m'`` -> 1000000, ``'2500'`` -> 2500."""
+    match = _SCALE_RE.match(str(value))
+    if not match:
+        raise click.BadParameter(f'{value!r} is not a row count like 10k, 100k or 1m')
+    number, unit = match.groups()
+    return int(float(number) * {'': 1, 'k': 1000, 'm': 1000000}[unit.lower()])
+
+
+def plan(scale):
+    """Rows per table for roughly ``scale`` rows in total."""
+    lawyers = max(10, scale // 100)
+    return {
+        'lawyers': lawyers,
+        'clients': max(20, scale // 20),
+        'specialties': lawyers * 2,
+        'windows': lawyers * 5,
+        'appointments': max(40, scale // 5),
+        'messages': max(100, scale // 2),
+        'infohub': max(10, scale // 100),
+    }
+
+
+# --------------------------------------------------------------------------
+# seeding
+# --------------------------------------------------------------------------
+
+def _bulk(db, model, rows, batch=5000):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= batch:
+            db.session.execute(insert(model), chunk)
+            chunk = []
+    if chunk:
+        db.session.execute(insert(model), chunk)
+
+
+def _slot(k, start):
+    """The k-th weekday working hour (09:00-17:00) from ``start``, a Monday."""
+    day, hour = divmod(k, 8)
+    week, weekday = divmod(day, 5)
+    return start + timedelta(days=week * 7 + weekday, hours=9 + hour)
+
+
+def seed(db, scale, rng_seed=0):
+    """Fill the (empty) database; returns the row counts of ``plan(scale)``."""
+    from counters import rebuild_unread_counters
+    from hashing import password_hasher
+    from models import (User, LawyerProfile, Specialty, AvailabilityWindow, Appointment,
+                        Message, InfoHub)
+    from search import search_index
+
+    counts = plan(scale)
+    rng = random.Random(rng_seed)
+    password = password_hasher.hash(BENCH_PASSWORD)
+    n_lawyers, n_clients = counts['lawyers'], counts['clients']
+
+    # users 1..L are lawyers (profile id == user id), L+1..L+C clients
+    _bulk(db, User, ({
+        'id': i, 'f_name': f'Lawyer {i}', 'email': f'lawyer{i}@bench.example',
+        'password': password, 'role': 'Lawyer', 'created_at': SEED_START,
+    } for i in range(1, n_lawyers + 1)))
+    _bulk(db, User, ({
+        'id': n_lawyers + i, 'f_name': f'Client {i}', 'email': f'client{i}@bench.example',
+        'password': password, 'role': 'Client', 'created_at': SEED_START,
+    } for i in range(1, n_clients + 1)))
+    _bulk(db, LawyerProfile, ({
+        'id': i, 'user_id': i, 'experience': rng.randint(1, 30),
+        'location': rng.choice(LOCATIONS), 'court_of_practice': rng.choice(COURTS),
+        'availability_details': 'Weekdays 9-5', 'v_hour': '9-5',
+    } for i in range(1, n_lawyers + 1)))
+    _bulk(db, Specialty, ({
+        'lawyer_id': i, 'name': name,
+    } for i in range(1, n_lawyers + 1) for name in rng.sample(SPECIALTIES, 2)))
+    _bulk(db, AvailabilityWindow, ({
+        'lawyer_id': i, 'weekday': day, 'start_minute': 9 * 60, 'end_minute': 17 * 60, 'slot_minutes': 60,
+    } for i in range(1, n_lawyers + 1) for day in range(5)))
+
+    booked = [0] * (n_lawyers + 1)
+    participants = []
+
+    def appointments():
+        for i in range(1, counts['appointments'] + 1):
+            lawyer = rng.randint(1, n_lawyers)
+            client = n_lawyers + rng.randint(1, n_clients)
+            participants.append((client, lawyer))
+            booked[lawyer] += 1
+            yield {
+                'id': i, 'client_id': client, 'lawyer_id': lawyer,
+                'appointment_date': _slot(booked[lawyer], SEED_START),
+                'duration_minutes': 60, 'status': rng.choice(STATUSES),
+                'problem_description': 'Seeded appointment',
+            }
+    _bulk(db, Appointment, appointments())
+
+    def messages():
+        for i in range(1, counts['messages'] + 1):
+            appt = rng.randint(1, counts['appointments'])
+            client, lawyer = participants[appt - 1]
+            sender, receiver = (client, lawyer) if rng.random() < 0.5 else (lawyer, client)
+            yield {
+                'id': i, 'appointment_id': appt, 'sender_id': sender, 'receiver_id': receiver,
+                'message_text': f'Seeded message {i}', 'timestamp': SEED_START + timedelta(minutes=i),
+                'is_read': rng.random() < 0.7,
+            }
+    _bulk(db, Message, messages())
+    _bulk(db, InfoHub, ({
+        'id': i, 'title': f'Guide {i}', 'content': 'Seeded guide. ' * 20,
+        'category': rng.choice(CATEGORIES), 'date': SEED_START + timedelta(hours=i),
+    } for i in range(1, counts['infohub'] + 1)))
+
+    rebuild_unread_counters()
+    search_index.rebuild()
+    if db.session.get_bind().dialect.name == 'postgresql':
+        # explicit ids leave the serial sequences behind
+        for table in ('users', 'lawyer_profiles', 'appointments', 'messages', 'info_hub'):
+            db.session.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT max(id) FROM {table}))"
+            ))
+    db.session.commit()
+    return counts
+
+
+# --------------------------------------------------------------------------
+# fixture: what the scenarios pick from
+# --------------------------------------------------------------------------
+
+class Fixture:
+    """Ids loaded from the seeded database, plus a token cache."""
+
+    def __init__(self, app, db, sample=20000):
+        from models import User, LawyerProfile, Appointment, Message, InfoHub
+
+        self.app = app
+        self._tokens = {}
+        self._lock = threading.Lock()
+        with app.app_context():
+            self.lawyers = db.session.query(LawyerProfile.id, LawyerProfile.user_id).order_by(LawyerProfile.id).all()
+            if not self.lawyers:
+                raise click.ClickException('the database has no lawyers; run flask bench-seed first')
+            self.profile_of = {user_id: pid for pid, user_id in self.lawyers}
+            self.client_emails = [e for (e,) in db.session.query(User.email)
+                                  .filter(User.role == 'Client', User.email.like('%@bench.example'))
+                                  .limit(sample)]
+            self.appointments = (
+                db.session.query(Appointment.id, Appointment.client_id, LawyerProfile.user_id)
+                .join(LawyerProfile, LawyerProfile.id == Appointment.lawyer_id)
+                .order_by(Appointment.id).limit(sample).all()
+            )
+            self.messages = db.session.query(Message.id, Message.receiver_id).order_by(Message.id).limit(sample).all()
+            self.infohub = db.session.query(InfoHub.id, InfoHub.category).order_by(InfoHub.id).limit(sample).all()
+            latest = db.session.query(func.max(Appointment.appointment_date)).scalar()
+        # new bookings go on the Monday after every existing appointment
+        start = max(BOOKING_START, latest or BOOKING_START)
+        self.booking_start = datetime.combine(start.date() + timedelta(days=7 - start.weekday()), datetime.min.time())
+        self._slots = itertools.count()
+        self._names = itertools.count()
+        self.run_id = f'{int(time.time())}-{os.getpid()}'
+
+    def headers(self, user_id):
+        with self._lock:
+            token = self._tokens.get(user_id)
+        if token is None:
+            from identity import create_token
+            from models import User
+            with self.app.app_context():
+                from extensions import db
+                user = db.session.get(User, user_id)
+                token = create_token(user, lawyer_profile_id=self.profile_of.get(user_id))
+            with self._lock:
+                self._tokens[user_id] = token
+        return {'Authorization': 'Bearer ' + token}
+
+    def unique(self, prefix):
+        return f'{prefix}-{self.run_id}-{next(self._names)}'
+
+    def booking(self, rng):
+        """``(lawyer_profile_id, datetime)`` of a slot no run has booked yet."""
+        n = next(self._slots)
+        lawyer_id, _ = self.lawyers[n % len(self.lawyers)]
+        return lawyer_id, _slot(n // len(self.lawyers), self.booking_start)
+
+
+# --------------------------------------------------------------------------
+# transports
+# --------------------------------------------------------------------------
+
+class ClientTransport:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, url, headers=None, json_body=None, data=None):
+        resp = self.client.open(url, method=method, headers=headers, json=json_body, data=data)
+        body = resp.get_data()
+        resp.close()
+        return resp.status_code, body
+
+
+class HttpTransport:
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.conn = http.client.HTTPConnection(host, port, timeout=60)
+
+    def request(self, method, url, headers=None, json_body=None, data=None):
+        headers = dict(headers or {})
+        if json_body is not None:
+            data = json.dumps(json_body).encode()
+            headers['Content-Type'] = 'application/json'
+        try:
+            self.conn.request(method, url, body=data, headers=headers)
+            resp = self.conn.getresponse()
+        except (http.client.HTTPException, ConnectionError):
+            # the server closed the keep-alive connection; retry once on a new one
+            self.conn.close()
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            self.conn.request(method, url, body=data, headers=headers)
+            resp = self.conn.getresponse()
+        return resp.status, resp.read()
+
+
+# --------------------------------------------------------------------------
+# scenarios
+# --------------------------------------------------------------------------
+
+class Scenario:
+    """One route. ``build(fx, rng, t)`` returns the timed request as a dict
+    (method, url, headers, json/data, expect) and may make untimed setup
+    requests through ``t``."""
+
+    def __init__(self, name, build):
+        self.name = name
+        self.build = build
+
+
+def _json(t, method, url, **kwargs):
+    status, body = t.request(method, url, **kwargs)
+    try:
+        return status, json.loads(body or b'null')
+    except ValueError:
+        return status, None
+
+
+def _pick_appointment(fx, rng):
+    return rng.choice(fx.appointments)
+
+
+def _new_appointment(fx, rng, t):
+    appt_id, client_id, _ = _pick_appointment(fx, rng)
+    lawyer_id, when = fx.booking(rng)
+    status, body = _json(t, 'POST', '/appointments/new', headers=fx.headers(client_id), json_body={
+        'lawyer_id': lawyer_id, 'appointment_date': when.isoformat(), 'problem_description': 'bench'})
+    return client_id, (body or {}).get('appointment_id') if status == 201 else None
+
+
+def _start_upload(fx, rng, t):
+    appt_id, client_id, lawyer_user = _pick_appointment(fx, rng)
+    status, body = _json(t, 'POST', '/messages/uploads', headers=fx.headers(client_id), json_body={
+        'appointment_id': appt_id, 'filename': 'brief.pdf', 'file_type': 'application/pdf', 'size': len(UPLOAD)})
+    return client_id, lawyer_user, (body or {}).get('upload_id')
+
+
+def scenarios(fx):
+    s = []
+
+    def add(name):
+        def register(build):
+            s.append(Scenario(name, build))
+            return build
+        return register
+
+    # auth ---------------------------------------------------------------
+    @add('auth.signup')
+    def _(fx, rng, t):
+        return dict(method='POST', url='/auth/signup', expect=(201,), json_body={
+            'f_name': 'Bench', 'email': fx.unique('signup') + '@bench-run.example',
+            'password': BENCH_PASSWORD, 'role': 'Client'})
+
+    @add('auth.login')
+    def _(fx, rng, t):
+        return dict(method='POST', url='/auth/login', expect=(200,), json_body={
+            'email': rng.choice(fx.client_emails), 'password': BENCH_PASSWORD})
+
+    @add('auth.view_user')
+    def _(fx, rng, t):
+        return dict(method='GET', url=f'/auth/user/{rng.choice(fx.lawyers)[1]}')
+
+    # lawyers ------------------------------------------------------------
+    @add('lawyers.search_lawyers')
+    def _(fx, rng, t):
+        return dict(method='GET', url='/lawyers?limit=20')
+
+    @add('lawyers.search_lawyers[q]')
+    def _(fx, rng, t):
+        return dict(method='GET', url=f'/lawyers?limit=20&q={rng.choice(LOCATIONS)[:4]}'
+                                       f'&specialty={rng.choice(SPECIALTIES)}')
+
+    @add('lawyers.view_profile')
+    def _(fx, rng, t):
+        return dict(method='GET', url=f'/lawyers/{rng.choice(fx.lawyers)[0]}')
+
+    @add('lawyers.view_by_user')
+    def _(fx, rng, t):
+        return dict(method='GET', url=f'/lawyers/by_user/{rng.choice(fx.lawyers)[1]}')
+
+    @add('lawyers.check_profile_exists')
+    def _(fx, rng, t):
+        return dict(method='GET', url=f'/lawyers/profile/exists/{rng.choice(fx.lawyers)[1]}')
+
+    @add('lawyers.view_availability')
+    def _(fx, rng, t):
+        return dict(method='GET', url=f'/lawyers/{rng.choice(fx.lawyers)[0]}/availability')
+
+    @add('lawyers.view_slots')
+    def _(fx, rng, t):
+        return dict(method='GET', url=f'/lawyers/{rng.choice(fx.lawyers)[0]}/slots')
+
+    @add('lawyers.create_profile')
+    def _(fx, rng, t):
+        status, body = _json(t, 'POST', '/auth/signup', json_body={
+            'f_name': 'Bench Lawyer', 'email': fx.unique('lawyer') + '@bench-run.example',
+            'password': BENCH_PASSWORD, 'role': 'Lawyer'})
+        headers = {'Authorization': 'Bearer ' + (body or {}).get('access_token', '')}
+        return dict(method='POST', url='/lawyers/profile', headers=headers, expect=(201,), json_body={
+            'experience': 5, 'location': rng.choice(LOCATIONS), 'court_of_practice': rng.choice(COURTS),
+            'specialties': rng.sample(SPECIALTIES, 2)})
+
+    @add('lawyers.update_profile')
+    def _(fx, rng, t):
+        pid, user_id = rng.choice(fx.lawyers)
+        return dict(method='PUT', url=f'/lawyers/profile/{pid}', headers=fx.headers(user_id),
+                    json_body={'experience': rng.randint(1, 30)})
+
+    @add('lawyers.set_availability')
+    def _(fx, rng, t):
+        _, user_id = rng.choice(fx.lawyers)
+        windows = [{'weekday': d, 'start': '09:00', 'end': '17:00', 'slot_minutes': 60} for d in range(5)]
+        return dict(method='PUT', url='/lawyers/profile/availability', headers=fx.headers(user_id),
+                    json_body={'windows': windows})
+
+    # appointments -------------------------------------------------------
+    @add('appointments.create_appointment')
+    def _(fx, rng, t):
+        _, client_id, _ = _pick_appointment(fx, rng)
+        lawyer_id, when = fx.booking(rng)
+        return dict(method='POST', url='/appointments/new', headers=fx.headers(client_id), expect=(201,),
+                    json_body={'lawyer_id': lawyer_id, 'appointment_date': when.isoformat()})
+
+    @add('appointments.list_client_appointments')
+    def _(fx, rng, t):
+        return dict(method='GET', url='/appointments?limit=20', headers=fx.headers(_pick_appointment(fx, rng)[1]))
+
+    @add('appointments.list_lawyer_appointments')
+    def _(fx, rng, t):
+        return dict(method='GET', url='/appointments/lawyer?limit=20',
+                    headers=fx.headers(_pick_appointment(fx, rng)[2]))
+
+    @add('appointments.lawyer_summary')
+    def _(fx, rng, t):
+        return dict(method='GET', url='/appointments/lawyer/summary',
+                    headers=fx.headers(_pick_appointment(fx, rng)[2]))
+
+    @add('appointments.export_appointments')
+    def _(fx, rng, t):
+        return dict(method='GET', url='/appointments/export?format=csv',
+                    headers=fx.headers(_pick_appointment(fx, rng)[2]))
+
+    @add('appointments.get_appointment')
+    def _(fx, rng, t):
+        appt_id, client_id, _ = _pick_appointment(fx, rng)
+        return dict(method='GET', url=f'/appointments/{appt_id}', headers=fx.headers(client_id))
+
+    @add('appointments.update_appointment')
+    def _(fx, rng, t):
+        appt_id, _, lawyer_user = _pick_appointment(fx, rng)
+        return dict(method='PUT', url=f'/appointments/{appt_id}', headers=fx.headers(lawyer_user),
+                    json_body={'notes': 'Reviewed'})
+
+    @add('appointments.update_appointment_status_bulk')
+    def _(fx, rng, t):
+        appt_id, _, lawyer_user = _pick_appointment(fx, rng)
+        return dict(method='POST', url='/appointments/lawyer/status', headers=fx.headers(lawyer_user),
+                    json_body={'status': 'confirmed', 'ids': [appt_id]})
+
+    @add('appointments.cancel_appointment')
+    def _(fx, rng, t):
+        client_id, appt_id = _new_appointment(fx, rng, t)
+        return dict(method='POST', url=f'/appointments/{appt_id}/cancel', headers=fx.headers(client_id))
+
+    # messages -----------------------------------------------------------
+    @add('messages.send_message')
+    def _(fx, rng, t):
+        appt_id, client_id, lawyer_user = _pick_appointment(fx, rng)
+        return dict(method='POST', url='/messages/send', headers=fx.headers(client_id), expect=(201,),
+                    json_body={'appointment_id': appt_id, 'receiver_id': lawyer_user, 'message_text': 'Hello'})
+
+    @add('messages.send_messages_batch')
+    def _(fx, rng, t):
+        appt_id, client_id, lawyer_user = _pick_appointment(fx, rng)
+        items = [{'appointment_id': appt_id, 'receiver_id': lawyer_user, 'message_text': f'Part {i}'}
+                 for i in range(5)]
+        return dict(method='POST', url='/messages/send/batch', headers=fx.headers(client_id), expect=(201,),
+                    json_body={'messages': items})
+
+    @add('messages.list_messages')
+    def _(fx, rng, t):
+        appt_id, client_id, _ = _pick_appointment(fx, rng)
+        return dict(method='GET', url=f'/messages/appointment/{appt_id}?limit=20', headers=fx.headers(client_id))
+
+    @add('messages.export_messages')
+    def _(fx, rng, t):
+        appt_id, client_id, _ = _pick_appointment(fx, rng)
+        return dict(method='GET', url=f'/messages/appointment/{appt_id}/export?format=ndjson',
+                    headers=fx.headers(client_id))
+
+    @add('messages.mark_read')
+    def _(fx, rng, t):
+        message_id, receiver = rng.choice(fx.messages)
+        return dict(method='POST', url=f'/messages/{message_id}/read', headers=fx.headers(receiver))
+
+    @add('messages.mark_read_bulk')
+    def _(fx, rng, t):
+        message_id, receiver = rng.choice(fx.messages)
+        return dict(method='POST', url='/messages/read', headers=fx.headers(receiver),
+                    json_body={'ids': [message_id]})
+
+    @add('messages.sync_threads')
+    def _(fx, rng, t):
+        return dict(method='POST', url='/messages/sync?limit=50', headers=fx.headers(_pick_appointment(fx, rng)[1]),
+                    json_body={'threads': {}})
+
+    @add('messages.unread')
+    def _(fx, rng, t):
+        return dict(method='GET', url='/messages/unread', headers=fx.headers(_pick_appointment(fx, rng)[2]))
+
+    @add('messages.start_file_upload')
+    def _(fx, rng, t):
+        appt_id, client_id, _ = _pick_appointment(fx, rng)
+        return dict(method='POST', url='/messages/uploads', headers=fx.headers(client_id), expect=(201,),
+                    json_body={'appointment_id': appt_id, 'filename': 'brief.pdf', 'size': len(UPLOAD)})
+
+    @add('messages.upload_file_chunk')
+    def _(fx, rng, t):
+        client_id, _, upload_id = _start_upload(fx, rng, t)
+        return dict(method='PUT', url=f'/messages/uploads/{upload_id}', data=UPLOAD,
+                    headers={**fx.headers(client_id), 'Upload-Offset': '0'})
+
+    @add('messages.file_upload_status')
+    def _(fx, rng, t):
+        client_id, _, upload_id = _start_upload(fx, rng, t)
+        return dict(method='GET', url=f'/messages/uploads/{upload_id}', headers=fx.headers(client_id))
+
+    @add('messages.complete_file_upload')
+    def _(fx, rng, t):
+        client_id, lawyer_user, upload_id = _start_upload(fx, rng, t)
+        t.request('PUT', f'/messages/uploads/{upload_id}', data=UPLOAD,
+                  headers={**fx.headers(client_id), 'Upload-Offset': '0'})
+        return dict(method='POST', url=f'/messages/uploads/{upload_id}/complete', headers=fx.headers(client_id),
+                    expect=(201,), json_body={'receiver_id': lawyer_user})
+
+    @add('messages.download_file')
+    def _(fx, rng, t):
+        if getattr(fx, 'attachment', None) is None:
+            # one shared attachment, uploaded on first use
+            client_id, lawyer_user, upload_id = _start_upload(fx, rng, t)
+            t.request('PUT', f'/messages/uploads/{upload_id}', data=UPLOAD,
+                      headers={**fx.headers(client_id), 'Upload-Offset': '0'})
+            _, body = _json(t, 'POST', f'/messages/uploads/{upload_id}/complete', headers=fx.headers(client_id),
+                            json_body={'receiver_id': lawyer_user})
+            fx.attachment = ((body or {}).get('file_path'), client_id)
+        file_path, client_id = fx.attachment
+        return dict(method='GET', url=f'/messages/file/{file_path}', headers=fx.headers(client_id))
+
+    # infohub ------------------------------------------------------------
+    @add('infohub.get_titles')
+    def _(fx, rng, t):
+        return dict(method='GET', url='/infohub/titles?limit=20')
+
+    @add('infohub.get_all')
+    def _(fx, rng, t):
+        return dict(method='GET', url='/infohub/?limit=20')
+
+    @add('infohub.get_titles_by_category')
+    def _(fx, rng, t):
+        return dict(method='GET', url=f'/infohub/titles/{rng.choice(CATEGORIES)}?limit=20')
+
+    @add('infohub.get_content_by_id')
+    def _(fx, rng, t):
+        return dict(method='GET', url=f'/infohub/contents/{rng.choice(fx.infohub)[0]}')
+
+    @add('infohub.create_info')
+    def _(fx, rng, t):
+        return dict(method='POST', url='/infohub/', expect=(201,), json_body={
+            'title': fx.unique('Bench guide'), 'content': 'Benchmark entry.', 'category': rng.choice(CATEGORIES)})
+
+    return s
+
+
+# --------------------------------------------------------------------------
+# running and reporting
+# --------------------------------------------------------------------------
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(q * len(sorted_values)) - 1)]
+
+
+def run_scenario(scenario, fx, transports, requests, warmup, rng_seed):
+    """Send ``requests`` timed requests over one thread per transport."""
+    tickets = itertools.count()
+    results = [[] for _ in transports]       # per thread: (seconds, ok)
+
+    def worker(index):
+        rng = random.Random(f'{rng_seed}:{scenario.name}:{index}')
+        t = transports[index]
+        for _ in range(warmup if index == 0 else 0):
+            req = scenario.build(fx, rng, t)
+            t.request(req['method'], req['url'], headers=req.get('headers'),
+                      json_body=req.get('json_body'), data=req.get('data'))
+        barrier.wait()
+        while next(tickets) < requests:
+            req = scenario.build(fx, rng, t)
+            started = time.perf_counter()
+            status, _ = t.request(req['method'], req['url'], headers=req.get('headers'),
+                                  json_body=req.get('json_body'), data=req.get('data'))
+            results[index].append((time.perf_counter() - started, status in req.get('expect', (200,))))
+
+    barrier = threading.Barrier(len(transports) + 1)
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(transports))]
+    for th in threads:
+        th.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for th in threads:
+        th.join()
+    wall = time.perf_counter() - started
+
+    samples = sorted(seconds for per_thread in results for seconds, _ in per_thread)
+    errors = sum(1 for per_thread in results for _, ok in per_thread if not ok)
+    return {
+        'requests': len(samples),
+        'errors': errors,
+        'rps': round(len(samples) / wall, 2) if wall else 0.0,
+        'p50_ms': round(percentile(samples, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(samples, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(samples, 0.99) * 1000, 3),
+    }
+
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    """Lines describing routes that got slower than ``baseline``."""
+    regressions = []
+    for name, new in results.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+        if new['p95_ms'] > old['p95_ms'] * (1 + tolerance) and new['p95_ms'] - old['p95_ms'] >= min_delta_ms:
+            regressions.append(f"{name}: p95 {old['p95_ms']:.2f} -> {new['p95_ms']:.2f} ms")
+        if old['rps'] and new['rps'] < old['rps'] / (1 + tolerance):
+            regressions.append(f"{name}: throughput {old['rps']:.1f} -> {new['rps']:.1f} req/s")
+    return regressions
+
+
+def _bench_app(database_url, cache, upload_folder):
+    from app import create_app
+    from config import Config
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = database_url
+        RATELIMIT_BACKEND = 'null'
+        HASH_POOL_BACKEND = 'inline'
+        HASH_POOL_MAX_PENDING = 1024
+        QUERY_BUDGET_ENFORCE = False
+        SLOW_QUERY_MS = 0
+        CACHE_BACKEND = Config.CACHE_BACKEND if cache else 'null'
+        UPLOAD_FOLDER = upload_folder
+        DOWNLOAD_OFFLOAD = ''
+
+    return create_app(BenchConfig)
+
+
+def _seed_database(app, scale, rng_seed):
+    from extensions import db
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        return seed(db, scale, rng_seed)
+
+
+@click.command('bench-seed')
+@click.option('--scale', default='10k', show_default=True, help='Total rows, e.g. 10k, 100k, 1m.')
+@click.option('--database-url', required=True, help='Scratch database to fill (its tables are dropped).')
+@click.option('--seed', 'rng_seed', default=0, show_default=True, help='Random seed for the generated data.')
+def bench_seed_command(scale, database_url, rng_seed):
+    """Fill a scratch database with synthetic data for flask bench."""
+    started = time.perf_counter()
+    app = _bench_app(database_url, True, tempfile.gettempdir())
+    counts = _seed_database(app, parse_scale(scale), rng_seed)
+    click.echo(', '.join(f'{k}: {v}' for k, v in counts.items()))
+    click.echo(f'seeded in {time.perf_counter() - started:.1f}s')
+
+
+@click.command('bench')
+@click.option('--scale', default='10k', show_default=True, help='Rows to seed when no --database-url is given.')
+@click.option('--database-url', default=None, help='Database seeded by bench-seed (default: a fresh temporary SQLite file).')
+@click.option('--mode', type=click.Choice(['client', 'http']), default='client', show_default=True)
+@click.option('--threads', default=4, show_default=True, help='Concurrent clients.')
+@click.option('--requests', 'requests_per_route', default=200, show_default=True, help='Timed requests per route.')
+@click.option('--warmup', default=10, show_default=True, help='Untimed requests per route before timing.')
+@click.option('--only', default=None, help='Only routes whose name contains this text.')
+@click.option('--cache/--no-cache', default=True, show_default=True, help='Keep the response cache on.')
+@click.option('--seed', 'rng_seed', default=0, show_default=True)
+@click.option('--baseline', type=click.Path(), default=None, help='Compare with a stored run.')
+@click.option('--save-baseline', type=click.Path(), default=None, help='Store this run as JSON.')
+@click.option('--tolerance', default=0.25, show_default=True, help='Allowed p95 / throughput change vs baseline.')
+@click.option('--min-delta-ms', default=1.0, show_default=True, help='Ignore p95 changes smaller than this.')
+def bench_command(scale, database_url, mode, threads, requests_per_route, warmup, only, cache, rng_seed,
+                  baseline, save_baseline, tolerance, min_delta_ms):
+    """Drive every API route and report p50/p95/p99 latency and throughput."""
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    server = None
+    try:
+        seeded = database_url is None
+        if seeded:
+            database_url = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+        app = _bench_app(database_url, cache, os.path.join(workdir, 'uploads'))
+        if seeded:
+            started = time.perf_counter()
+            _seed_database(app, parse_scale(scale), rng_seed)
+            click.echo(f'seeded {scale} rows in {time.perf_counter() - started:.1f}s', err=True)
+
+        from extensions import db
+        fx = Fixture(app, db)
+
+        if mode == 'http':
+            from werkzeug.serving import WSGIRequestHandler, make_server
+
+            class QuietHandler(WSGIRequestHandler):
+                def log_request(self, *args, **kwargs):
+                    pass
+
+            server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            transports = [HttpTransport('127.0.0.1', server.server_port) for _ in range(threads)]
+        else:
+            transports = [ClientTransport(app) for _ in range(threads)]
+
+        results = {}
+        click.echo(f"{'route':<46} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+        for scenario in scenarios(fx):
+            if only and only not in scenario.name:
+                continue
+            r = run_scenario(scenario, fx, transports, requests_per_route, warmup, rng_seed)
+            results[scenario.name] = r
+            click.echo(f"{scenario.name:<46} {r['rps']:>9.1f} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} "
+                       f"{r['p99_ms']:>9.2f} {r['errors']:>7}")
+
+        with app.app_context():
+            dialect = db.engine.dialect.name
+        meta = {
+            'scale': scale if seeded else None, 'database': dialect, 'mode': mode, 'threads': threads,
+            'requests_per_route': requests_per_route, 'cache': cache,
+            'python': platform.python_version(), 'machine': platform.machine(),
+            'created': datetime.utcnow().isoformat(timespec='seconds'),
+        }
+
+        ok = all(r['errors'] == 0 for r in results.values())
+        if not ok:
+            click.echo('some requests got an unexpected status (see errors column)', err=True)
+        if baseline:
+            with open(baseline) as f:
+                stored = json.load(f)
+            different = [k for k in ('scale', 'database', 'mode', 'threads')
+                         if stored.get('meta', {}).get(k) != meta[k]]
+            if different:
+                click.echo(f"warning: baseline differs in {', '.join(different)}; comparison is rough", err=True)
+            regressions = compare(results, stored.get('results', {}), tolerance, min_delta_ms)
+            for line in regressions:
+                click.echo(f'REGRESSION {line}', err=True)
+            ok = ok and not regressions
+            if not regressions:
+                click.echo(f'no regressions against {baseline}')
+        if save_baseline:
+            with open(save_baseline, 'w') as f:
+                json.dump({'meta': meta, 'results': results}, f, indent=2, sort_keys=True)
+                f.write('\n')
+            click.echo(f'baseline written to {save_baseline}')
+        if not ok:
+            raise SystemExit(1)
+    finally:
+        if server is not None:
+            server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
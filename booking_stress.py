@@ -0,0 +1,135 @@
+"""Concurrency check for appointment booking.
+
+``flask stress-booking`` builds a throwaway SQLite file database (or uses
+``--database-url``, e.g. a scratch PostgreSQL), seeds one lawyer and N
+clients, and then hammers a single slot from N threads at once:
+
+1. through ``POST /appointments/new``, so the per-lawyer lock and the
+   overlap check are exercised;
+2. with bare INSERTs that skip the application check, so only the partial
+   unique index stands between the threads.
+
+Each round must end with exactly one booking. The command exits non-zero
+otherwise.
+"""
+import os
+import shutil
+import tempfile
+import threading
+from datetime import datetime
+
+import click
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+SLOT = datetime(2030, 1, 7, 10, 0)       # a Monday
+
+
+def _seed(db, clients):
+    from models import User, LawyerProfile
+    lawyer = User(f_name='Lawyer', email='lawyer@example.com', password='x', role='Lawyer')
+    db.session.add(lawyer)
+    db.session.flush()
+    profile = LawyerProfile(user_id=lawyer.id)
+    users = [User(f_name=f'Client {i}', email=f'client{i}@example.com', password='x', role='Client')
+             for i in range(clients)]
+    db.session.add(profile)
+    db.session.add_all(users)
+    db.session.commit()
+    return profile.id, users
+
+
+def _race(n, attempt):
+    """Start ``attempt(i)`` on ``n`` threads at the same moment; return their results."""
+    barrier = threading.Barrier(n)
+    results = [None] * n
+
+    def run(i):
+        barrier.wait()
+        try:
+            results[i] = attempt(i)
+        except Exception as e:           # reported, not raised, so every thread finishes
+            results[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def stress_booking(threads, database_url=None):
+    """Return ``[(round, winners, results), ...]``."""
+    from app import create_app
+    from config import Config
+    from extensions import db
+    from identity import create_token
+    from models import Appointment
+
+    workdir = None
+    if database_url is None:
+        workdir = tempfile.mkdtemp(prefix='stress-booking-')
+        database_url = 'sqlite:///' + os.path.join(workdir, 'stress.db')
+
+    class StressConfig(Config):
+        SQLALCHEMY_DATABASE_URI = database_url
+        SQLITE_BUSY_TIMEOUT_MS = 30000
+        TESTING = True
+        CACHE_BACKEND = 'null'
+        RATELIMIT_BACKEND = 'null'
+
+    app = create_app(StressConfig)
+    report = []
+    try:
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            lawyer_id, clients = _seed(db, threads)
+            tokens = [create_token(u) for u in clients]
+            client_ids = [u.id for u in clients]
+
+        def book_via_api(i):
+            resp = app.test_client().post('/appointments/new', json={
+                'lawyer_id': lawyer_id, 'appointment_date': SLOT.isoformat()
+            }, headers={'Authorization': 'Bearer ' + tokens[i]})
+            return resp.status_code
+
+        results = _race(threads, book_via_api)
+        report.append(('api', results.count(201), results))
+
+        def book_via_insert(i):
+            with app.app_context():
+                db.session.add(Appointment(client_id=client_ids[i], lawyer_id=lawyer_id,
+                                           appointment_date=SLOT.replace(hour=15), status='pending'))
+                try:
+                    db.session.commit()
+                    return 'inserted'
+                except (IntegrityError, OperationalError) as e:
+                    db.session.rollback()
+                    return type(e).__name__
+
+        results = _race(threads, book_via_insert)
+        report.append(('insert', results.count('inserted'), results))
+
+        with app.app_context():
+            db.drop_all()
+    finally:
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+
+@click.command('stress-booking')
+@click.option('--threads', default=32, show_default=True, help='Concurrent bookings per round.')
+@click.option('--database-url', default=None, help='Scratch database to use (its tables are dropped).')
+def stress_booking_command(threads, database_url):
+    """Book one slot from many threads at once; exactly one must win."""
+    ok = True
+    for name, winners, results in stress_booking(threads, database_url):
+        results = [str(r) for r in results]
+        summary = ', '.join(f'{r}: {results.count(r)}' for r in sorted(set(results)))
+        click.echo(f'{name}: {winners} winner(s) of {threads} ({summary})')
+        ok = ok and winners == 1
+    if not ok:
+        raise SystemExit(1)
+    click.echo('booking stress OK')
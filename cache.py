@@ -0,0 +1,247 @@
+"""Server-side response cache for read-heavy public endpoints.
+
+Views opt in with ``@response_cache.cached(tags=...)``. A cached entry is
+the serialized response (body, status, mimetype) keyed by the request
+path and query string plus the current version of each of the view's
+tags. Writers call ``response_cache.invalidate(tag, ...)``, which bumps
+those versions so every dependent key misses from then on; stale entries
+simply age out of the backend.
+
+Backends (``CACHE_BACKEND``):
+
+* ``'memory'`` - per-process LRU bounded by ``CACHE_MAX_ENTRIES`` with a
+  TTL (the default). Tag versions are per process too, so another
+  worker's invalidation only reaches this one through the TTL;
+* ``'redis'`` - shared across workers, built from ``CACHE_REDIS_URL``.
+  ``RedisBackend`` accepts any client exposing ``get``, ``set(ex=)``,
+  ``delete`` and ``incr``, so a local fake can stand in for a server;
+* ``'null'`` - caching disabled.
+"""
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, g, make_response, request
+
+
+class LRUBackend:
+    """Thread-safe in-process LRU with per-entry expiry.
+
+    Tag versions live in a separate dict that is never evicted, so
+    evicting an entry can't make an old version number current again.
+    """
+
+    shared = False          # versions are only seen by this process
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        # versions restart at 0 with the process; the epoch keeps version
+        # numbers from before a restart from being mistaken for current ones
+        self.epoch = uuid.uuid4().hex[:8]
+        self._entries = OrderedDict()        # key -> (expires_at, value)
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def version(self, tag):
+        return self._versions.get(tag, 0)
+
+    def bump(self, tag):
+        with self._lock:
+            self._versions[tag] = self._versions.get(tag, 0) + 1
+            return self._versions[tag]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisBackend:
+    """Backend on a Redis (or Redis-compatible) client."""
+
+    epoch = ''
+    shared = True
+
+    def __init__(self, client, prefix='legal_sheba:cache:'):
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("CACHE_BACKEND='redis' requires the 'redis' package")
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, json.dumps(value), ex=ttl)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def version(self, tag):
+        raw = self.client.get(self.prefix + 'v:' + tag)
+        return int(raw) if raw is not None else 0
+
+    def bump(self, tag):
+        return int(self.client.incr(self.prefix + 'v:' + tag))
+
+
+class NullBackend(LRUBackend):
+    """Stores nothing, but still tracks tag versions for conditional GETs."""
+
+    def __init__(self):
+        super().__init__(max_entries=0)
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl):
+        pass
+
+
+class ResponseCache:
+    def __init__(self, app=None):
+        self.backend = NullBackend()
+        self.default_ttl = 60
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CACHE_BACKEND', 'memory')
+        app.config.setdefault('CACHE_MAX_ENTRIES', 1024)
+        app.config.setdefault('CACHE_DEFAULT_TTL', 60)
+        app.config.setdefault('CACHE_REDIS_URL', None)
+
+        kind = app.config['CACHE_BACKEND']
+        if kind == 'memory':
+            self.backend = LRUBackend(app.config['CACHE_MAX_ENTRIES'])
+        elif kind == 'redis':
+            self.backend = RedisBackend.from_url(app.config['CACHE_REDIS_URL'])
+        elif kind == 'null':
+            self.backend = NullBackend()
+        else:
+            raise ValueError(f'unknown CACHE_BACKEND {kind!r}')
+        self.default_ttl = app.config['CACHE_DEFAULT_TTL']
+        app.extensions['response_cache'] = self
+
+    def _count(self, hit):
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        with self._stats_lock:          # hits and misses from the same moment
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': (hits / total) if total else 0.0,
+        }
+
+    def version(self, tag):
+        return self.backend.version(tag)
+
+    @property
+    def shares_versions(self):
+        """True when every worker sees the same tag versions (the Redis backend)."""
+        return self.backend.shared
+
+    def version_token(self, tags):
+        """A string that changes whenever any of ``tags`` is invalidated."""
+        return ','.join([self.backend.epoch] + [f'{t}@{self.backend.version(t)}' for t in tags])
+
+    def invalidate(self, *tags):
+        """Make every cached response depending on any of ``tags`` stale."""
+        for tag in tags:
+            self.backend.bump(tag)
+
+    def get_or_set(self, key, compute, ttl=None):
+        """Return the cached value for ``key``, computing and storing it on a miss.
+
+        For per-user data that can't go through ``cached`` (whose key is only
+        the URL); the value must be JSON serializable.
+        """
+        value = self.backend.get('val:' + key)
+        self._count(value is not None)
+        if value is None:
+            value = compute()
+            self.backend.set('val:' + key, value, ttl or self.default_ttl)
+        return value
+
+    def cached(self, tags=(), ttl=None):
+        """Cache successful GET responses of the decorated view.
+
+        ``tags`` are format strings expanded with the view's URL arguments,
+        e.g. ``'infohub:category:{category}'``.
+        """
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                if request.method != 'GET':
+                    return fn(*args, **kwargs)
+
+                expanded = [t.format(**kwargs) for t in tags]
+                key = f'resp:{request.full_path}|{self.version_token(expanded)}'
+
+                entry = self.backend.get(key)
+                if entry is not None:
+                    self._count(True)
+                    resp = current_app.response_class(
+                        entry['body'], status=entry['status'], mimetype=entry['mimetype']
+                    )
+                    resp.headers['X-Cache'] = 'HIT'
+                    return resp
+
+                self._count(False)
+                resp = make_response(fn(*args, **kwargs))
+                # a lagging replica's body must not be stored under the current
+                # tag versions (flag set by replicas.replica_reads)
+                if resp.status_code == 200 and not resp.is_streamed and not g.get('_db_replica_served'):
+                    self.backend.set(key, {
+                        'body': resp.get_data(as_text=True),
+                        'status': resp.status_code,
+                        'mimetype': resp.mimetype,
+                    }, ttl or self.default_ttl)
+                resp.headers['X-Cache'] = 'MISS'
+                return resp
+            return wrapper
+        return decorator
+
+
+response_cache = ResponseCache()
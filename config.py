@@ -2,6 +2,117 @@ import os
 
 class Config:
     SECRET_KEY = os.environ.get("SECRET_KEY", "supersecretkey")
-    SQLALCHEMY_DATABASE_URI = "sqlite:///legal_sheba.db"
+    SQLALCHEMY_DATABASE_URI = os.environ.get("DATABASE_URL", "sqlite:///legal_sheba.db")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    JWT_SECRET_KEY = os.environ.get("JWT_SECRET_KEY", "jwtsecretkey")
\ No newline at end of file
+    JWT_SECRET_KEY = os.environ.get("JWT_SECRET_KEY", "jwtsecretkey")
+
+    # connection pool for server databases (PostgreSQL); ignored for SQLite
+    DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 10))
+    DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 20))
+    DB_POOL_TIMEOUT = int(os.environ.get("DB_POOL_TIMEOUT", 30))
+    DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+    DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "1") not in ("0", "false", "False", "")
+
+    # read replica for the public directory GETs (empty = primary only); a
+    # client that just wrote reads from the primary for the sticky period,
+    # which should exceed replication lag. The redis URL shares those pins
+    # between workers
+    DATABASE_REPLICA_URL = os.environ.get("DATABASE_REPLICA_URL", "")
+    DATABASE_REPLICA_STICKY_SECONDS = int(os.environ.get("DATABASE_REPLICA_STICKY_SECONDS", 5))
+    DATABASE_REPLICA_STICKY_REDIS_URL = os.environ.get("DATABASE_REPLICA_STICKY_REDIS_URL")
+
+    # SQL instrumentation: Server-Timing header (unset = only under DEBUG or
+    # TESTING, since it shows clients DB time and query counts), slow-query
+    # log threshold (0 = off), and the per-request query budget /
+    # repeated-SELECT limit that fail a request when enforced (unset = only
+    # under TESTING)
+    SERVER_TIMING = {"1": True, "0": False}.get(os.environ.get("SERVER_TIMING", ""))
+    SLOW_QUERY_MS = int(os.environ.get("SLOW_QUERY_MS", 200))
+    QUERY_BUDGET = int(os.environ.get("QUERY_BUDGET", 30))
+    QUERY_REPEAT_LIMIT = int(os.environ.get("QUERY_REPEAT_LIMIT", 5))
+    QUERY_BUDGET_ENFORCE = {"1": True, "0": False}.get(os.environ.get("QUERY_BUDGET_ENFORCE", ""))
+
+    # Prometheus endpoint; scrapers must send "Authorization: Bearer <token>".
+    # Without a token it only answers under DEBUG/TESTING. Counters are per
+    # worker process
+    METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") not in ("0", "false", "False", "")
+    METRICS_PATH = os.environ.get("METRICS_PATH", "/metrics")
+    METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
+    # pragmas run on every new SQLite connection; an empty journal mode or
+    # synchronous value leaves SQLite's default, mmap size 0 turns it off
+    SQLITE_JOURNAL_MODE = os.environ.get("SQLITE_JOURNAL_MODE", "wal")
+    SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "normal")
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", 5000))
+    SQLITE_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+
+    # list endpoints: page size used when ?limit= is absent, and its upper bound
+    PAGINATION_DEFAULT_LIMIT = int(os.environ.get("PAGINATION_DEFAULT_LIMIT", 50))
+    PAGINATION_MAX_LIMIT = int(os.environ.get("PAGINATION_MAX_LIMIT", 200))
+
+    # response cache for read-heavy public endpoints: 'memory' (per-process
+    # LRU), 'redis' (shared across workers) or 'null'. Only 'redis' shares
+    # tag versions, so only it lets InfoHub ETags skip the view entirely
+    CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "memory")
+    CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", 1024))
+    CACHE_DEFAULT_TTL = int(os.environ.get("CACHE_DEFAULT_TTL", 60))
+    CACHE_REDIS_URL = os.environ.get("CACHE_REDIS_URL")
+
+    # real-time message delivery: 'memory' (single process) or 'redis'
+    # (fan-out across workers)
+    PUBSUB_BACKEND = os.environ.get("PUBSUB_BACKEND", "memory")
+    PUBSUB_REDIS_URL = os.environ.get("PUBSUB_REDIS_URL")
+    SSE_HEARTBEAT_SECONDS = int(os.environ.get("SSE_HEARTBEAT_SECONDS", 15))
+    SSE_REPLAY_LIMIT = int(os.environ.get("SSE_REPLAY_LIMIT", 200))
+
+    # upper bound on messages sent or marked read by one batch request
+    MESSAGE_BATCH_MAX = int(os.environ.get("MESSAGE_BATCH_MAX", 100))
+
+    # message attachments: storage root, per-read buffer for streamed
+    # chunks, the largest accepted file, and how long an unfinished upload
+    # may sit without new bytes before it is deleted
+    UPLOAD_FOLDER = os.environ.get("UPLOAD_FOLDER", os.path.join(os.getcwd(), "uploads"))
+    UPLOAD_BUFFER_SIZE = int(os.environ.get("UPLOAD_BUFFER_SIZE", 64 * 1024))
+    UPLOAD_MAX_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", 512 * 1024 * 1024))
+    UPLOAD_EXPIRE_SECONDS = int(os.environ.get("UPLOAD_EXPIRE_SECONDS", 24 * 3600))
+
+    # attachment downloads: '' serves them from Python, 'x-accel-redirect'
+    # (nginx, via an internal location at DOWNLOAD_ACCEL_PREFIX) or
+    # 'x-sendfile' (Apache/lighttpd) hands the transfer to the proxy
+    DOWNLOAD_OFFLOAD = os.environ.get("DOWNLOAD_OFFLOAD", "")
+    DOWNLOAD_ACCEL_PREFIX = os.environ.get("DOWNLOAD_ACCEL_PREFIX", "/protected-uploads")
+    DOWNLOAD_MAX_AGE = int(os.environ.get("DOWNLOAD_MAX_AGE", 365 * 24 * 3600))
+
+    # password hashing: bcrypt cost for new hashes (older ones are upgraded
+    # on login) and the bounded pool that runs it off the request thread
+    BCRYPT_LOG_ROUNDS = int(os.environ.get("BCRYPT_LOG_ROUNDS", 12))
+    HASH_POOL_BACKEND = os.environ.get("HASH_POOL_BACKEND", "process")
+    HASH_POOL_WORKERS = int(os.environ.get("HASH_POOL_WORKERS", min(4, os.cpu_count() or 1)))
+    HASH_POOL_MAX_PENDING = int(os.environ.get("HASH_POOL_MAX_PENDING", 0)) or None
+    HASH_POOL_TIMEOUT = float(os.environ.get("HASH_POOL_TIMEOUT", 10))
+
+    # token-bucket limits as "count/period" (e.g. "5/minute", "100/10 minutes");
+    # an empty value turns that limit off
+    RATELIMIT_BACKEND = os.environ.get("RATELIMIT_BACKEND", "memory")
+    RATELIMIT_REDIS_URL = os.environ.get("RATELIMIT_REDIS_URL")
+    RATELIMIT_MAX_KEYS = int(os.environ.get("RATELIMIT_MAX_KEYS", 10000))
+    LOGIN_RATE_LIMIT_IP = os.environ.get("LOGIN_RATE_LIMIT_IP", "30/minute")
+    LOGIN_RATE_LIMIT_EMAIL = os.environ.get("LOGIN_RATE_LIMIT_EMAIL", "5/minute")
+    SEARCH_RATE_LIMIT = os.environ.get("SEARCH_RATE_LIMIT", "120/minute")
+
+    # appointments: default and longest length in minutes, and how many
+    # days of free slots /lawyers/<id>/slots returns by default / at most
+    APPOINTMENT_DEFAULT_MINUTES = int(os.environ.get("APPOINTMENT_DEFAULT_MINUTES", 60))
+    APPOINTMENT_MAX_MINUTES = int(os.environ.get("APPOINTMENT_MAX_MINUTES", 240))
+    SLOTS_DEFAULT_DAYS = int(os.environ.get("SLOTS_DEFAULT_DAYS", 14))
+    SLOTS_MAX_DAYS = int(os.environ.get("SLOTS_MAX_DAYS", 31))
+
+    # upper bound on appointments changed by one bulk status request
+    APPOINTMENT_BATCH_MAX = int(os.environ.get("APPOINTMENT_BATCH_MAX", 200))
+
+    # seconds a lawyer's dashboard summary may be served from cache (0 = off)
+    SUMMARY_CACHE_TTL = int(os.environ.get("SUMMARY_CACHE_TTL", 15))
+
+    # streamed exports: rows fetched per round trip, bytes per flushed chunk
+    EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", 1000))
+    EXPORT_CHUNK_BYTES = int(os.environ.get("EXPORT_CHUNK_BYTES", 64 * 1024))
@@ -0,0 +1,87 @@
+"""Maintained unread-message counters (the ``unread_counters`` table).
+
+Counts are adjusted inside the same transaction as the message write that
+changes them, so reading a user's inbox badge is a primary-key range read
+over their threads instead of a COUNT over ``messages``.
+"""
+import click
+from sqlalchemy import case, false, func, or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from extensions import db
+from models import Message, UnreadCounter
+
+_UPSERT_INSERTS = {
+    'sqlite': sqlite.insert,
+    'postgresql': postgresql.insert,
+}
+
+
+def increment_unread(user_id, appointment_id, n=1):
+    """Add ``n`` to the receiver's unread count for one thread (creating the row)."""
+    insert = _UPSERT_INSERTS.get(db.session.get_bind().dialect.name)
+    if insert is not None:
+        stmt = insert(UnreadCounter).values(user_id=user_id, appointment_id=appointment_id, count=n)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[UnreadCounter.user_id, UnreadCounter.appointment_id],
+            set_={'count': UnreadCounter.count + n},
+        )
+        db.session.execute(stmt)
+        return
+
+    updated = UnreadCounter.query.filter_by(user_id=user_id, appointment_id=appointment_id).update(
+        {UnreadCounter.count: UnreadCounter.count + n}, synchronize_session=False
+    )
+    if not updated:
+        db.session.add(UnreadCounter(user_id=user_id, appointment_id=appointment_id, count=n))
+        db.session.flush()
+
+
+def decrement_unread(user_id, appointment_id, n=1):
+    """Subtract ``n`` from one thread's unread count, never going below zero."""
+    UnreadCounter.query.filter_by(user_id=user_id, appointment_id=appointment_id).update(
+        {UnreadCounter.count: case((UnreadCounter.count > n, UnreadCounter.count - n), else_=0)},
+        synchronize_session=False,
+    )
+
+
+def unread_counts(user_id):
+    """``{appointment_id: count}`` for the user's threads with unread messages."""
+    rows = (
+        db.session.query(UnreadCounter.appointment_id, UnreadCounter.count)
+        .filter(UnreadCounter.user_id == user_id, UnreadCounter.count > 0)
+        .all()
+    )
+    return {appointment_id: count for appointment_id, count in rows}
+
+
+def unread_total(user_id):
+    """Total unread messages across all of the user's threads."""
+    total = (
+        db.session.query(func.coalesce(func.sum(UnreadCounter.count), 0))
+        .filter(UnreadCounter.user_id == user_id)
+        .scalar()
+    )
+    return int(total)
+
+
+def rebuild_unread_counters():
+    """Recompute every counter from ``messages``; for repairs after manual edits."""
+    UnreadCounter.query.delete(synchronize_session=False)
+    unread = or_(Message.is_read == false(), Message.is_read.is_(None))
+    db.session.execute(
+        UnreadCounter.__table__.insert().from_select(
+            ['user_id', 'appointment_id', 'count'],
+            select(Message.receiver_id, Message.appointment_id, func.count())
+            .where(unread)
+            .group_by(Message.receiver_id, Message.appointment_id),
+        )
+    )
+
+
+@click.command('rebuild-unread-counters')
+def rebuild_unread_counters_command():
+    """Recompute unread_counters from the messages table."""
+    rebuild_unread_counters()
+    db.session.commit()
+    click.echo('unread counters rebuilt')
@@ -0,0 +1,107 @@
+"""Engine options and per-connection SQLite settings.
+
+``init_database`` replaces a bare ``db.init_app``. It first turns the
+``DB_POOL_*`` settings into SQLAlchemy engine options for server databases
+(PostgreSQL, MySQL) and adds the ``DATABASE_REPLICA_URL`` bind, then
+registers a connect hook on SQLite engines that runs:
+
+* ``journal_mode=WAL`` - readers no longer block the writer or each other
+  (file databases only; it is persistent, so re-running it is a no-op);
+* ``synchronous=NORMAL`` - fsync at checkpoints instead of every commit,
+  which is still crash-safe in WAL mode;
+* ``busy_timeout`` - how long a connection waits for the write lock before
+  raising ``database is locked``;
+* ``mmap_size`` - read pages through a memory map instead of ``read()``.
+
+Keys in ``SQLALCHEMY_ENGINE_OPTIONS`` win over the ones built here.
+"""
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+from extensions import db
+from replicas import REPLICA_BIND
+
+
+def _is_memory(url):
+    return url.database in (None, '', ':memory:') or 'mode=memory' in str(url)
+
+
+def _normalize(uri):
+    if uri.startswith('postgres://'):
+        # Heroku-style URLs; SQLAlchemy only knows the postgresql:// scheme
+        return 'postgresql://' + uri[len('postgres://'):]
+    return uri
+
+
+def engine_options(config, uri):
+    """SQLAlchemy engine options for ``uri`` from the ``DB_POOL_*`` settings."""
+    url = make_url(uri)
+    if url.get_backend_name() == 'sqlite':
+        # SQLite gets its tuning from the connect hook; pool sizing does not
+        # apply to the StaticPool Flask-SQLAlchemy uses for in-memory databases
+        return {}
+    return {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+
+
+def sqlite_pragmas(config, url):
+    """``[(pragma, value), ...]`` run on every new connection to ``url``."""
+    pragmas = []
+    if config['SQLITE_JOURNAL_MODE'] and not _is_memory(url):
+        pragmas.append(('journal_mode', config['SQLITE_JOURNAL_MODE']))
+    if config['SQLITE_SYNCHRONOUS']:
+        pragmas.append(('synchronous', config['SQLITE_SYNCHRONOUS']))
+    pragmas.append(('busy_timeout', int(config['SQLITE_BUSY_TIMEOUT_MS'])))
+    if config['SQLITE_MMAP_SIZE'] and not _is_memory(url):
+        pragmas.append(('mmap_size', int(config['SQLITE_MMAP_SIZE'])))
+    return pragmas
+
+
+def _install_pragmas(engine, pragmas):
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas:
+                cursor.execute(f'PRAGMA {name}={value}')
+        finally:
+            cursor.close()
+
+
+def init_database(app):
+    """``db.init_app(app)`` with pool options, the replica bind and SQLite pragmas applied."""
+    app.config.setdefault('DB_POOL_SIZE', 10)
+    app.config.setdefault('DB_MAX_OVERFLOW', 20)
+    app.config.setdefault('DB_POOL_TIMEOUT', 30)
+    app.config.setdefault('DB_POOL_RECYCLE', 1800)
+    app.config.setdefault('DB_POOL_PRE_PING', True)
+    app.config.setdefault('SQLITE_JOURNAL_MODE', 'wal')
+    app.config.setdefault('SQLITE_SYNCHRONOUS', 'normal')
+    app.config.setdefault('SQLITE_BUSY_TIMEOUT_MS', 5000)
+    app.config.setdefault('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)
+    app.config.setdefault('DATABASE_REPLICA_URL', '')
+
+    uri = app.config['SQLALCHEMY_DATABASE_URI'] = _normalize(app.config['SQLALCHEMY_DATABASE_URI'])
+    options = engine_options(app.config, uri)
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+    replica = app.config['DATABASE_REPLICA_URL']
+    if replica:
+        # read-only bind used by @replica_reads views (see replicas.py)
+        replica = _normalize(replica)
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        binds.setdefault(REPLICA_BIND, dict(engine_options(app.config, replica), url=replica))
+        app.config['SQLALCHEMY_BINDS'] = binds
+
+    db.init_app(app)
+
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite':
+                _install_pragmas(engine, sqlite_pragmas(app.config, engine.url))
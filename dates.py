@@ -0,0 +1,53 @@
+"""Parsing and formatting for the DateTime columns exposed through the API.
+
+Datetimes are stored naive in UTC. The API keeps the string formats the
+endpoints have always returned: ``YYYY-MM-DD HH:MM`` for appointment and
+InfoHub dates, with seconds for message and account timestamps.
+"""
+from datetime import datetime, timezone
+
+_FALLBACK_FORMATS = (
+    '%Y-%m-%d %H:%M',
+    '%Y/%m/%d %H:%M',
+    '%d/%m/%Y %H:%M',
+    '%d/%m/%Y',
+    '%Y/%m/%d',
+)
+
+
+def parse_datetime(value):
+    """Return a naive UTC datetime for ``value``, or None if it can't be parsed.
+
+    Accepts ISO-8601 (including a trailing ``Z`` or an offset, which is
+    converted to UTC) and a few day-first/slash forms seen in older rows.
+    """
+    if isinstance(value, datetime):
+        dt = value
+    elif isinstance(value, str) and value.strip():
+        s = value.strip()
+        if s.endswith(('Z', 'z')):
+            s = s[:-1] + '+00:00'
+        try:
+            dt = datetime.fromisoformat(s)
+        except ValueError:
+            for fmt in _FALLBACK_FORMATS:
+                try:
+                    dt = datetime.strptime(s, fmt)
+                    break
+                except ValueError:
+                    continue
+            else:
+                return None
+    else:
+        return None
+
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def format_datetime(dt, timespec='minutes'):
+    """Render a stored datetime for JSON responses (None stays None)."""
+    if dt is None:
+        return None
+    return dt.isoformat(sep=' ', timespec=timespec)
@@ -1,7 +1,10 @@
-import json
+import hashlib
 from functools import wraps
-from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
-from flask import jsonify
+from flask_jwt_extended import verify_jwt_in_request
+from flask import jsonify, make_response, request, current_app
+from cache import response_cache
+from identity import current_identity
+from replicas import served_from_replica
 
 def role_required(*roles):
     """
@@ -12,11 +15,52 @@ def role_required(*roles):
         @wraps(fn)
         def wrapper(*args, **kwargs):
             verify_jwt_in_request()  # ensures JWT is valid
-            identity_str = get_jwt_identity()  # this is a JSON string
-            user = json.loads(identity_str)    # decode to dict
-
-            if user['role'] not in roles:
+            if current_identity()['role'] not in roles:
                 return jsonify({'message': 'Access forbidden: insufficient role'}), 403
             return fn(*args, **kwargs)
         return wrapper
     return decorator
+
+
+def conditional(max_age=60, tags=None):
+    """
+    Add ETag / Cache-Control to a public GET view and answer If-None-Match with 304.
+
+    Without ``tags`` the ETag is a hash of the response body: a match saves
+    bandwidth but the view still runs. With ``tags`` (the view's cache tags,
+    see cache.py) and a cache backend whose versions all workers share
+    (``CACHE_BACKEND='redis'``), the ETag is derived from their version
+    counters, so a matching request is answered without calling the view
+    at all. With per-process versions another worker's write would never
+    change this worker's ETag, so the body hash is used instead. Bodies
+    read from a replica also get a body-hash ETag, since they may be older
+    than the tag versions.
+    Usage: @conditional(max_age=60, tags=['infohub:list'])
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            etag = None
+            if tags and response_cache.shares_versions:
+                expanded = [t.format(**kwargs) for t in tags]
+                token = f'{request.full_path}|{response_cache.version_token(expanded)}'
+                etag = hashlib.sha1(token.encode('utf-8')).hexdigest()
+                if request.if_none_match.contains(etag):
+                    resp = current_app.response_class(status=304)
+                    resp.set_etag(etag)
+                    resp.cache_control.public = True
+                    resp.cache_control.max_age = max_age
+                    return resp
+
+            resp = make_response(fn(*args, **kwargs))
+            if resp.status_code != 200:
+                return resp
+            if etag and not served_from_replica():
+                resp.set_etag(etag)
+            else:
+                resp.add_etag()
+            resp.cache_control.public = True
+            resp.cache_control.max_age = max_age
+            return resp.make_conditional(request)
+        return wrapper
+    return decorator
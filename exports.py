@@ -0,0 +1,74 @@
+"""Streaming CSV / NDJSON exports.
+
+``export_response`` runs a SELECT with ``yield_per`` (a server-side cursor
+where the driver supports one) and serializes rows as they arrive into a
+generator response, flushing roughly every ``EXPORT_CHUNK_BYTES``. Only
+one batch of rows and one output chunk are in memory at a time, however
+many rows the export covers.
+"""
+import csv
+import io
+import json
+
+from flask import Response, current_app, stream_with_context
+
+from extensions import db
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+# a leading = + - @ makes spreadsheet apps evaluate a cell as a formula
+_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _csv_cell(value):
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _rows(stmt, convert):
+    batch = current_app.config.get('EXPORT_BATCH_SIZE', 1000)
+    result = db.session.execute(stmt.execution_options(yield_per=batch))
+    try:
+        for row in result:
+            yield convert(row)
+    finally:
+        result.close()
+
+
+def export_response(stmt, fields, convert, fmt, filename):
+    """Stream the rows of ``stmt`` as ``fmt`` ('csv' or 'ndjson').
+
+    ``convert`` maps a result row to a list of values in ``fields`` order.
+    """
+    chunk_bytes = current_app.config.get('EXPORT_CHUNK_BYTES', 64 * 1024)
+
+    def generate():
+        buf = io.StringIO()
+        if fmt == 'csv':
+            writer = csv.writer(buf)
+            writer.writerow(fields)
+            for values in _rows(stmt, convert):
+                writer.writerow([_csv_cell(v) for v in values])
+                if buf.tell() >= chunk_bytes:
+                    yield buf.getvalue()
+                    buf.seek(0)
+                    buf.truncate()
+        else:
+            for values in _rows(stmt, convert):
+                buf.write(json.dumps(dict(zip(fields, values)), separators=(',', ':')))
+                buf.write('\n')
+                if buf.tell() >= chunk_bytes:
+                    yield buf.getvalue()
+                    buf.seek(0)
+                    buf.truncate()
+        if buf.tell():
+            yield buf.getvalue()
+
+    resp = Response(stream_with_context(generate()), mimetype=FORMATS[fmt])
+    resp.headers['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+    resp.headers['Cache-Control'] = 'private, no-store'
+    return resp
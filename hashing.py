@@ -0,0 +1,160 @@
+"""Password hashing off the request thread.
+
+bcrypt is deliberately slow (tens to hundreds of milliseconds per call at a
+sensible cost), so ``signup`` and ``login`` hand it to a small process pool
+instead of blocking a web worker. The pool is bounded: at most
+``HASH_POOL_MAX_PENDING`` hashes may be running or queued per process, and
+a request that would exceed that gets ``HasherBusy`` (HTTP 429) straight
+away rather than waiting behind a login burst. A hash that times out
+keeps its slot until its worker actually finishes, since a running task
+can't be cancelled.
+
+``BCRYPT_LOG_ROUNDS`` sets the cost of new hashes. Raising it is safe:
+``needs_rehash`` spots older, cheaper hashes and ``login`` replaces them
+the next time the user signs in.
+
+``HASH_POOL_BACKEND``:
+
+* ``'process'`` - a ``ProcessPoolExecutor`` of ``HASH_POOL_WORKERS``
+  processes, started on first use with the ``spawn`` start method so the
+  workers don't inherit a forked copy of a threaded server (the default);
+* ``'inline'`` - hash on the calling thread, same bound; for scripts and
+  local runs where spawning processes isn't worth it.
+"""
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+import bcrypt
+from flask import jsonify
+
+# bcrypt only looks at the first 72 bytes; newer releases raise instead of
+# truncating, so truncate here to keep existing hashes verifiable
+_MAX_PASSWORD_BYTES = 72
+
+
+def _encode(password):
+    return password.encode('utf-8')[:_MAX_PASSWORD_BYTES]
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(_encode(password), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check(hashed, password):
+    try:
+        return bcrypt.checkpw(_encode(password), hashed.encode('utf-8'))
+    except ValueError:           # not a bcrypt hash
+        return False
+
+
+def hash_rounds(hashed):
+    """Cost factor of a ``$2b$12$...`` hash, or None if it isn't one."""
+    try:
+        return int(hashed.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class HasherBusy(Exception):
+    """Raised when the hashing pool already has its maximum of pending work."""
+
+
+class PasswordHasher:
+    def __init__(self, app=None):
+        self.rounds = 12
+        self.backend = 'inline'
+        self.workers = 1
+        self.timeout = None
+        self._slots = threading.BoundedSemaphore(1)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('BCRYPT_LOG_ROUNDS', 12)
+        app.config.setdefault('HASH_POOL_BACKEND', 'process')
+        app.config.setdefault('HASH_POOL_WORKERS', min(4, os.cpu_count() or 1))
+        app.config.setdefault('HASH_POOL_MAX_PENDING', None)
+        app.config.setdefault('HASH_POOL_TIMEOUT', 10)
+
+        backend = app.config['HASH_POOL_BACKEND']
+        if backend not in ('process', 'inline'):
+            raise ValueError(f'unknown HASH_POOL_BACKEND {backend!r}')
+
+        self.shutdown()
+        self.rounds = app.config['BCRYPT_LOG_ROUNDS']
+        self.backend = backend
+        self.workers = app.config['HASH_POOL_WORKERS']
+        self.timeout = app.config['HASH_POOL_TIMEOUT']
+        max_pending = app.config['HASH_POOL_MAX_PENDING'] or self.workers * 4
+        self._slots = threading.BoundedSemaphore(max_pending)
+        app.extensions['password_hasher'] = self
+
+    def _pool(self):
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context('spawn'))
+        return self._executor
+
+    def shutdown(self):
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy()
+        if self.backend == 'inline':
+            try:
+                return fn(*args)
+            finally:
+                self._slots.release()
+
+        try:
+            future = self._pool().submit(fn, *args)
+            result = future.result(timeout=self.timeout)
+        except FutureTimeout:
+            # a task that already started can't be cancelled: keep its slot
+            # until the worker really finishes
+            if future.cancel():
+                self._slots.release()
+            else:
+                future.add_done_callback(lambda f: self._slots.release())
+            raise HasherBusy()
+        except BaseException as e:
+            self._slots.release()
+            if isinstance(e, BrokenProcessPool):
+                self.shutdown()      # a worker died; start a fresh pool next time
+            raise
+        self._slots.release()
+        return result
+
+    def hash(self, password):
+        """bcrypt hash of ``password`` at the configured cost, as a str."""
+        return self._run(_hash, password, self.rounds)
+
+    def check(self, hashed, password):
+        return self._run(_check, hashed, password)
+
+    def needs_rehash(self, hashed):
+        rounds = hash_rounds(hashed)
+        return rounds is not None and rounds < self.rounds
+
+
+def hasher_busy_response(e):
+    resp = jsonify({'message': 'Too many sign-in requests, try again shortly'})
+    resp.headers['Retry-After'] = '1'
+    return resp, 429
+
+
+password_hasher = PasswordHasher()
+atexit.register(password_hasher.shutdown)
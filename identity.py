@@ -0,0 +1,71 @@
+"""Who is making the request, decoded once per request.
+
+Access tokens carry the user id as ``sub`` and the role (plus, for lawyers
+with a profile, the profile id) as extra claims::
+
+    {"sub": "42", "role": "Lawyer", "lawyer_profile_id": 7, ...}
+
+Tokens issued before this format put ``json.dumps({'id', 'role'})`` in
+``sub``; ``current_identity`` still accepts those until they expire.
+"""
+import json
+
+from flask import g
+from flask_jwt_extended import create_access_token, get_jwt
+
+from extensions import db
+from models import LawyerProfile
+
+
+def create_token(user, lawyer_profile_id=None):
+    """Access token for ``user``; pass ``lawyer_profile_id`` when it is already known."""
+    claims = {'role': user.role}
+    if user.role == 'Lawyer':
+        if lawyer_profile_id is None:
+            lawyer_profile_id = db.session.query(LawyerProfile.id).filter_by(user_id=user.id).scalar()
+        if lawyer_profile_id is not None:
+            claims['lawyer_profile_id'] = lawyer_profile_id
+    return create_access_token(identity=str(user.id), additional_claims=claims)
+
+
+def _cached():
+    """Per-request cache entry, keyed on the decoded token.
+
+    ``flask.g`` lives on the app context, which requests share when one is
+    already pushed (CLI checks, tests), so an entry only counts for the
+    token it was built from.
+    """
+    claims = get_jwt()
+    entry = g.get('_identity')
+    if entry is None or entry['claims'] is not claims:
+        if 'role' in claims:
+            identity = {'id': int(claims['sub']), 'role': claims['role']}
+            profile_id = claims.get('lawyer_profile_id')
+        else:
+            legacy = json.loads(claims['sub'])
+            identity = {'id': legacy.get('id'), 'role': legacy.get('role')}
+            profile_id = None
+        entry = g._identity = {'claims': claims, 'identity': identity, 'lawyer_profile_id': profile_id}
+    return entry
+
+
+def current_identity():
+    """``{'id': int, 'role': str}`` of the verified JWT, cached on ``flask.g``.
+
+    Call only after ``jwt_required`` / ``role_required`` has verified the token.
+    """
+    return _cached()['identity']
+
+
+def current_lawyer_profile_id():
+    """LawyerProfile id of the calling lawyer, or None if they have no profile.
+
+    Read from the token when it carries one; otherwise looked up once and
+    cached for the rest of the request.
+    """
+    entry = _cached()
+    if entry['lawyer_profile_id'] is None:
+        entry['lawyer_profile_id'] = (
+            db.session.query(LawyerProfile.id).filter_by(user_id=entry['identity']['id']).scalar()
+        )
+    return entry['lawyer_profile_id']
@@ -2,24 +2,46 @@ from flask import Blueprint, request, jsonify, abort
 from extensions import db
 from models import InfoHub
 from datetime import datetime
+from cache import response_cache
+from decorators import conditional
+from dates import format_datetime, parse_datetime
+from pagination import keyset_page, page_params, page_response
 
 infohub_bp = Blueprint('infohub', __name__, url_prefix='/infohub')
 
+# list endpoints page newest-first; id breaks ties between equal dates
+_NEWEST_FIRST = [InfoHub.date, InfoHub.id]
+
+
+def _key(item):
+    return [item.date, item.id]
+
+
+# The GETs below read from the primary, not the replica: their responses are
+# shared through response_cache and tag ETags, and a lagging replica read
+# would be stored under the tag version the latest write just bumped.
+
 
 @infohub_bp.route('/titles', methods=['GET'])
+@conditional(tags=['infohub:list'])
+@response_cache.cached(tags=['infohub:list'])
 def get_titles():
-    """Return a list of all infohub titles with id and category."""
-    items = InfoHub.query.order_by(InfoHub.date.desc()).all()
-    result = [{'id': i.id, 'title': i.title, 'category': i.category, 'date': i.date} for i in items]
-    return jsonify(result), 200
+    """Return a page of infohub titles with id and category, newest first."""
+    limit, after = page_params()
+    items, next_cursor = keyset_page(InfoHub.query, _NEWEST_FIRST, _key, limit, after, descending=True)
+    result = [{'id': i.id, 'title': i.title, 'category': i.category, 'date': format_datetime(i.date)} for i in items]
+    return page_response(result, next_cursor)
 
 
 @infohub_bp.route('/', methods=['GET'])
+@conditional(tags=['infohub:list'])
+@response_cache.cached(tags=['infohub:list'])
 def get_all():
-    """Return full info entries (id, title, content, category, date)."""
-    items = InfoHub.query.order_by(InfoHub.date.desc()).all()
-    result = [{'id': i.id, 'title': i.title, 'content': i.content, 'category': i.category, 'date': i.date} for i in items]
-    return jsonify(result), 200
+    """Return a page of full info entries (id, title, content, category, date), newest first."""
+    limit, after = page_params()
+    items, next_cursor = keyset_page(InfoHub.query, _NEWEST_FIRST, _key, limit, after, descending=True)
+    result = [{'id': i.id, 'title': i.title, 'content': i.content, 'category': i.category, 'date': format_datetime(i.date)} for i in items]
+    return page_response(result, next_cursor)
 
 
 @infohub_bp.route('/', methods=['POST'])
@@ -35,36 +57,41 @@ def create_info():
         return jsonify({'error': 'title, content and category are required'}), 400
 
     if date_str:
-        # try to parse ISO-like input and store as 'YYYY-MM-DD HH:MM'
-        try:
-            dt = datetime.fromisoformat(date_str)
-            date = dt.strftime("%Y-%m-%d %H:%M")
-        except ValueError:
-            # if parsing fails, accept the raw string (caller is responsible for format)
-            date = date_str
+        date = parse_datetime(date_str)
+        if date is None:
+            return jsonify({'error': 'date must be an ISO 8601 datetime'}), 400
     else:
-        date = datetime.utcnow().strftime("%Y-%m-%d %H:%M")
+        date = datetime.utcnow()
 
     entry = InfoHub(title=title, content=content, category=category, date=date)
     db.session.add(entry)
     db.session.commit()
+    # a new entry shows up in the full lists and in its own category only
+    response_cache.invalidate('infohub:list', f'infohub:category:{category}')
 
-    return jsonify({'id': entry.id, 'title': entry.title, 'category': entry.category, 'date': entry.date}), 201
+    return jsonify({'id': entry.id, 'title': entry.title, 'category': entry.category, 'date': format_datetime(entry.date)}), 201
 
 
 @infohub_bp.route('/titles/<string:category>', methods=['GET'])
+@conditional(tags=['infohub:category:{category}'])
+@response_cache.cached(tags=['infohub:category:{category}'])
 def get_titles_by_category(category):
-    """Return titles filtered by category."""
-    items = InfoHub.query.filter_by(category=category).order_by(InfoHub.date.desc()).all()
-    result = [{'id': i.id, 'title': i.title, 'date': i.date} for i in items]
-    return jsonify(result), 200
+    """Return a page of titles filtered by category, newest first."""
+    limit, after = page_params()
+    items, next_cursor = keyset_page(
+        InfoHub.query.filter_by(category=category), _NEWEST_FIRST, _key, limit, after, descending=True
+    )
+    result = [{'id': i.id, 'title': i.title, 'date': format_datetime(i.date)} for i in items]
+    return page_response(result, next_cursor)
 
 
 @infohub_bp.route('/contents/<int:item_id>', methods=['GET'])
+@conditional(tags=['infohub:item:{item_id}'])
+@response_cache.cached(tags=['infohub:item:{item_id}'])
 def get_content_by_id(item_id):
     """Return the content (and metadata) for an InfoHub entry by id."""
     item = InfoHub.query.get(item_id)
     if not item:
         return jsonify({'error': 'not found'}), 404
-    result = {'id': item.id, 'title': item.title, 'content': item.content, 'category': item.category, 'date': item.date}
+    result = {'id': item.id, 'title': item.title, 'content': item.content, 'category': item.category, 'date': format_datetime(item.date)}
     return jsonify(result), 200
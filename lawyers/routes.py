@@ -1,15 +1,35 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import get_jwt_identity
+from datetime import datetime, timedelta
+from flask import Blueprint, abort, current_app, request, jsonify
 from extensions import db
-from models import LawyerProfile, User, Specialty
-from decorators import role_required
+from models import LawyerProfile, User, Specialty, AvailabilityWindow
+from decorators import role_required, conditional
+from search import search_index
+from availability import free_slots_for
+from dates import format_datetime, parse_datetime
+from ratelimit import rate_limiter
+from replicas import replica_reads
+from querystats import query_budget
+from identity import create_token, current_identity, current_lawyer_profile_id
+from pagination import check_cursor, encode_cursor, keyset_page, page_params, page_response
 
 lawyers_bp = Blueprint('lawyers', __name__, url_prefix='/lawyers')
 
 
 
 @lawyers_bp.route('', methods=['GET'])
+@rate_limiter.limit('SEARCH_RATE_LIMIT')
+@conditional(max_age=30)
+@replica_reads
 def search_lawyers():
+    """Search the lawyer directory.
+
+    Query params: q (any field), specialty, location. Every term is a prefix
+    match and all terms must match; results are ranked best-first. With no
+    filters every profile is returned in id order. Paginated with
+    limit/cursor (see pagination.py).
+    """
+    limit, after = page_params()
+    text_q = request.args.get('q')
     specialty_q = request.args.get('specialty')
     location_q = request.args.get('location')
 
@@ -18,16 +38,21 @@ def search_lawyers():
         User, User.id == LawyerProfile.user_id
     )
 
-    if location_q:
-        q = q.filter(LawyerProfile.location.ilike(f"%{location_q}%"))
-
-    # if specialty filter is present, join specialties and filter by name
-    if specialty_q:
-        q = q.join(Specialty, Specialty.lawyer_id == LawyerProfile.id).filter(
-            Specialty.name.ilike(f"%{specialty_q}%")
+    if text_q or location_q or specialty_q:
+        if after is not None:
+            check_cursor(after, (float, int))       # (rank, profile id)
+        ranked = search_index.search(
+            q=text_q, location=location_q, specialty=specialty_q, limit=limit + 1, after=after
+        )
+        next_cursor = encode_cursor(ranked[limit - 1]) if len(ranked) > limit else None
+        ranked = ranked[:limit]
+        order = {pid: pos for pos, (_, pid) in enumerate(ranked)}
+        rows = q.filter(LawyerProfile.id.in_(list(order))).all() if order else []
+        rows.sort(key=lambda row: order[row[0].id])
+    else:
+        rows, next_cursor = keyset_page(
+            q, [LawyerProfile.id], lambda row: [row[0].id], limit, after
         )
-
-    rows = q.all()
 
     # gather specialties for all returned profiles in one shot
     profile_ids = list({lp.id for (lp, _) in rows})
@@ -56,18 +81,16 @@ def search_lawyers():
             "specialties": specs_map.get(lp.id, [])
         })
 
-    return jsonify(result)
+    return page_response(result, next_cursor)
 
 
 @lawyers_bp.route('/profile', methods=['POST'])
 @role_required('Lawyer')
 def create_profile():
-    import json
-    ident = json.loads(get_jwt_identity())   # decode JSON string
-    user_id = ident['id']
+    user_id = current_identity()['id']
 
     # one profile per lawyer
-    if LawyerProfile.query.filter_by(user_id=user_id).first():
+    if current_lawyer_profile_id() is not None:
         return jsonify({"message": "Profile already exists"}), 400
 
     data = request.get_json() or {}
@@ -92,16 +115,23 @@ def create_profile():
     for name in names:
         db.session.add(Specialty(lawyer_id=profile.id, name=name))
 
+    db.session.flush()
+    search_index.index_profile(profile.id)
     db.session.commit()
-    return jsonify({'message': 'Profile created', 'profile_id': profile.id}), 201
+    # a token carrying the new profile id saves later lookups
+    user = db.session.get(User, user_id)
+    return jsonify({
+        'message': 'Profile created',
+        'profile_id': profile.id,
+        'access_token': create_token(user, lawyer_profile_id=profile.id)
+    }), 201
 
 
 
 @lawyers_bp.route('/profile/<int:lawyer_id>', methods=['PUT'])
 @role_required('Lawyer')
 def update_profile(lawyer_id):
-    ident = get_jwt_identity()
-    user_id = ident['id']
+    user_id = current_identity()['id']
 
     profile = LawyerProfile.query.get_or_404(lawyer_id)
     if profile.user_id != user_id:
@@ -127,25 +157,40 @@ def update_profile(lawyer_id):
         for name in names:
             db.session.add(Specialty(lawyer_id=profile.id, name=name))
 
+    db.session.flush()
+    search_index.index_profile(profile.id)
     db.session.commit()
     return jsonify({'message': 'Profile updated'})
 
 
+def _profile_with_user(condition):
+    """``(profile, user)`` for the profile matching ``condition`` in one query, or 404."""
+    row = (
+        db.session.query(LawyerProfile, User)
+        .outerjoin(User, User.id == LawyerProfile.user_id)
+        .filter(condition)
+        .first()
+    )
+    if row is None:
+        abort(404)
+    return row
+
+
+def _specialty_names(profile_id):
+    return [name for (name,) in db.session.query(Specialty.name).filter(Specialty.lawyer_id == profile_id)]
+
+
 # -------------------------
 # View ONE Lawyer Profile by lawyer_id (public)
 #   GET /lawyers/<lawyer_id>
 # -------------------------
 @lawyers_bp.route('/<int:lawyer_id>', methods=['GET'])
+@conditional(max_age=30)
+@replica_reads
+@query_budget(2)
 def view_profile(lawyer_id):
-    profile = LawyerProfile.query.get_or_404(lawyer_id)
-    user = User.query.get(profile.user_id)
-
-    specs = (
-        db.session.query(Specialty.name)
-        .filter(Specialty.lawyer_id == profile.id)
-        .all()
-    )
-    specialties = [s.name for s in specs]
+    profile, user = _profile_with_user(LawyerProfile.id == lawyer_id)
+    specialties = _specialty_names(profile.id)
 
     return jsonify({
         "id": profile.id,
@@ -163,6 +208,7 @@ def view_profile(lawyer_id):
 
 
 @lawyers_bp.route('/profile/exists/<int:user_id>', methods=['GET'])
+@replica_reads
 def check_profile_exists(user_id):
     """Public endpoint: return whether the given user_id (lawyer) has created a profile.
 
@@ -176,20 +222,16 @@ def check_profile_exists(user_id):
 
 
 @lawyers_bp.route('/by_user/<int:user_id>', methods=['GET'])
+@conditional(max_age=30)
+@replica_reads
+@query_budget(2)
 def view_by_user(user_id):
     """Return combined lawyer info given a user_id (public).
 
     This joins `users` and `lawyer_profiles` and includes specialties.
     """
-    profile = LawyerProfile.query.filter_by(user_id=user_id).first_or_404()
-    user = User.query.get(user_id)
-
-    specs = (
-        db.session.query(Specialty.name)
-        .filter(Specialty.lawyer_id == profile.id)
-        .all()
-    )
-    specialties = [s.name for s in specs]
+    profile, user = _profile_with_user(LawyerProfile.user_id == user_id)
+    specialties = _specialty_names(profile.id)
 
     return jsonify({
         "id": profile.id,
@@ -204,3 +246,121 @@ def view_by_user(user_id):
         "v_hour": profile.v_hour,
         "specialties": specialties
     })
+
+
+def _minute_of_day(value):
+    """'HH:MM' -> minutes after midnight ('24:00' allowed as an end), else None."""
+    try:
+        hours, minutes = (int(p) for p in str(value).split(':'))
+    except ValueError:
+        return None
+    if 0 <= hours <= 24 and 0 <= minutes < 60 and hours * 60 + minutes <= 24 * 60:
+        return hours * 60 + minutes
+    return None
+
+
+def _format_minute(minute):
+    return f'{minute // 60:02d}:{minute % 60:02d}'
+
+
+def _window_json(w):
+    return {
+        'weekday': w.weekday,
+        'start': _format_minute(w.start_minute),
+        'end': _format_minute(w.end_minute),
+        'slot_minutes': w.slot_minutes
+    }
+
+
+@lawyers_bp.route('/profile/availability', methods=['PUT'])
+@role_required('Lawyer')
+def set_availability():
+    """Replace the calling lawyer's weekly availability.
+
+    Expected JSON: { windows: [{ weekday: 0-6 (Monday = 0), start: "HH:MM",
+    end: "HH:MM", slot_minutes: int (optional, default 60) }, ...] }
+    Weekdays and times are UTC. Windows on the same weekday must not overlap.
+    """
+    lawyer_id = current_lawyer_profile_id()
+    if lawyer_id is None:
+        return jsonify({'message': 'Profile not found'}), 404
+
+    data = request.get_json() or {}
+    max_minutes = current_app.config.get('APPOINTMENT_MAX_MINUTES', 240)
+    windows = []
+    for item in data.get('windows') or []:
+        item = item if isinstance(item, dict) else {}
+        weekday = item.get('weekday')
+        start, end = _minute_of_day(item.get('start')), _minute_of_day(item.get('end'))
+        slot = item.get('slot_minutes', 60)
+        if (not isinstance(weekday, int) or not 0 <= weekday <= 6 or start is None or end is None
+                or not isinstance(slot, int) or not 0 < slot <= max_minutes or end - start < slot):
+            return jsonify({'message': 'Each window needs weekday 0-6, start < end (HH:MM) '
+                                       f'and slot_minutes between 1 and {max_minutes} that fits'}), 400
+        windows.append(AvailabilityWindow(lawyer_id=lawyer_id, weekday=weekday, start_minute=start,
+                                          end_minute=end, slot_minutes=slot))
+
+    windows.sort(key=lambda w: (w.weekday, w.start_minute))
+    for prev, cur in zip(windows, windows[1:]):
+        if prev.weekday == cur.weekday and cur.start_minute < prev.end_minute:
+            return jsonify({'message': 'Windows on the same weekday overlap'}), 400
+
+    # serialize before commit: expired rows can't be reloaded once a
+    # concurrent update has replaced them
+    result = [_window_json(w) for w in windows]
+    AvailabilityWindow.query.filter_by(lawyer_id=lawyer_id).delete()
+    db.session.add_all(windows)
+    db.session.commit()
+    return jsonify({'message': 'Availability updated', 'timezone': 'UTC', 'windows': result})
+
+
+@lawyers_bp.route('/<int:lawyer_id>/availability', methods=['GET'])
+@replica_reads
+def view_availability(lawyer_id):
+    """Weekly availability windows of a lawyer (public).
+
+    Response: { lawyer_id, timezone: "UTC", windows: [{ weekday, start,
+    end, slot_minutes }, ...] }; weekdays and HH:MM times are UTC.
+    """
+    LawyerProfile.query.get_or_404(lawyer_id)
+    windows = (
+        AvailabilityWindow.query.filter_by(lawyer_id=lawyer_id)
+        .order_by(AvailabilityWindow.weekday, AvailabilityWindow.start_minute)
+        .all()
+    )
+    return jsonify({'lawyer_id': lawyer_id, 'timezone': 'UTC', 'windows': [_window_json(w) for w in windows]})
+
+
+@lawyers_bp.route('/<int:lawyer_id>/slots', methods=['GET'])
+@replica_reads
+def view_slots(lawyer_id):
+    """Free bookable slots of a lawyer (public).
+
+    Query params: from, to (ISO datetimes, to exclusive; UTC unless they
+    carry an offset). Defaults to the next SLOTS_DEFAULT_DAYS days; at most
+    SLOTS_MAX_DAYS are returned.
+    Response: { lawyer_id, timezone: "UTC", from, to, slots: [{ start, end }, ...] }
+    with every datetime in UTC.
+    """
+    LawyerProfile.query.get_or_404(lawyer_id)
+
+    start = parse_datetime(request.args['from']) if request.args.get('from') else datetime.utcnow()
+    if start is None:
+        return jsonify({'message': 'from/to must be ISO 8601 datetimes'}), 400
+    start = start.replace(second=0, microsecond=0)
+    if request.args.get('to'):
+        end = parse_datetime(request.args['to'])
+        if end is None:
+            return jsonify({'message': 'from/to must be ISO 8601 datetimes'}), 400
+    else:
+        end = start + timedelta(days=current_app.config.get('SLOTS_DEFAULT_DAYS', 14))
+    end = min(end, start + timedelta(days=current_app.config.get('SLOTS_MAX_DAYS', 31)))
+
+    slots = free_slots_for([lawyer_id], start, end)[lawyer_id] if end > start else []
+    return jsonify({
+        'lawyer_id': lawyer_id,
+        'timezone': 'UTC',
+        'from': format_datetime(start),
+        'to': format_datetime(end),
+        'slots': [{'start': format_datetime(s), 'end': format_datetime(e)} for s, e in slots]
+    })
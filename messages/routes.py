@@ -1,40 +1,129 @@
-from flask import Blueprint, request, jsonify, send_from_directory, current_app
+from flask import Blueprint, Response, request, jsonify, send_from_directory, current_app
 from extensions import db
-from models import Message, Appointment, User
-from flask_jwt_extended import get_jwt_identity
+from models import Message, Appointment, User, LawyerProfile
+from sqlalchemy import and_, func, or_, select, true, update
+from flask_jwt_extended import jwt_required
 from decorators import role_required
+from dates import format_datetime
+from identity import current_identity
+from exports import FORMATS as EXPORT_FORMATS, export_response
+from pagination import keyset_page, page_params, page_response
+from pubsub import message_broker
+from counters import increment_unread, decrement_unread, unread_counts
+from uploads import UploadError, blob_relpath, start_upload, load_upload, append_chunk, finish_upload
+from validators import is_id
 import json
 import os
+import unicodedata
+from collections import Counter
+from urllib.parse import quote
+from werkzeug.http import parse_content_range_header
+from werkzeug.security import safe_join
 
 messages_bp = Blueprint('messages', __name__, url_prefix='/messages')
 
 
+def _serialize(m):
+    return {
+        'id': m.id,
+        'appointment_id': m.appointment_id,
+        'sender_id': m.sender_id,
+        'receiver_id': m.receiver_id,
+        'message_text': m.message_text,
+        'file_path': m.file_path,
+        'file_type': m.file_type,
+        'file_name': m.file_name,
+        'timestamp': format_datetime(m.timestamp, 'seconds'),
+        'is_read': m.is_read
+    }
+
+
+# column order of the compact delta format
+DELTA_FIELDS = ['id', 'sender_id', 'receiver_id', 'message_text', 'file_path', 'file_type', 'timestamp', 'is_read']
+
+
+def _delta_row(m):
+    return [
+        m.id, m.sender_id, m.receiver_id, m.message_text, m.file_path, m.file_type,
+        format_datetime(m.timestamp, 'seconds'), m.is_read
+    ]
+
+
+def _participant_ids(appt):
+    """User ids of the client and the lawyer on ``appt``.
+
+    ``Appointment.lawyer_id`` is a lawyer_profiles id, so the lawyer's user id
+    has to be looked up before comparing it with a JWT identity.
+    """
+    lawyer_user_id = db.session.query(LawyerProfile.user_id).filter_by(id=appt.lawyer_id).scalar()
+    return appt.client_id, lawyer_user_id
+
+
+def _participant_appointments(user_id):
+    """Subquery of the appointment ids ``user_id`` takes part in, as client or lawyer."""
+    own_profiles = select(LawyerProfile.id).where(LawyerProfile.user_id == user_id)
+    return select(Appointment.id).where(
+        or_(Appointment.client_id == user_id, Appointment.lawyer_id.in_(own_profiles))
+    )
+
+
+# only complete_file_upload may set these: download_file authorizes by
+# Message.file_path, so a client-chosen path would grant access to any file
+ATTACHMENT_FIELDS = ('file_path', 'file_type')
+
+
+def _attachment_error(index=None):
+    body = {'message': 'Attach files with /messages/uploads; file_path and file_type are not accepted here'}
+    if index is not None:
+        body['index'] = index
+    return jsonify(body), 400
+
+
+def _disposition_names(name):
+    # the same encoding send_file uses: an ASCII filename for old clients and
+    # an RFC 5987 filename* when the real name isn't plain ASCII
+    simple = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode('ascii')
+    if simple == name:
+        return {'filename': name}
+    return {'filename': simple, 'filename*': "UTF-8''" + quote(name, safe="!#$&+^`|~")}
+
+
+def _channel(appointment_id):
+    return f'appointment:{appointment_id}'
+
+
+def _sse(event):
+    return f"id: {event['id']}\nevent: message\ndata: {json.dumps(event)}\n\n"
+
+
 @messages_bp.route('/send', methods=['POST'])
+@jwt_required()
 def send_message():
     """Send a message related to an appointment.
 
-    Expected JSON: { appointment_id, receiver_id, message_text, file_path (optional), file_type (optional) }
-    Sender is derived from JWT.
+    Expected JSON: { appointment_id, receiver_id, message_text }
+    Sender is derived from JWT. Attachments are sent with /messages/uploads.
     """
-    ident = json.loads(get_jwt_identity())
+    ident = current_identity()
     sender_id = ident.get('id')
 
     data = request.get_json() or {}
     appointment_id = data.get('appointment_id')
     receiver_id = data.get('receiver_id')
     message_text = data.get('message_text')
-    file_path = data.get('file_path')
-    file_type = data.get('file_type')
 
-    if not appointment_id or not receiver_id:
-        return jsonify({'message': 'appointment_id and receiver_id are required'}), 400
+    if any(data.get(f) is not None for f in ATTACHMENT_FIELDS):
+        return _attachment_error()
+    if not is_id(appointment_id) or not is_id(receiver_id):
+        return jsonify({'message': 'appointment_id and receiver_id are required integers'}), 400
 
     appt = Appointment.query.get(appointment_id)
     if not appt:
         return jsonify({'message': 'Appointment not found'}), 404
 
     # ensure sender or receiver is part of this appointment
-    if sender_id not in (appt.client_id, appt.lawyer_id) or receiver_id not in (appt.client_id, appt.lawyer_id):
+    participants = _participant_ids(appt)
+    if sender_id not in participants or receiver_id not in participants:
         return jsonify({'message': 'Sender or receiver not part of appointment'}), 403
 
     msg = Message(
@@ -42,60 +131,531 @@ def send_message():
         sender_id=sender_id,
         receiver_id=receiver_id,
         message_text=message_text,
-        file_path=file_path,
-        file_type=file_type,
-        timestamp=None,
         is_read=False
     )
     db.session.add(msg)
+    increment_unread(receiver_id, appointment_id)
     db.session.commit()
+    message_broker.publish(_channel(appointment_id), _serialize(msg))
     return jsonify({'message': 'Message sent', 'message_id': msg.id}), 201
 
 
+@messages_bp.route('/send/batch', methods=['POST'])
+@jwt_required()
+def send_messages_batch():
+    """Send several messages (e.g. forwarding) in one transaction.
+
+    Expected JSON: { messages: [ { appointment_id, receiver_id, message_text }, ... ] }
+    All messages are validated first; if any is invalid nothing is sent and
+    the error names the offending item's ``index``.
+    """
+    ident = current_identity()
+    sender_id = ident.get('id')
+
+    items = (request.get_json() or {}).get('messages')
+    if not isinstance(items, list) or not items:
+        return jsonify({'message': 'messages must be a non-empty list'}), 400
+    max_batch = current_app.config.get('MESSAGE_BATCH_MAX', 100)
+    if len(items) > max_batch:
+        return jsonify({'message': f'at most {max_batch} messages per batch'}), 400
+    for index, i in enumerate(items):
+        if not isinstance(i, dict) or not is_id(i.get('appointment_id')) or not is_id(i.get('receiver_id')):
+            return jsonify({'message': 'appointment_id and receiver_id are required integers',
+                            'index': index}), 400
+        if any(i.get(f) is not None for f in ATTACHMENT_FIELDS):
+            return _attachment_error(index)
+
+    # participants of every referenced appointment in one query
+    appt_ids = {i['appointment_id'] for i in items}
+    participants = {
+        appt_id: (client_id, lawyer_user_id)
+        for appt_id, client_id, lawyer_user_id in db.session.query(
+            Appointment.id, Appointment.client_id, LawyerProfile.user_id
+        ).join(LawyerProfile, LawyerProfile.id == Appointment.lawyer_id).filter(Appointment.id.in_(appt_ids))
+    }
+    for index, i in enumerate(items):
+        people = participants.get(i['appointment_id'])
+        if people is None:
+            return jsonify({'message': 'Appointment not found', 'appointment_id': i['appointment_id'],
+                            'index': index}), 404
+        if sender_id not in people or i['receiver_id'] not in people:
+            return jsonify({'message': 'Sender or receiver not part of appointment',
+                            'appointment_id': i['appointment_id'], 'index': index}), 403
+
+    msgs = [
+        Message(
+            appointment_id=i['appointment_id'],
+            sender_id=sender_id,
+            receiver_id=i['receiver_id'],
+            message_text=i.get('message_text'),
+            is_read=False
+        )
+        for i in items
+    ]
+    db.session.add_all(msgs)
+    for (receiver_id, appointment_id), n in Counter((m.receiver_id, m.appointment_id) for m in msgs).items():
+        increment_unread(receiver_id, appointment_id, n)
+    db.session.flush()
+    # serialize before commit expires the objects, or each one is reloaded
+    events = [(_channel(m.appointment_id), _serialize(m)) for m in msgs]
+    db.session.commit()
+
+    for channel, payload in events:
+        message_broker.publish(channel, payload)
+    return jsonify({'message': 'Messages sent', 'message_ids': [payload['id'] for _, payload in events]}), 201
+
+
+@messages_bp.route('/sync', methods=['POST'])
+@jwt_required()
+def sync_threads():
+    """Return new messages for every appointment the caller takes part in, in one query.
+
+    Expected JSON: { threads: { "<appointment_id>": last_seen_message_id, ... } }
+    Threads missing from ``threads`` are synced from the beginning; at most
+    MESSAGE_BATCH_MAX entries are accepted, and entries for appointments the
+    caller isn't part of are ignored. Response:
+        { fields: [...], threads: { "<appointment_id>": { rows, last_id } }, has_more }
+    Rows come in (appointment_id, id) order and are capped at the page limit;
+    when has_more is true, call again with the returned last_ids.
+    """
+    ident = current_identity()
+    user_id = ident.get('id')
+
+    data = request.get_json() or {}
+    threads = data.get('threads') or {}
+    max_threads = current_app.config.get('MESSAGE_BATCH_MAX', 100)
+    if not isinstance(threads, dict) or not all(
+            k.isascii() and k.isdigit() and int(k) > 0 and is_id(v) for k, v in threads.items()):
+        return jsonify({'message': 'threads must map appointment ids to message ids'}), 400
+    if len(threads) > max_threads:
+        return jsonify({'message': f'at most {max_threads} threads per request'}), 400
+    cursors = {int(k): v for k, v in threads.items()}
+    if cursors:
+        # cursors for threads the caller isn't in would only grow the predicate
+        own = set(db.session.scalars(
+            _participant_appointments(user_id).where(Appointment.id.in_(list(cursors)))
+        ))
+        cursors = {a: c for a, c in cursors.items() if a in own}
+
+    newer = [and_(Message.appointment_id == a, Message.id > c) for a, c in cursors.items()]
+    newer.append(Message.appointment_id.notin_(list(cursors)) if cursors else true())
+
+    limit, _ = page_params()
+    rows = (
+        Message.query
+        .filter(Message.appointment_id.in_(_participant_appointments(user_id)), or_(*newer))
+        .order_by(Message.appointment_id.asc(), Message.id.asc())
+        .limit(limit + 1).all()
+    )
+    has_more = len(rows) > limit
+
+    threads = {}
+    for m in rows[:limit]:
+        thread = threads.setdefault(str(m.appointment_id), {'rows': [], 'last_id': None})
+        thread['rows'].append(_delta_row(m))
+        thread['last_id'] = m.id
+
+    return jsonify({'fields': DELTA_FIELDS, 'threads': threads, 'has_more': has_more})
+
+
+@messages_bp.route('/appointment/<int:appointment_id>/stream', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string'])
+def stream_messages(appointment_id):
+    """Server-Sent Events stream of new messages for an appointment.
+
+    EventSource can't send headers, so the token may also be passed as
+    ?jwt=. Each event's id is the message id; on reconnect the browser sends
+    Last-Event-ID and everything after it is replayed from the database
+    before live delivery resumes. If more than SSE_REPLAY_LIMIT messages were
+    missed a 'resync' event is sent instead, carrying the newest message id
+    as its id, and the client should page through list_messages; live
+    delivery continues after it.
+    """
+    ident = current_identity()
+    user_id = ident.get('id')
+
+    appt = Appointment.query.get_or_404(appointment_id)
+    if user_id not in _participant_ids(appt):
+        return jsonify({'message': 'Not authorized'}), 403
+
+    last_event_id = request.headers.get('Last-Event-ID', request.args.get('last_event_id'))
+    try:
+        last_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({'message': 'Invalid Last-Event-ID'}), 400
+
+    # subscribe before reading the backlog so nothing sent in between is lost
+    sub = message_broker.subscribe(_channel(appointment_id))
+    try:
+        replay, resync_id = [], None
+        if last_id is not None:
+            replay_limit = current_app.config.get('SSE_REPLAY_LIMIT', 200)
+            rows = (
+                Message.query.filter(Message.appointment_id == appointment_id, Message.id > last_id)
+                .order_by(Message.id.asc()).limit(replay_limit + 1).all()
+            )
+            if len(rows) > replay_limit:
+                # the id moves the client's Last-Event-ID past the gap, or every
+                # reconnect would resync again
+                resync_id = db.session.query(func.max(Message.id)).filter(
+                    Message.appointment_id == appointment_id).scalar()
+            else:
+                replay = [_serialize(m) for m in rows]
+        heartbeat = current_app.config.get('SSE_HEARTBEAT_SECONDS', 15)
+    except BaseException:
+        sub.close()
+        raise
+
+    def generate():
+        try:
+            yield 'retry: 3000\n\n'
+            seen = last_id or 0
+            if resync_id is not None:
+                yield f'id: {resync_id}\nevent: resync\ndata: {{}}\n\n'
+                seen = resync_id
+            for event in replay:
+                yield _sse(event)
+                seen = event['id']
+            while not sub.overflowed:
+                event = sub.get(timeout=heartbeat)
+                if event is None:
+                    yield ': keep-alive\n\n'
+                elif event['id'] > seen:
+                    yield _sse(event)
+                    seen = event['id']
+        finally:
+            sub.close()
+
+    resp = Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+    # the generator's finally only runs once iteration has started; the
+    # server closes the response either way
+    resp.call_on_close(sub.close)
+    return resp
+
+
 @messages_bp.route('/appointment/<int:appointment_id>', methods=['GET'])
+@jwt_required()
 def list_messages(appointment_id):
-    """List messages for an appointment. Requester must be participant."""
-    ident = json.loads(get_jwt_identity())
+    """List messages for an appointment, oldest first. Requester must be participant.
+
+    With ?since_id=N (alias ?after=N) only messages newer than N are returned,
+    in the compact delta format:
+        { appointment_id, fields: [...], rows: [[...], ...], last_id, has_more }
+    where each row holds the values of ``fields`` in order. Pass the returned
+    last_id as since_id on the next refresh.
+    """
+    ident = current_identity()
     user_id = ident.get('id')
 
     appt = Appointment.query.get_or_404(appointment_id)
-    if user_id not in (appt.client_id, appt.lawyer_id):
+    if user_id not in _participant_ids(appt):
         return jsonify({'message': 'Not authorized'}), 403
 
-    msgs = Message.query.filter_by(appointment_id=appointment_id).order_by(Message.id.asc()).all()
-    result = []
-    for m in msgs:
-        result.append({
-            'id': m.id,
-            'appointment_id': m.appointment_id,
-            'sender_id': m.sender_id,
-            'receiver_id': m.receiver_id,
-            'message_text': m.message_text,
-            'file_path': m.file_path,
-            'file_type': m.file_type,
-            'timestamp': m.timestamp,
-            'is_read': m.is_read
+    since_id = request.args.get('since_id', request.args.get('after'))
+    if since_id is not None:
+        try:
+            since_id = int(since_id)
+        except ValueError:
+            return jsonify({'message': 'since_id must be an integer'}), 400
+        limit, _ = page_params()
+        msgs, more = keyset_page(
+            Message.query.filter_by(appointment_id=appointment_id), [Message.id], lambda m: [m.id],
+            limit, [since_id]
+        )
+        return jsonify({
+            'appointment_id': appointment_id,
+            'fields': DELTA_FIELDS,
+            'rows': [_delta_row(m) for m in msgs],
+            'last_id': msgs[-1].id if msgs else since_id,
+            'has_more': more is not None
         })
-    return jsonify(result)
+
+    limit, after = page_params()
+    msgs, next_cursor = keyset_page(
+        Message.query.filter_by(appointment_id=appointment_id), [Message.id], lambda m: [m.id], limit, after
+    )
+    return page_response([_serialize(m) for m in msgs], next_cursor)
+
+
+@messages_bp.route('/appointment/<int:appointment_id>/export', methods=['GET'])
+@jwt_required()
+def export_messages(appointment_id):
+    """Download a whole thread, oldest first, as ?format=csv (default) or ndjson.
+
+    Rows are streamed from the database as they are written out, so
+    memory use doesn't depend on the length of the thread.
+    """
+    ident = current_identity()
+    appt = Appointment.query.get_or_404(appointment_id)
+    if ident.get('id') not in _participant_ids(appt):
+        return jsonify({'message': 'Not authorized'}), 403
+
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'message': f'format must be one of {", ".join(EXPORT_FORMATS)}'}), 400
+
+    stmt = (
+        select(Message.id, Message.sender_id, Message.receiver_id, Message.message_text,
+               Message.file_path, Message.file_type, Message.timestamp, Message.is_read)
+        .where(Message.appointment_id == appointment_id)
+        .order_by(Message.id)
+    )
+    return export_response(stmt, DELTA_FIELDS, _delta_row, fmt, f'appointment-{appointment_id}-messages')
 
 
 @messages_bp.route('/<int:message_id>/read', methods=['POST'])
+@jwt_required()
 def mark_read(message_id):
     """Mark a message as read (only the receiver can mark)."""
-    ident = json.loads(get_jwt_identity())
+    ident = current_identity()
     user_id = ident.get('id')
 
     msg = Message.query.get_or_404(message_id)
     if msg.receiver_id != user_id:
         return jsonify({'message': 'Not authorized'}), 403
 
-    msg.is_read = True
+    # conditional update so concurrent reads of the same message decrement once
+    flipped = Message.query.filter(Message.id == message_id, Message.is_read.isnot(True)).update(
+        {Message.is_read: True}, synchronize_session=False
+    )
+    if flipped:
+        decrement_unread(user_id, msg.appointment_id)
     db.session.commit()
     return jsonify({'message': 'Marked as read'})
 
 
+@messages_bp.route('/read', methods=['POST'])
+@jwt_required()
+def mark_read_bulk():
+    """Mark many messages as read with a single UPDATE.
+
+    Expected JSON, either:
+        { appointment_id, up_to_id }   everything in the thread up to and including up_to_id
+        { ids: [message_id, ...] }     an explicit list
+    Only messages addressed to the caller are touched; the receiver check is
+    part of the UPDATE's WHERE clause. Response: { updated: int }
+    """
+    ident = current_identity()
+    user_id = ident.get('id')
+    data = request.get_json() or {}
+
+    conditions = [Message.receiver_id == user_id, Message.is_read.isnot(True)]
+    if data.get('ids') is not None:
+        ids = data.get('ids')
+        max_batch = current_app.config.get('MESSAGE_BATCH_MAX', 100)
+        if not isinstance(ids, list) or not all(is_id(i) for i in ids):
+            return jsonify({'message': 'ids must be a list of message ids'}), 400
+        if len(ids) > max_batch:
+            return jsonify({'message': f'at most {max_batch} ids per request'}), 400
+        conditions.append(Message.id.in_(ids))
+    elif data.get('appointment_id') is not None or data.get('up_to_id') is not None:
+        if not is_id(data.get('appointment_id')) or not is_id(data.get('up_to_id')):
+            return jsonify({'message': 'appointment_id and up_to_id must be integer ids'}), 400
+        conditions += [Message.appointment_id == data['appointment_id'], Message.id <= data['up_to_id']]
+    else:
+        return jsonify({'message': 'ids, or appointment_id and up_to_id, are required'}), 400
+
+    stmt = update(Message).where(*conditions).values(is_read=True)
+    if db.session.get_bind().dialect.update_returning:
+        flipped = [row.appointment_id for row in db.session.execute(stmt.returning(Message.appointment_id))]
+    else:
+        flipped = [row.appointment_id for row in db.session.query(Message.appointment_id).filter(*conditions)]
+        db.session.execute(stmt)
+
+    for appointment_id, n in Counter(flipped).items():
+        decrement_unread(user_id, appointment_id, n)
+    db.session.commit()
+    return jsonify({'message': 'Marked as read', 'updated': len(flipped)})
+
+
+@messages_bp.route('/unread', methods=['GET'])
+@jwt_required()
+def unread():
+    """Unread message counts for the caller's inbox badge.
+
+    Response: { total: int, threads: { "<appointment_id>": count } }
+    Read from maintained counters, so cost grows with threads, not messages.
+    """
+    ident = current_identity()
+    counts = unread_counts(ident.get('id'))
+    return jsonify({
+        'total': sum(counts.values()),
+        'threads': {str(k): v for k, v in counts.items()}
+    })
+
+
+@messages_bp.errorhandler(UploadError)
+def upload_error(e):
+    return jsonify({'message': e.message, **e.extra}), e.status
+
+
+@messages_bp.route('/uploads', methods=['POST'])
+@jwt_required()
+def start_file_upload():
+    """Start a resumable upload of a message attachment.
+
+    Expected JSON: { appointment_id, filename (optional), file_type (optional), size (optional, bytes) }
+    Response: { upload_id, offset: 0 }. Then PUT the bytes to
+    /messages/uploads/<upload_id> and POST .../complete to send the message.
+    """
+    ident = current_identity()
+    user_id = ident.get('id')
+
+    data = request.get_json() or {}
+    appointment_id = data.get('appointment_id')
+    size = data.get('size')
+    filename = data.get('filename')
+    if not is_id(appointment_id):
+        return jsonify({'message': 'appointment_id must be an integer id'}), 400
+    if size is not None and (not isinstance(size, int) or isinstance(size, bool) or size < 0):
+        return jsonify({'message': 'size must be a non-negative integer'}), 400
+    if filename is not None and not isinstance(filename, str):
+        return jsonify({'message': 'filename must be a string'}), 400
+
+    appt = Appointment.query.get_or_404(appointment_id)
+    if user_id not in _participant_ids(appt):
+        return jsonify({'message': 'Not authorized'}), 403
+
+    upload_id = start_upload(user_id, appointment_id, filename, data.get('file_type'), size)
+    return jsonify({'upload_id': upload_id, 'offset': 0}), 201
+
+
+@messages_bp.route('/uploads/<upload_id>', methods=['GET'])
+@jwt_required()
+def file_upload_status(upload_id):
+    """Return how many bytes of an upload have arrived, for resuming."""
+    ident = current_identity()
+    meta, offset = load_upload(upload_id, ident.get('id'))
+    return jsonify({'upload_id': upload_id, 'offset': offset, 'size': meta.get('size')})
+
+
+@messages_bp.route('/uploads/<upload_id>', methods=['PUT'])
+@jwt_required()
+def upload_file_chunk(upload_id):
+    """Append a chunk of raw bytes (the request body) to an upload.
+
+    The chunk's position is given by an Upload-Offset header or by
+    Content-Range (bytes start-end/total) and must equal the bytes received
+    so far; otherwise 409 with the current offset. The body is streamed to
+    disk, never read into memory whole. Response: { offset }
+    """
+    ident = current_identity()
+    meta, _ = load_upload(upload_id, ident.get('id'))
+
+    content_range = parse_content_range_header(request.headers.get('Content-Range'))
+    if request.headers.get('Upload-Offset') is not None:
+        try:
+            offset = int(request.headers['Upload-Offset'])
+        except ValueError:
+            return jsonify({'message': 'Upload-Offset must be an integer'}), 400
+    elif content_range is not None:
+        offset = content_range.start
+    else:
+        return jsonify({'message': 'Upload-Offset or Content-Range header is required'}), 400
+
+    offset = append_chunk(upload_id, meta, offset, request.stream)
+    return jsonify({'upload_id': upload_id, 'offset': offset})
+
+
+@messages_bp.route('/uploads/<upload_id>/complete', methods=['POST'])
+@jwt_required()
+def complete_file_upload(upload_id):
+    """Finish an upload and send it as a message.
+
+    Expected JSON: { receiver_id, message_text (optional) }
+    The file is stored once per distinct content (by SHA-256) and its path
+    recorded on the new message. Response: { message_id, file_path, sha256, size }
+    """
+    ident = current_identity()
+    sender_id = ident.get('id')
+    meta, _ = load_upload(upload_id, sender_id)
+
+    data = request.get_json() or {}
+    receiver_id = data.get('receiver_id')
+    appt = Appointment.query.get_or_404(meta['appointment_id'])
+    participants = _participant_ids(appt)
+    if sender_id not in participants or receiver_id not in participants:
+        return jsonify({'message': 'Sender or receiver not part of appointment'}), 403
+
+    sha256, file_path, size = finish_upload(upload_id, meta)
+
+    msg = Message(
+        appointment_id=appt.id,
+        sender_id=sender_id,
+        receiver_id=receiver_id,
+        message_text=data.get('message_text'),
+        file_path=file_path,
+        file_type=meta.get('file_type'),
+        file_name=meta.get('filename'),
+        is_read=False
+    )
+    db.session.add(msg)
+    increment_unread(receiver_id, appt.id)
+    db.session.commit()
+    message_broker.publish(_channel(appt.id), _serialize(msg))
+    return jsonify({'message': 'Message sent', 'message_id': msg.id, 'file_path': file_path,
+                    'sha256': sha256, 'size': size}), 201
+
+
 @messages_bp.route('/file/<path:filename>', methods=['GET'])
+@jwt_required()
 def download_file(filename):
-    """Serve uploaded files from configured upload folder. Ensure proper auth checks where needed."""
+    """Download a message attachment.
+
+    Only participants of an appointment that has a message with this
+    ``file_path`` may download it; the check runs once, before any bytes
+    are sent. Supports Range / If-Range (resumable downloads) and
+    If-None-Match. With ``DOWNLOAD_OFFLOAD`` set to ``'x-accel-redirect'``
+    or ``'x-sendfile'`` the response carries only headers and the front-end
+    proxy streams the file itself.
+    """
+    ident = current_identity()
+    user_id = ident.get('id')
+
+    allowed = db.session.query(Message.id, Message.file_name).filter(
+        Message.file_path == filename,
+        Message.appointment_id.in_(_participant_appointments(user_id))
+    ).first()
+    if allowed is None:
+        return jsonify({'message': 'File not found'}), 404
+
     upload_folder = current_app.config.get('UPLOAD_FOLDER') or os.path.join(os.getcwd(), 'uploads')
-    return send_from_directory(upload_folder, filename, as_attachment=True)
+    path = safe_join(upload_folder, filename)
+    if path is None or not os.path.isfile(path):
+        return jsonify({'message': 'File not found'}), 404
+
+    # blobs are named by their SHA-256, which makes a strong, content-derived
+    # ETag and lets clients keep them forever; older uploads fall back to
+    # werkzeug's mtime/size ETag and must revalidate
+    name = os.path.basename(filename)
+    download_name = allowed.file_name or name
+    immutable = filename == blob_relpath(name)
+    etag = name if immutable else True
+    cache_control = (f"private, max-age={current_app.config.get('DOWNLOAD_MAX_AGE', 31536000)}, immutable"
+                     if immutable else 'private, no-cache')
+
+    offload = current_app.config.get('DOWNLOAD_OFFLOAD')
+    if offload:
+        resp = current_app.response_class(status=200)
+        if offload == 'x-accel-redirect':
+            prefix = current_app.config.get('DOWNLOAD_ACCEL_PREFIX', '/protected-uploads').rstrip('/')
+            resp.headers['X-Accel-Redirect'] = f'{prefix}/{filename}'
+        elif offload == 'x-sendfile':
+            resp.headers['X-Sendfile'] = os.path.abspath(path)
+        else:
+            raise ValueError(f'unknown DOWNLOAD_OFFLOAD {offload!r}')
+        resp.headers.set('Content-Disposition', 'attachment', **_disposition_names(download_name))
+        resp.headers['Cache-Control'] = cache_control
+        if immutable:
+            resp.set_etag(name)
+        # the proxy adds Content-Type, Content-Length and handles Range
+        resp.headers.pop('Content-Type', None)
+        return resp
+
+    resp = send_from_directory(upload_folder, filename, as_attachment=True,
+                               download_name=download_name, etag=etag, conditional=True)
+    resp.headers['Cache-Control'] = cache_control
+    return resp
@@ -0,0 +1,245 @@
+"""Prometheus metrics at ``/metrics``.
+
+Exposes, in the Prometheus text format:
+
+* ``legal_sheba_requests_total{method,blueprint,endpoint,status}``
+* ``legal_sheba_request_duration_seconds{blueprint,endpoint}`` (histogram)
+* ``legal_sheba_requests_in_flight``
+* ``legal_sheba_db_queries_total`` / ``legal_sheba_db_query_seconds_total``
+  per endpoint (from querystats.py)
+* ``legal_sheba_db_pool_*{bind}`` - size, checked out, overflow
+* ``legal_sheba_cache_*`` - response cache hits, misses and hit ratio
+
+Request metrics are recorded without locks. Each thread writes only to
+its own shard, a set of plain dicts. A scrape copies the shards, which
+is atomic under the GIL, and sums them. Shards of threads that have
+exited are folded into a retired total, so the counters stay monotonic.
+Unmatched URLs are recorded under the endpoint ``<unmatched>`` so that
+arbitrary paths can't multiply label sets.
+
+``METRICS_TOKEN`` must be sent as ``Authorization: Bearer ...``. Without
+a token the endpoint answers only in debug or testing and is a 404
+otherwise, since it lists every route along with traffic and pool stats.
+
+Every counter here is per process. Behind several gunicorn workers each
+scrape reaches one worker, so series from different workers interleave
+and seem to reset. Run one worker per metrics target, or scrape each
+worker on its own address. This module doesn't aggregate across
+processes.
+"""
+import hmac
+import threading
+import time
+from bisect import bisect_left
+
+from flask import abort, current_app, g, request
+
+from cache import response_cache
+from extensions import db
+from querystats import query_stats
+
+PREFIX = 'legal_sheba'
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class _Shard:
+    """Counters written by one thread only."""
+
+    def __init__(self):
+        self.thread = threading.current_thread()
+        self.requests = {}      # (method, blueprint, endpoint, status) -> count
+        self.latency = {}       # (blueprint, endpoint) -> [per-bucket counts..., +Inf count, sum]
+        self.queries = {}       # (blueprint, endpoint) -> [count, seconds]
+        self.in_flight = 0
+
+
+def _merge(into, shard):
+    for key, n in shard['requests'].items():
+        into['requests'][key] = into['requests'].get(key, 0) + n
+    for field in ('latency', 'queries'):
+        for key, values in shard[field].items():
+            total = into[field].get(key)
+            if total is None:
+                into[field][key] = list(values)
+            else:
+                for i, v in enumerate(values):
+                    total[i] += v
+    into['in_flight'] += shard['in_flight']
+
+
+def _snapshot(shard):
+    # dict.copy / list() are single C calls, so they can't see a half-applied update
+    return {
+        'requests': shard.requests.copy(),
+        'latency': {k: list(v) for k, v in shard.latency.copy().items()},
+        'queries': {k: list(v) for k, v in shard.queries.copy().items()},
+        'in_flight': shard.in_flight,
+    }
+
+
+def _empty():
+    return {'requests': {}, 'latency': {}, 'queries': {}, 'in_flight': 0}
+
+
+def _labels(**labels):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{k}="{escape(v)}"' for k, v in labels.items()) + '}'
+
+
+class Metrics:
+    def __init__(self, app=None):
+        self._local = threading.local()
+        self._shards = []
+        self._retired = _empty()
+        self._lock = threading.Lock()       # guards the shard list, not the counters
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('METRICS_ENABLED', True)
+        app.config.setdefault('METRICS_PATH', '/metrics')
+        app.config.setdefault('METRICS_TOKEN', None)
+        if not app.config['METRICS_ENABLED']:
+            return
+        app.before_request(self._start)
+        app.after_request(self._status)
+        app.teardown_request(self._finish)
+        app.add_url_rule(app.config['METRICS_PATH'], 'metrics', self.view)
+        app.extensions['metrics'] = self
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def _start(self):
+        self._shard().in_flight += 1
+        g._metrics_started = time.perf_counter()
+        g._metrics_status = 500       # until a response says otherwise
+
+    def _status(self, response):
+        g._metrics_status = response.status_code
+        return response
+
+    def _finish(self, exc):
+        started = g.pop('_metrics_started', None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        shard = self._shard()
+        shard.in_flight -= 1
+
+        blueprint = request.blueprint or ''
+        endpoint = request.endpoint if request.url_rule is not None else '<unmatched>'
+        key = (request.method, blueprint, endpoint, g.pop('_metrics_status', 500))
+        shard.requests[key] = shard.requests.get(key, 0) + 1
+
+        route = (blueprint, endpoint)
+        hist = shard.latency.get(route)
+        if hist is None:
+            hist = shard.latency[route] = [0] * (len(BUCKETS) + 2)
+        hist[bisect_left(BUCKETS, elapsed)] += 1
+        hist[-1] += elapsed
+
+        stats = query_stats.current()
+        if stats is not None and stats.count:
+            queries = shard.queries.get(route)
+            if queries is None:
+                queries = shard.queries[route] = [0, 0.0]
+            queries[0] += stats.count
+            queries[1] += stats.seconds
+
+    def collect(self):
+        """Totals over every thread, as ``{'requests', 'latency', 'queries', 'in_flight'}``."""
+        with self._lock:
+            live = []
+            for shard in self._shards:
+                if shard.thread.is_alive():
+                    live.append(shard)
+                else:
+                    # nothing writes to a finished thread's shard any more
+                    _merge(self._retired, _snapshot(shard))
+            self._shards = live
+            totals = _empty()
+            _merge(totals, self._retired)
+        for shard in live:
+            _merge(totals, _snapshot(shard))
+        return totals
+
+    def render(self):
+        totals = self.collect()
+        out = []
+
+        def family(name, kind, help_text):
+            out.append(f'# HELP {PREFIX}_{name} {help_text}')
+            out.append(f'# TYPE {PREFIX}_{name} {kind}')
+
+        family('requests_total', 'counter', 'HTTP requests by endpoint and status.')
+        for (method, blueprint, endpoint, status), n in sorted(totals['requests'].items(), key=str):
+            labels = _labels(method=method, blueprint=blueprint, endpoint=endpoint, status=status)
+            out.append(f'{PREFIX}_requests_total{labels} {n}')
+
+        family('request_duration_seconds', 'histogram', 'Request latency by endpoint.')
+        for (blueprint, endpoint), hist in sorted(totals['latency'].items()):
+            cumulative = 0
+            for bound, n in zip(BUCKETS + ('+Inf',), hist[:-1]):
+                cumulative += n
+                labels = _labels(blueprint=blueprint, endpoint=endpoint, le=bound)
+                out.append(f'{PREFIX}_request_duration_seconds_bucket{labels} {cumulative}')
+            labels = _labels(blueprint=blueprint, endpoint=endpoint)
+            out.append(f'{PREFIX}_request_duration_seconds_sum{labels} {hist[-1]:.6f}')
+            out.append(f'{PREFIX}_request_duration_seconds_count{labels} {cumulative}')
+
+        family('requests_in_flight', 'gauge', 'Requests currently being handled.')
+        out.append(f'{PREFIX}_requests_in_flight {totals["in_flight"]}')
+
+        family('db_queries_total', 'counter', 'SQL statements issued, by endpoint.')
+        for (blueprint, endpoint), (n, _) in sorted(totals['queries'].items()):
+            out.append(f'{PREFIX}_db_queries_total{_labels(blueprint=blueprint, endpoint=endpoint)} {n}')
+        family('db_query_seconds_total', 'counter', 'Time spent in SQL statements, by endpoint.')
+        for (blueprint, endpoint), (_, seconds) in sorted(totals['queries'].items()):
+            out.append(f'{PREFIX}_db_query_seconds_total{_labels(blueprint=blueprint, endpoint=endpoint)} {seconds:.6f}')
+
+        pools = []
+        for bind, engine in db.engines.items():
+            pool = engine.pool
+            if hasattr(pool, 'checkedout'):
+                pools.append((bind or 'default', pool))
+        for name, method, help_text in (
+            ('db_pool_size', 'size', 'Configured connection pool size.'),
+            ('db_pool_checked_out', 'checkedout', 'Connections currently in use.'),
+            ('db_pool_overflow', 'overflow', 'Connections open beyond the pool size.'),
+        ):
+            family(name, 'gauge', help_text)
+            for bind, pool in pools:
+                # QueuePool counts overflow up from -size while below capacity
+                out.append(f'{PREFIX}_{name}{_labels(bind=bind)} {max(0, getattr(pool, method)())}')
+
+        cache = response_cache.stats()
+        family('cache_hits_total', 'counter', 'Response cache hits.')
+        out.append(f'{PREFIX}_cache_hits_total {cache["hits"]}')
+        family('cache_misses_total', 'counter', 'Response cache misses.')
+        out.append(f'{PREFIX}_cache_misses_total {cache["misses"]}')
+        family('cache_hit_ratio', 'gauge', 'Response cache hits / lookups since start.')
+        out.append(f'{PREFIX}_cache_hit_ratio {cache["hit_ratio"]:.6f}')
+
+        return '\n'.join(out) + '\n'
+
+    def view(self):
+        token = current_app.config['METRICS_TOKEN']
+        if not token:
+            if not (current_app.debug or current_app.testing):
+                abort(404)
+        else:
+            supplied = request.headers.get('Authorization', '')
+            if not hmac.compare_digest(supplied.encode(), f'Bearer {token}'.encode()):
+                return current_app.response_class('unauthorized\n', status=401, mimetype='text/plain')
+        return current_app.response_class(self.render(), content_type=CONTENT_TYPE)
+
+
+metrics = Metrics()
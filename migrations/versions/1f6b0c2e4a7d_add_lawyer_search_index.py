@@ -0,0 +1,44 @@
+"""add lawyer search index
+
+Revision ID: 1f6b0c2e4a7d
+Revises: da2bbaff125a
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1f6b0c2e4a7d'
+down_revision = 'da2bbaff125a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # FTS5 only exists on SQLite; other databases use the in-process index
+    # from search.py, which needs no schema.
+    bind = op.get_bind()
+    if bind.dialect.name != 'sqlite':
+        return
+
+    op.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS lawyer_search USING fts5("
+        "name, location, court_of_practice, specialties, "
+        "tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    op.execute(
+        "INSERT INTO lawyer_search (rowid, name, location, court_of_practice, specialties) "
+        "SELECT lp.id, coalesce(u.f_name, ''), coalesce(lp.location, ''), "
+        "coalesce(lp.court_of_practice, ''), "
+        "coalesce((SELECT group_concat(s.name, ' ') FROM specialties s WHERE s.lawyer_id = lp.id), '') "
+        "FROM lawyer_profiles lp JOIN users u ON u.id = lp.user_id"
+    )
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'sqlite':
+        return
+    op.execute("DROP TABLE IF EXISTS lawyer_search")
@@ -0,0 +1,24 @@
+"""index appointments (lawyer_id, status) for dashboard counts
+
+Revision ID: 2c7e9a4b5d18
+Revises: 8d4b2f6a1c93
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2c7e9a4b5d18'
+down_revision = '8d4b2f6a1c93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_appointments_lawyer_id_status', 'appointments', ['lawyer_id', 'status'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_appointments_lawyer_id_status', table_name='appointments')
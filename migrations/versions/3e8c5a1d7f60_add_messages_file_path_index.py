@@ -0,0 +1,24 @@
+"""index messages.file_path for attachment download checks
+
+Revision ID: 3e8c5a1d7f60
+Revises: 9b1d4e6f2a35
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3e8c5a1d7f60'
+down_revision = '9b1d4e6f2a35'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_messages_file_path', 'messages', ['file_path'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_messages_file_path', table_name='messages')
@@ -0,0 +1,26 @@
+"""keep the uploaded file name on attachment messages
+
+Revision ID: 4b7d2e9c1a56
+Revises: 2c7e9a4b5d18
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b7d2e9c1a56'
+down_revision = '2c7e9a4b5d18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('file_name', sa.String(length=255), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.drop_column('file_name')
@@ -0,0 +1,45 @@
+"""add indexes on filter, join and ordering columns
+
+Revision ID: 5d9e3a7c1b24
+Revises: 1f6b0c2e4a7d
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d9e3a7c1b24'
+down_revision = '1f6b0c2e4a7d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_specialties_lawyer_id', 'specialties', ['lawyer_id'], unique=False)
+
+    op.create_index('ix_appointments_client_id', 'appointments', ['client_id'], unique=False)
+    op.create_index('ix_appointments_status', 'appointments', ['status'], unique=False)
+    op.create_index('ix_appointments_lawyer_id_appointment_date', 'appointments',
+                    ['lawyer_id', 'appointment_date'], unique=False)
+
+    op.create_index('ix_messages_receiver_id', 'messages', ['receiver_id'], unique=False)
+    op.create_index('ix_messages_appointment_id_id', 'messages', ['appointment_id', 'id'], unique=False)
+
+    op.create_index('ix_info_hub_date', 'info_hub', ['date'], unique=False)
+    op.create_index('ix_info_hub_category_date', 'info_hub', ['category', 'date'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_info_hub_category_date', table_name='info_hub')
+    op.drop_index('ix_info_hub_date', table_name='info_hub')
+
+    op.drop_index('ix_messages_appointment_id_id', table_name='messages')
+    op.drop_index('ix_messages_receiver_id', table_name='messages')
+
+    op.drop_index('ix_appointments_lawyer_id_appointment_date', table_name='appointments')
+    op.drop_index('ix_appointments_status', table_name='appointments')
+    op.drop_index('ix_appointments_client_id', table_name='appointments')
+
+    op.drop_index('ix_specialties_lawyer_id', table_name='specialties')
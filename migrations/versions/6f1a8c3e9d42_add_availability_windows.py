@@ -0,0 +1,42 @@
+"""add availability windows and appointment duration
+
+Revision ID: 6f1a8c3e9d42
+Revises: 3e8c5a1d7f60
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6f1a8c3e9d42'
+down_revision = '3e8c5a1d7f60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('availability_windows',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('lawyer_id', sa.Integer(), nullable=False),
+    sa.Column('weekday', sa.Integer(), nullable=False),
+    sa.Column('start_minute', sa.Integer(), nullable=False),
+    sa.Column('end_minute', sa.Integer(), nullable=False),
+    sa.Column('slot_minutes', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['lawyer_id'], ['lawyer_profiles.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_availability_windows_lawyer_id_weekday', 'availability_windows',
+                    ['lawyer_id', 'weekday', 'start_minute'], unique=False)
+
+    with op.batch_alter_table('appointments', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('duration_minutes', sa.Integer(), nullable=False, server_default='60'))
+
+
+def downgrade():
+    with op.batch_alter_table('appointments', schema=None) as batch_op:
+        batch_op.drop_column('duration_minutes')
+
+    op.drop_index('ix_availability_windows_lawyer_id_weekday', table_name='availability_windows')
+    op.drop_table('availability_windows')
@@ -0,0 +1,169 @@
+"""convert date string columns to DateTime
+
+Revision ID: 7c2a9f4d6e81
+Revises: 5d9e3a7c1b24
+Create Date: 2026-10-18 12:00:00.000000
+
+Converts users.created_at, info_hub.date, appointments.appointment_date and
+messages.timestamp from String(50) to DateTime in three steps:
+
+1. add a nullable ``<column>_dt`` shadow column next to each string column;
+2. parse the strings in id-ordered chunks, committing after every chunk;
+3. drop the string column and rename the shadow column into its place.
+
+Step 2 only touches rows whose shadow column is still NULL, so an
+interrupted upgrade can simply be re-run and picks up where it stopped.
+Strings that can't be parsed are left NULL; for the NOT NULL columns the
+upgrade stops before step 3 and lists them so they can be fixed by hand.
+"""
+from datetime import datetime, timezone
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c2a9f4d6e81'
+down_revision = '5d9e3a7c1b24'
+branch_labels = None
+depends_on = None
+
+CHUNK_SIZE = 5000
+
+# (table, column, nullable, indexes that include the column)
+COLUMNS = [
+    ('users', 'created_at', True, []),
+    ('info_hub', 'date', False, [
+        ('ix_info_hub_date', ['date']),
+        ('ix_info_hub_category_date', ['category', 'date']),
+    ]),
+    ('appointments', 'appointment_date', False, [
+        ('ix_appointments_lawyer_id_appointment_date', ['lawyer_id', 'appointment_date']),
+    ]),
+    ('messages', 'timestamp', True, []),
+]
+
+_FALLBACK_FORMATS = (
+    '%Y-%m-%d %H:%M',
+    '%Y/%m/%d %H:%M',
+    '%d/%m/%Y %H:%M',
+    '%d/%m/%Y',
+    '%Y/%m/%d',
+)
+
+
+def _parse(value):
+    # frozen copy of dates.parse_datetime; migrations must not import app code
+    if isinstance(value, datetime):
+        dt = value
+    elif isinstance(value, str) and value.strip():
+        s = value.strip()
+        if s.endswith(('Z', 'z')):
+            s = s[:-1] + '+00:00'
+        try:
+            dt = datetime.fromisoformat(s)
+        except ValueError:
+            for fmt in _FALLBACK_FORMATS:
+                try:
+                    dt = datetime.strptime(s, fmt)
+                    break
+                except ValueError:
+                    continue
+            else:
+                return None
+    else:
+        return None
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def _backfill(engine, table, column):
+    shadow = f'{column}_dt'
+    select = sa.text(
+        f'SELECT id, "{column}" FROM {table} '
+        f'WHERE id > :last AND {shadow} IS NULL AND "{column}" IS NOT NULL '
+        'ORDER BY id LIMIT :n'
+    )
+    update = sa.text(f'UPDATE {table} SET {shadow} = :value WHERE id = :id')
+    last = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(select, {'last': last, 'n': CHUNK_SIZE}).all()
+            if not rows:
+                return
+            parsed = [{'id': r[0], 'value': _parse(r[1])} for r in rows]
+            parsed = [p for p in parsed if p['value'] is not None]
+            if parsed:
+                conn.execute(update, parsed)
+        last = rows[-1][0]
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    # step 1: shadow columns (skipped for tables done by an interrupted run)
+    for table, column, _, _ in COLUMNS:
+        existing = {c['name'] for c in inspector.get_columns(table)}
+        if f'{column}_dt' not in existing:
+            with op.batch_alter_table(table, schema=None) as batch_op:
+                batch_op.add_column(sa.Column(f'{column}_dt', sa.DateTime(), nullable=True))
+
+    # step 2: chunked backfill, each chunk in its own committed transaction
+    with op.get_context().autocommit_block():
+        for table, column, _, _ in COLUMNS:
+            _backfill(bind.engine, table, column)
+
+    # step 3: refuse to swap while NOT NULL columns still have gaps
+    for table, column, nullable, _ in COLUMNS:
+        if nullable:
+            continue
+        bad = bind.execute(sa.text(
+            f'SELECT id, "{column}" FROM {table} WHERE {column}_dt IS NULL LIMIT 20'
+        )).all()
+        if bad:
+            raise RuntimeError(
+                f'{table}.{column} has values that are not parseable dates '
+                f'(id, value): {bad}. Fix them and run the upgrade again.'
+            )
+
+    for table, column, nullable, indexes in COLUMNS:
+        for name, _ in indexes:
+            op.drop_index(name, table_name=table)
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_column(column)
+            batch_op.alter_column(f'{column}_dt', new_column_name=column,
+                                  existing_type=sa.DateTime(), nullable=nullable)
+        for name, cols in indexes:
+            op.create_index(name, table, cols, unique=False)
+
+
+def downgrade():
+    bind = op.get_bind()
+    for table, column, nullable, indexes in COLUMNS:
+        for name, _ in indexes:
+            op.drop_index(name, table_name=table)
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column(f'{column}_str', sa.String(length=50), nullable=True))
+
+        last = 0
+        while True:
+            rows = bind.execute(sa.text(
+                f'SELECT id, "{column}" FROM {table} WHERE id > :last ORDER BY id LIMIT :n'
+            ), {'last': last, 'n': CHUNK_SIZE}).all()
+            if not rows:
+                break
+            values = []
+            for row_id, raw in rows:
+                dt = _parse(raw)
+                values.append({'id': row_id, 'value': dt.strftime('%Y-%m-%d %H:%M') if dt else None})
+            bind.execute(sa.text(f'UPDATE {table} SET {column}_str = :value WHERE id = :id'), values)
+            last = rows[-1][0]
+
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_column(column)
+            batch_op.alter_column(f'{column}_str', new_column_name=column,
+                                  existing_type=sa.String(length=50), nullable=nullable)
+        for name, cols in indexes:
+            op.create_index(name, table, cols, unique=False)
@@ -17,6 +17,10 @@ depends_on = None
 
 
 def upgrade():
+    # b4c2d9f0e5e1, which runs before this revision, already creates the table;
+    # a fresh upgrade would otherwise fail with "table already exists"
+    if sa.inspect(op.get_bind()).has_table('messages'):
+        return
     # ### commands auto generated by Alembic - please adjust! ###
     op.create_table('messages',
     sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
@@ -37,6 +41,5 @@ def upgrade():
 
 
 def downgrade():
-    # ### commands auto generated by Alembic - please adjust! ###
-    op.drop_table('messages')
-    # ### end Alembic commands ###
+    # the table is dropped by b4c2d9f0e5e1, which every database has run
+    pass
@@ -0,0 +1,42 @@
+"""one active appointment per lawyer and start time
+
+Revision ID: 8d4b2f6a1c93
+Revises: 6f1a8c3e9d42
+Create Date: 2026-10-18 16:00:00.000000
+
+Adds a partial unique index on appointments (lawyer_id, appointment_date)
+covering every status except 'cancelled'. Existing double bookings would
+make the index fail to build, so the upgrade lists them first and stops;
+resolve them (cancel all but one) and run it again.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d4b2f6a1c93'
+down_revision = '6f1a8c3e9d42'
+branch_labels = None
+depends_on = None
+
+ACTIVE = sa.text("status != 'cancelled'")
+
+
+def upgrade():
+    clashes = op.get_bind().execute(sa.text(
+        "SELECT lawyer_id, appointment_date, COUNT(*) FROM appointments "
+        "WHERE status != 'cancelled' GROUP BY lawyer_id, appointment_date "
+        "HAVING COUNT(*) > 1 LIMIT 20"
+    )).all()
+    if clashes:
+        raise RuntimeError(
+            f'appointments are double booked (lawyer_id, appointment_date, count): {clashes}. '
+            'Cancel all but one of each and run the upgrade again.'
+        )
+    op.create_index('uq_appointments_lawyer_id_appointment_date_active', 'appointments',
+                    ['lawyer_id', 'appointment_date'], unique=True,
+                    sqlite_where=ACTIVE, postgresql_where=ACTIVE)
+
+
+def downgrade():
+    op.drop_index('uq_appointments_lawyer_id_appointment_date_active', table_name='appointments')
@@ -0,0 +1,50 @@
+"""add unread counters
+
+Revision ID: 9b1d4e6f2a35
+Revises: 7c2a9f4d6e81
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b1d4e6f2a35'
+down_revision = '7c2a9f4d6e81'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('unread_counters',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('appointment_id', sa.Integer(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['appointment_id'], ['appointments.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'appointment_id')
+    )
+
+    # seed from the existing unread messages
+    messages = sa.table('messages',
+        sa.column('receiver_id', sa.Integer()),
+        sa.column('appointment_id', sa.Integer()),
+        sa.column('is_read', sa.Boolean()),
+    )
+    counters = sa.table('unread_counters',
+        sa.column('user_id', sa.Integer()),
+        sa.column('appointment_id', sa.Integer()),
+        sa.column('count', sa.Integer()),
+    )
+    unread = sa.or_(messages.c.is_read == sa.false(), messages.c.is_read.is_(None))
+    op.execute(counters.insert().from_select(
+        ['user_id', 'appointment_id', 'count'],
+        sa.select(messages.c.receiver_id, messages.c.appointment_id, sa.func.count())
+        .where(unread)
+        .group_by(messages.c.receiver_id, messages.c.appointment_id)
+    ))
+
+
+def downgrade():
+    op.drop_table('unread_counters')
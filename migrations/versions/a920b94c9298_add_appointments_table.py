@@ -17,6 +17,10 @@ depends_on = None
 
 
 def upgrade():
+    # ae3f1c7b8d9a, which runs before this revision, already creates the table;
+    # a fresh upgrade would otherwise fail with "table already exists"
+    if sa.inspect(op.get_bind()).has_table('appointments'):
+        return
     # ### commands auto generated by Alembic - please adjust! ###
     op.create_table('appointments',
     sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
@@ -34,6 +38,5 @@ def upgrade():
 
 
 def downgrade():
-    # ### commands auto generated by Alembic - please adjust! ###
-    op.drop_table('appointments')
-    # ### end Alembic commands ###
+    # the table is dropped by ae3f1c7b8d9a, which every database has run
+    pass
@@ -27,7 +27,7 @@ def upgrade():
         sa.Column('file_path', sa.String(length=255), nullable=True),
         sa.Column('file_type', sa.String(length=50), nullable=True),
         sa.Column('timestamp', sa.DateTime(), nullable=True, server_default=sa.func.current_timestamp()),
-        sa.Column('is_read', sa.Boolean(), nullable=True, server_default=sa.text('0')),
+        sa.Column('is_read', sa.Boolean(), nullable=True, server_default=sa.false()),
         sa.ForeignKeyConstraint(['appointment_id'], ['appointments.id']),
         sa.ForeignKeyConstraint(['sender_id'], ['users.id']),
         sa.ForeignKeyConstraint(['receiver_id'], ['users.id']),
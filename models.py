@@ -10,14 +10,14 @@ class User(db.Model):
     email = db.Column(db.String(255), unique=True, nullable=False)
     password = db.Column(db.String(255), nullable=False)
     role = db.Column(db.String(50), nullable=False)  # Client, Lawyer
-    created_at = db.Column(db.String(50)) 
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 
 class Specialty(db.Model):
     __tablename__ = "specialties"
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    lawyer_id = db.Column(db.Integer, db.ForeignKey("lawyer_profiles.id")) 
+    lawyer_id = db.Column(db.Integer, db.ForeignKey("lawyer_profiles.id"), index=True)
     name = db.Column(db.String(100), nullable=False)
 
     
@@ -34,40 +34,86 @@ class LawyerProfile(db.Model):
     availability_details = db.Column(db.Text)
     v_hour = db.Column(db.String(255))
 
-    
+
+# one recurring weekly block of bookable time, cut into slot_minutes slots;
+# times are on the same clock as Appointment.appointment_date
+class AvailabilityWindow(db.Model):
+    __tablename__ = "availability_windows"
+    __table_args__ = (
+        # a lawyer's week in order; also serves plain lawyer_id lookups
+        db.Index('ix_availability_windows_lawyer_id_weekday', 'lawyer_id', 'weekday', 'start_minute'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    lawyer_id = db.Column(db.Integer, db.ForeignKey("lawyer_profiles.id", ondelete="CASCADE"), nullable=False)
+    weekday = db.Column(db.Integer, nullable=False)  # 0 = Monday ... 6 = Sunday
+    start_minute = db.Column(db.Integer, nullable=False)  # minutes after midnight
+    end_minute = db.Column(db.Integer, nullable=False)
+    slot_minutes = db.Column(db.Integer, nullable=False, default=60)
 
 
 
 class InfoHub(db.Model):
+    __table_args__ = (
+        # titles by category, newest first
+        db.Index('ix_info_hub_category_date', 'category', 'date'),
+    )
+
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     title = db.Column(db.String(150), nullable=False)
     content = db.Column(db.Text, nullable=False)
     category = db.Column(db.String(50), nullable=False)
-    # use same type as Appointment.appointment_date (string ISO) per request
-    date = db.Column(db.String(50), nullable=False)
+    date = db.Column(db.DateTime, nullable=False, index=True)
 
 
 class Appointment(db.Model):
     __tablename__ = "appointments"
+    __table_args__ = (
+        # a lawyer's calendar; also serves plain lawyer_id lookups
+        db.Index('ix_appointments_lawyer_id_appointment_date', 'lawyer_id', 'appointment_date'),
+        # per-status counts for the lawyer dashboard, straight from the index
+        db.Index('ix_appointments_lawyer_id_status', 'lawyer_id', 'status'),
+        # backstop against double booking: one live appointment per lawyer and start time
+        db.Index('uq_appointments_lawyer_id_appointment_date_active', 'lawyer_id', 'appointment_date',
+                 unique=True,
+                 sqlite_where=db.text("status != 'cancelled'"),
+                 postgresql_where=db.text("status != 'cancelled'")),
+    )
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    client_id = db.Column(db.Integer, db.ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    client_id = db.Column(db.Integer, db.ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
     lawyer_id = db.Column(db.Integer, db.ForeignKey("lawyer_profiles.id", ondelete="CASCADE"), nullable=False)
-    appointment_date = db.Column(db.String(50), nullable=False)  # ISO string (YYYY-MM-DD HH:MM)
-    status = db.Column(db.String(50), nullable=False, default='pending')  # pending / confirmed / completed / cancelled
+    appointment_date = db.Column(db.DateTime, nullable=False)
+    duration_minutes = db.Column(db.Integer, nullable=False, default=60, server_default='60')
+    status = db.Column(db.String(50), nullable=False, default='pending', index=True)  # pending / confirmed / completed / cancelled
     problem_description = db.Column(db.Text)
     notes = db.Column(db.Text)
 
 
 class Message(db.Model):
     __tablename__ = "messages"
+    __table_args__ = (
+        # thread listing in id order; also serves plain appointment_id lookups
+        db.Index('ix_messages_appointment_id_id', 'appointment_id', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     appointment_id = db.Column(db.Integer, db.ForeignKey("appointments.id"), nullable=False)
     sender_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
-    receiver_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    receiver_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False, index=True)
     message_text = db.Column(db.Text)
-    file_path = db.Column(db.String(255))
+    file_path = db.Column(db.String(255), index=True)
     file_type = db.Column(db.String(50))
-    timestamp = db.Column(db.String(50))  # stored as ISO string or DB datetime depending on DB
+    file_name = db.Column(db.String(255))       # name the sender uploaded it under
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     is_read = db.Column(db.Boolean, default=False)
+
+
+# unread message count per (receiver, appointment); maintained by
+# counters.py when messages are sent and read
+class UnreadCounter(db.Model):
+    __tablename__ = "unread_counters"
+
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), primary_key=True)
+    appointment_id = db.Column(db.Integer, db.ForeignKey("appointments.id"), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
@@ -0,0 +1,120 @@
+"""Keyset (cursor) pagination shared by the list endpoints.
+
+A page is requested with ``?limit=N&cursor=...``. The cursor is opaque to
+clients: it is the URL-safe base64 of the sort key of the last row on the
+previous page, so fetching the next page is an index range scan starting
+right after that row instead of an OFFSET that re-reads everything before
+it. Paginated endpoints respond with::
+
+    { "items": [...], "next_cursor": str | null }
+"""
+import base64
+import binascii
+import json
+import math
+from datetime import datetime
+
+from flask import current_app, jsonify, request
+from sqlalchemy import tuple_
+
+
+class InvalidCursor(ValueError):
+    """Raised for a cursor that was not produced by ``encode_cursor``."""
+
+
+def _encode_value(value):
+    # datetimes (DateTime sort keys) survive the round trip as {"dt": iso}
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    raise TypeError(type(value).__name__)
+
+
+def _decode_value(obj):
+    if set(obj) == {'dt'}:
+        return datetime.fromisoformat(obj['dt'])
+    return obj
+
+
+def encode_cursor(values):
+    raw = json.dumps(list(values), separators=(',', ':'), default=_encode_value).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw, object_hook=_decode_value)
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        raise InvalidCursor(token)
+    if not isinstance(values, list) or not values:
+        raise InvalidCursor(token)
+    return values
+
+
+def _matches(value, expected):
+    if isinstance(value, bool):
+        return expected is bool
+    if expected is float:
+        return isinstance(value, (int, float)) and math.isfinite(value)
+    return isinstance(value, expected)
+
+
+def check_cursor(after, types):
+    """Raise InvalidCursor unless ``after`` holds one value of each of ``types``.
+
+    Stops a tampered cursor (wrong types, nested lists or objects) before it
+    reaches SQL binding or an in-memory comparison.
+    """
+    if len(after) != len(types) or not all(_matches(v, t) for v, t in zip(after, types)):
+        raise InvalidCursor(after)
+
+
+def _python_type(column):
+    try:
+        return column.type.python_type
+    except NotImplementedError:
+        return object
+
+
+def page_params():
+    """Return ``(limit, after)`` from the query string.
+
+    ``limit`` is clamped to ``PAGINATION_MAX_LIMIT``; ``after`` is the decoded
+    cursor (a list of key values) or None for the first page.
+    """
+    default = current_app.config.get('PAGINATION_DEFAULT_LIMIT', 50)
+    maximum = current_app.config.get('PAGINATION_MAX_LIMIT', 200)
+    limit = request.args.get('limit', default, type=int)
+    limit = max(1, min(limit, maximum))
+    cursor = request.args.get('cursor')
+    return limit, (decode_cursor(cursor) if cursor else None)
+
+
+def keyset_page(query, columns, key, limit, after=None, descending=False):
+    """Fetch one page of ``query`` ordered by ``columns``.
+
+    ``columns`` must form a unique key (end with the primary key) and ``key``
+    maps a result row to the values of those columns. Returns
+    ``(rows, next_cursor)``; ``next_cursor`` is None on the last page.
+    """
+    if after is not None:
+        check_cursor(after, [_python_type(c) for c in columns])
+        bound = tuple_(*columns)
+        query = query.filter(bound < tuple_(*after) if descending else bound > tuple_(*after))
+
+    ordering = [c.desc() if descending else c.asc() for c in columns]
+    rows = query.order_by(*ordering).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(key(rows[-1]))
+    return rows, next_cursor
+
+
+def page_response(items, next_cursor, status=200):
+    return jsonify({'items': items, 'next_cursor': next_cursor}), status
+
+
+def invalid_cursor_response(e):
+    return jsonify({'message': 'Invalid cursor'}), 400
@@ -0,0 +1,178 @@
+"""Publish/subscribe fan-out for real-time message delivery.
+
+``send_message`` publishes each new message on the channel
+``appointment:<id>``; the SSE stream endpoint subscribes to it. Backends
+(``PUBSUB_BACKEND``):
+
+* ``'memory'`` - in-process broker. Enough for a single worker process.
+* ``'redis'`` - Redis PUBLISH/PSUBSCRIBE, so a message sent through one
+  worker reaches streams held open by every other worker. Each process
+  runs one listener thread that feeds its local in-process broker. If the
+  connection drops the thread reconnects with backoff. Messages published
+  in the meantime are lost, so every local subscriber is then marked
+  ``overflowed`` to make its client catch up from the database.
+
+Subscribers get a bounded queue. A subscriber that falls too far behind
+is marked ``overflowed`` and should end its stream; the client reconnects
+with ``Last-Event-ID`` and catches up from the database.
+"""
+import json
+import logging
+import queue
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+class Subscription:
+    def __init__(self, broker, channel, maxsize):
+        self.broker = broker
+        self.channel = channel
+        self.overflowed = False
+        self._queue = queue.Queue(maxsize=maxsize)
+
+    def put(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout=None):
+        """Next event, or None if nothing arrived within ``timeout`` seconds."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    def __init__(self, queue_size=256):
+        self.queue_size = queue_size
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel):
+        sub = Subscription(self, channel, self.queue_size)
+        with self._lock:
+            self._channels.setdefault(channel, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            subs = self._channels.get(sub.channel)
+            if subs:
+                subs.discard(sub)
+                if not subs:
+                    del self._channels[sub.channel]
+
+    def publish(self, channel, event):
+        with self._lock:
+            subs = list(self._channels.get(channel, ()))
+        for sub in subs:
+            sub.put(event)
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(s) for s in self._channels.values())
+
+    def overflow_all(self):
+        """End every open stream; clients reconnect and replay from the database."""
+        with self._lock:
+            subs = [sub for channel in self._channels.values() for sub in channel]
+        for sub in subs:
+            sub.overflowed = True
+
+
+class RedisBroker(InProcessBroker):
+    """Fan-out across processes through Redis; local delivery is in-process."""
+
+    def __init__(self, client, prefix='legal_sheba:pubsub:', queue_size=256):
+        super().__init__(queue_size)
+        self.client = client
+        self.prefix = prefix
+        self._listener = None
+        self._listener_lock = threading.Lock()
+        self.retry_delay = 0.5
+        self.max_retry_delay = 30
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("PUBSUB_BACKEND='redis' requires the 'redis' package")
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    def _listen(self):
+        delay = self.retry_delay
+        while True:
+            pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.psubscribe(self.prefix + '*')
+                delay = self.retry_delay
+                for item in pubsub.listen():
+                    channel = item['channel']
+                    if isinstance(channel, bytes):
+                        channel = channel.decode('utf-8')
+                    super().publish(channel[len(self.prefix):], json.loads(item['data']))
+            except Exception:
+                log.exception('pub/sub listener lost its connection; retrying in %.1fs', delay)
+            finally:
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
+            # anything published while disconnected never reached the queues
+            self.overflow_all()
+            time.sleep(delay)
+            delay = min(delay * 2, self.max_retry_delay)
+
+    def subscribe(self, channel):
+        if self._listener is None:
+            with self._listener_lock:
+                if self._listener is None:
+                    self._listener = threading.Thread(
+                        target=self._listen, name='pubsub-listener', daemon=True
+                    )
+                    self._listener.start()
+        return super().subscribe(channel)
+
+    def publish(self, channel, event):
+        self.client.publish(self.prefix + channel, json.dumps(event))
+
+
+class MessageBroker:
+    """Facade configured from ``PUBSUB_BACKEND`` / ``PUBSUB_REDIS_URL``."""
+
+    def __init__(self, app=None):
+        self.backend = InProcessBroker()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PUBSUB_BACKEND', 'memory')
+        app.config.setdefault('PUBSUB_REDIS_URL', None)
+        app.config.setdefault('PUBSUB_QUEUE_SIZE', 256)
+
+        kind = app.config['PUBSUB_BACKEND']
+        size = app.config['PUBSUB_QUEUE_SIZE']
+        if kind == 'memory':
+            self.backend = InProcessBroker(size)
+        elif kind == 'redis':
+            self.backend = RedisBroker.from_url(app.config['PUBSUB_REDIS_URL'], queue_size=size)
+        else:
+            raise ValueError(f'unknown PUBSUB_BACKEND {kind!r}')
+        app.extensions['message_broker'] = self
+
+    def subscribe(self, channel):
+        return self.backend.subscribe(channel)
+
+    def publish(self, channel, event):
+        self.backend.publish(channel, event)
+
+
+message_broker = MessageBroker()
@@ -0,0 +1,274 @@
+"""EXPLAIN QUERY PLAN and query budget guard for the API.
+
+``flask check-query-plans`` builds a throwaway in-memory SQLite database,
+seeds one row per table, calls every read route through the test client
+(first page and a cursor page where the route paginates) and runs
+``EXPLAIN QUERY PLAN`` on each SELECT the route issued. It exits non-zero
+when a plan contains a full table scan or sorts through a temporary
+b-tree, so a dropped index or an unindexed filter shows up before it
+reaches production data sizes.
+
+The same run then calls every write route. All requests run under
+``TESTING`` with ``QUERY_BUDGET_ENFORCE`` on, so a view that goes over
+its query budget or repeats a SELECT (see querystats.py) fails the
+check. So does a view that answers with an error status, or a view that
+no request reached, other than the ones in ``NOT_EXERCISED``.
+"""
+import os
+import shutil
+import tempfile
+from datetime import datetime
+
+import click
+from sqlalchemy import event
+
+# (endpoint, table) pairs where a scan is intended: the unfiltered
+# directory listing walks lawyer_profiles in primary-key order under LIMIT.
+ALLOWED_SCANS = {
+    ('lawyers.search_lawyers', 'lawyer_profiles'),
+}
+
+# endpoints the check doesn't call: static files, the token-gated metrics
+# page and the long-lived SSE stream
+NOT_EXERCISED = {'static', 'metrics', 'messages.stream_messages'}
+
+# the seeded attachment, stored under UPLOAD_FOLDER like a real upload
+BLOB = 'blobs/ab/' + 'ab' * 32
+
+
+def _seed(db):
+    from flask import current_app
+    from models import User, LawyerProfile, Specialty, Appointment, Message, InfoHub, AvailabilityWindow
+    from search import search_index
+
+    client = User(f_name='Client', email='client@example.com', password='x', role='Client')
+    lawyer = User(f_name='Lawyer', email='lawyer@example.com', password='x', role='Lawyer')
+    db.session.add_all([client, lawyer])
+    db.session.flush()
+
+    profile = LawyerProfile(user_id=lawyer.id, location='Dhaka', court_of_practice='High Court')
+    db.session.add(profile)
+    db.session.flush()
+    db.session.add(Specialty(lawyer_id=profile.id, name='Family'))
+    db.session.add(AvailabilityWindow(lawyer_id=profile.id, weekday=2, start_minute=540, end_minute=1020))
+
+    appt = Appointment(client_id=client.id, lawyer_id=profile.id,
+                       appointment_date=datetime(2025, 1, 1, 10, 0), status='pending')
+    db.session.add(appt)
+    db.session.flush()
+    for _ in range(2):
+        db.session.add(Message(appointment_id=appt.id, sender_id=client.id,
+                               receiver_id=lawyer.id, message_text='hello'))
+    db.session.add(Message(appointment_id=appt.id, sender_id=client.id, receiver_id=lawyer.id,
+                           file_path=BLOB))
+    path = os.path.join(current_app.config['UPLOAD_FOLDER'], BLOB)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'%PDF-1.4 query plan check\n')
+    for day in (1, 2):
+        db.session.add(InfoHub(title='Guide', content='...', category='family',
+                               date=datetime(2025, 1, day, 9, 0)))
+    db.session.flush()
+    search_index.index_profile(profile.id)
+    db.session.commit()
+    return client, lawyer, profile, appt
+
+
+def _token(user):
+    from identity import create_token
+    return {'Authorization': 'Bearer ' + create_token(user)}
+
+
+def _requests(client, lawyer, profile, appt):
+    """(url, headers, paginated, json_body) for every read route; a body means POST."""
+    as_client, as_lawyer = _token(client), _token(lawyer)
+    return [
+        ('/lawyers', {}, True, None),
+        ('/lawyers?location=dhaka', {}, True, None),
+        ('/lawyers?specialty=fam', {}, True, None),
+        ('/lawyers?q=lawyer', {}, True, None),
+        (f'/lawyers/{profile.id}', {}, False, None),
+        (f'/lawyers/by_user/{lawyer.id}', {}, False, None),
+        (f'/lawyers/profile/exists/{lawyer.id}', {}, False, None),
+        (f'/lawyers/{profile.id}/availability', {}, False, None),
+        (f'/lawyers/{profile.id}/slots?from=2024-12-30&to=2025-01-06', {}, False, None),
+        (f'/auth/user/{lawyer.id}', {}, False, None),
+        ('/infohub/', {}, True, None),
+        ('/infohub/titles', {}, True, None),
+        ('/infohub/titles/family', {}, True, None),
+        ('/infohub/contents/1', {}, False, None),
+        ('/appointments', as_client, True, None),
+        ('/appointments/lawyer', as_lawyer, True, None),
+        ('/appointments/lawyer?from=2025-01-01&to=2025-01-08', as_lawyer, True, None),
+        ('/appointments/lawyer/summary', as_lawyer, False, None),
+        ('/appointments/export', as_lawyer, False, None),
+        ('/appointments/export?format=ndjson', as_client, False, None),
+        (f'/appointments/{appt.id}', as_client, False, None),
+        (f'/messages/appointment/{appt.id}', as_client, True, None),
+        (f'/messages/appointment/{appt.id}', as_lawyer, True, None),
+        (f'/messages/appointment/{appt.id}?since_id=1', as_client, False, None),
+        (f'/messages/appointment/{appt.id}/export', as_client, False, None),
+        ('/messages/sync', as_client, False, {'threads': {str(appt.id): 1}}),
+        ('/messages/sync', as_lawyer, False, {}),
+        ('/messages/unread', as_lawyer, False, None),
+        ('/messages/file/' + BLOB, as_lawyer, False, None),
+    ]
+
+
+def plan_problems(db, endpoint, statement, params):
+    """Return a list of human readable problems in the plan of one SELECT."""
+    rows = db.session.connection().exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, tuple(params)).all()
+    details = [row[-1] for row in rows]
+    # ranking full-text matches always sorts the match set; that is bounded
+    # by the number of hits, not by the table size
+    ranked = any('VIRTUAL TABLE' in d for d in details)
+    problems = []
+    for detail in details:
+        if detail.startswith('SCAN ') and 'VIRTUAL TABLE' not in detail and ' USING ' not in detail:
+            table = detail.split()[1]
+            if (endpoint, table) not in ALLOWED_SCANS:
+                problems.append(detail)
+        elif detail.startswith('USE TEMP B-TREE') and not ranked:
+            problems.append(detail)
+    return problems
+
+
+def _write_requests(http, send, client, lawyer, profile, appt):
+    """Call every write route once through ``send(url, request_fn)``.
+
+    Steps that need an id from an earlier response (a new lawyer's token,
+    an upload id) read it from that response.
+    """
+    as_client, as_lawyer = _token(client), _token(lawyer)
+    upload = b'%PDF-1.4 query budget check\n'
+
+    def call(method, url, headers=None, **kwargs):
+        resp = send(url, lambda: http.open(url, method=method, headers=headers or {}, **kwargs))
+        return (resp.get_json(silent=True) or {}) if resp is not None else {}
+
+    token = call('POST', '/auth/signup', json={'f_name': 'New', 'email': 'new@example.com',
+                                                'password': 'pw', 'role': 'Lawyer'}).get('access_token')
+    call('POST', '/auth/login', json={'email': 'new@example.com', 'password': 'pw'})
+    call('POST', '/lawyers/profile', {'Authorization': f'Bearer {token}'},
+         json={'location': 'Sylhet', 'specialties': ['Tax', 'Family']})
+    call('PUT', f'/lawyers/profile/{profile.id}', as_lawyer,
+         json={'experience': 7, 'specialties': ['Family', 'Property']})
+    call('PUT', '/lawyers/profile/availability', as_lawyer,
+         json={'windows': [{'weekday': d, 'start': '09:00', 'end': '17:00'} for d in range(5)]})
+
+    call('POST', '/infohub/', json={'title': 'New guide', 'content': '...', 'category': 'tax'})
+
+    new_appt = call('POST', '/appointments/new', as_client,
+                    json={'lawyer_id': profile.id, 'appointment_date': '2025-01-06T09:00'}).get('appointment_id')
+    call('PUT', f'/appointments/{appt.id}', as_lawyer, json={'notes': 'Reviewed'})
+    call('POST', '/appointments/lawyer/status', as_lawyer, json={'status': 'confirmed', 'ids': [appt.id]})
+    call('POST', f'/appointments/{new_appt}/cancel', as_client)
+
+    message = {'appointment_id': appt.id, 'receiver_id': lawyer.id, 'message_text': 'hi'}
+    call('POST', '/messages/send', as_client, json=message)
+    call('POST', '/messages/send/batch', as_client, json={'messages': [message] * 3})
+    call('POST', '/messages/1/read', as_lawyer)
+    call('POST', '/messages/read', as_lawyer, json={'ids': [2, 3]})
+
+    upload_id = call('POST', '/messages/uploads', as_client,
+                     json={'appointment_id': appt.id, 'filename': 'brief.pdf', 'size': len(upload)}).get('upload_id')
+    call('PUT', f'/messages/uploads/{upload_id}', {**as_client, 'Upload-Offset': '0'}, data=upload)
+    call('GET', f'/messages/uploads/{upload_id}', as_client)
+    call('POST', f'/messages/uploads/{upload_id}/complete', as_client, json={'receiver_id': lawyer.id})
+
+
+def check_query_plans():
+    """Return ``[(endpoint, url, statement, problems), ...]`` for every failure.
+
+    ``statement`` is None for failures that aren't about one SELECT's plan:
+    an exceeded query budget, an error status or an endpoint never called.
+    """
+    from flask import request
+    from app import create_app
+    from config import Config
+    from extensions import db
+    from querystats import QueryBudgetExceeded
+
+    upload_folder = tempfile.mkdtemp(prefix='query-plans-')
+
+    class PlanCheckConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite://'
+        TESTING = True
+        QUERY_BUDGET_ENFORCE = True
+        CACHE_BACKEND = 'null'
+        RATELIMIT_BACKEND = 'null'
+        HASH_POOL_BACKEND = 'inline'
+        UPLOAD_FOLDER = upload_folder
+
+    app = create_app(PlanCheckConfig)
+    captured = []
+    failures = []
+    reached = []            # endpoints in request order
+
+    @app.before_request
+    def record_endpoint():
+        reached.append(request.endpoint)
+
+    def send(url, fn):
+        """Run one request; record a budget overrun or an error status."""
+        try:
+            resp = fn()
+            resp.get_data()     # streamed responses only query while the body is read
+        except QueryBudgetExceeded as e:
+            failures.append((reached[-1], url, None, [str(e)]))
+            return None
+        if resp.status_code >= 400:
+            failures.append((reached[-1], url, None, [f'status {resp.status_code}']))
+        return resp
+
+    with app.app_context():
+        db.create_all()
+        seeded = _seed(db)
+        targets = _requests(*seeded)
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith('SELECT') and 'sqlite_master' not in statement:
+                captured.append((request.endpoint, statement, parameters))
+
+        event.listen(db.engine, 'before_cursor_execute', capture)
+        http = app.test_client()
+        for url, headers, paginated, body in targets:
+            if body is not None:
+                send(url, lambda: http.post(url, headers=headers, json=body))
+            elif paginated:
+                sep = '&' if '?' in url else '?'
+                page = send(url, lambda: http.get(f'{url}{sep}limit=1', headers=headers))
+                cursor = page.get_json().get('next_cursor') if page is not None else None
+                if cursor:
+                    send(url, lambda: http.get(f'{url}{sep}limit=1&cursor={cursor}', headers=headers))
+            else:
+                send(url, lambda: http.get(url, headers=headers))
+
+            for endpoint, statement, params in captured:
+                problems = plan_problems(db, endpoint, statement, params)
+                if problems:
+                    failures.append((endpoint, url, statement, problems))
+            captured.clear()
+        event.remove(db.engine, 'before_cursor_execute', capture)
+
+        _write_requests(http, send, *seeded)
+    shutil.rmtree(upload_folder, ignore_errors=True)
+
+    for endpoint in sorted(set(app.view_functions) - set(reached) - NOT_EXERCISED):
+        failures.append((endpoint, None, None, ['not exercised']))
+    return failures
+
+
+@click.command('check-query-plans')
+def check_query_plans_command():
+    """Fail on a full scan in a read route's plan or any route over its query budget."""
+    failures = check_query_plans()
+    for endpoint, url, statement, problems in failures:
+        click.echo(f'{endpoint} ({url}):' if url else f'{endpoint}:', err=True)
+        if statement:
+            click.echo('    ' + ' '.join(statement.split()), err=True)
+        for p in problems:
+            click.echo(f'    -> {p}', err=True)
+    if failures:
+        raise SystemExit(1)
+    click.echo('query plans OK')
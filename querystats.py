@@ -0,0 +1,169 @@
+"""Per-request SQL instrumentation.
+
+Cursor-execute hooks on every engine count and time the statements each
+request issues. After the request:
+
+* ``Server-Timing: db;dur=<ms>;desc="<n> queries", app;dur=<ms>`` is added
+  to the response under ``SERVER_TIMING`` (default: when ``DEBUG`` or
+  ``TESTING``, as it tells every client how the database is doing), so
+  browser dev tools and proxies can show where the time went;
+* statements slower than ``SLOW_QUERY_MS`` are logged with the route
+  that issued them;
+* under ``QUERY_BUDGET_ENFORCE`` (default: when ``TESTING``) a request
+  raises ``QueryBudgetExceeded`` if it ran more statements than its
+  budget or the same SELECT shape ``QUERY_REPEAT_LIMIT`` times, which
+  is the signature of an N+1 loop.
+
+A view's budget defaults to ``QUERY_BUDGET`` and can be set per view with
+``@query_budget(n)``. Statements run while a streamed body is consumed
+come after the response headers; they are logged but not counted.
+"""
+import re
+import time
+from collections import Counter
+from functools import wraps
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+
+from extensions import db
+
+_IN_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)|\(\s*%\(\w+\)s(?:\s*,\s*%\(\w+\)s)*\s*\)')
+_SPACE_RE = re.compile(r'\s+')
+
+
+def statement_shape(statement):
+    """``statement`` with whitespace collapsed and IN lists of any length folded into one."""
+    return _IN_LIST_RE.sub('(?)', _SPACE_RE.sub(' ', statement).strip())
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class RequestQueries:
+    """Statements issued by one request; ``shapes`` counts the SELECTs by shape."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+
+    def add(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        if statement.lstrip()[:6].upper() == 'SELECT':
+            self.shapes[statement_shape(statement)] += 1
+
+
+def query_budget(n):
+    """Allow the view at most ``n`` statements per request (see ``QUERY_BUDGET``)."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            return fn(*args, **kwargs)
+        wrapper.query_budget = n
+        return wrapper
+    return decorator
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, '_query_start', None)
+    if start is None or not has_request_context():
+        return
+    seconds = time.perf_counter() - start
+    stats = g.get('_request_queries')
+    if stats is not None and not g.get('_request_queries_done'):
+        stats.add(statement, seconds)
+    slow_ms = current_app.config['SLOW_QUERY_MS']
+    if slow_ms and seconds * 1000 >= slow_ms:
+        current_app.logger.warning(
+            'slow query (%.1f ms) in %s %s: %s',
+            seconds * 1000, request.method, request.endpoint or request.path, _SPACE_RE.sub(' ', statement),
+        )
+
+
+class QueryStats:
+    def __init__(self, app=None):
+        self._engines = set()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Call after the database is set up, so every bind gets the hooks."""
+        app.config.setdefault('SERVER_TIMING', None)
+        app.config.setdefault('SLOW_QUERY_MS', 200)
+        app.config.setdefault('QUERY_BUDGET', 30)
+        app.config.setdefault('QUERY_REPEAT_LIMIT', 5)
+        app.config.setdefault('QUERY_BUDGET_ENFORCE', None)
+
+        with app.app_context():
+            for engine in db.engines.values():
+                if engine not in self._engines:
+                    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+                    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+                    self._engines.add(engine)
+
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.extensions['query_stats'] = self
+
+    @staticmethod
+    def current():
+        """The ``RequestQueries`` of the current request, or None."""
+        return g.get('_request_queries') if has_request_context() else None
+
+    def _start(self):
+        # reset explicitly: g outlives the request when an app context was
+        # already pushed (CLI checks, tests)
+        g._request_queries = RequestQueries()
+        g._request_queries_done = False
+
+    def _finish(self, response):
+        stats = g.get('_request_queries')
+        if stats is None:
+            return response
+        g._request_queries_done = True
+        config = current_app.config
+        timing = config['SERVER_TIMING']
+        if timing is None:
+            timing = current_app.debug or current_app.testing
+        if timing:
+            elapsed = time.perf_counter() - stats.started
+            response.headers.add(
+                'Server-Timing',
+                f'db;dur={stats.seconds * 1000:.2f};desc="{stats.count} queries", app;dur={elapsed * 1000:.2f}',
+            )
+        enforce = config['QUERY_BUDGET_ENFORCE']
+        if enforce is None:
+            enforce = current_app.testing
+        if enforce:
+            self._check(stats, config)
+        return response
+
+    @staticmethod
+    def _check(stats, config):
+        view = current_app.view_functions.get(request.endpoint)
+        budget = getattr(view, 'query_budget', None) or config['QUERY_BUDGET']
+        if budget and stats.count > budget:
+            raise QueryBudgetExceeded(
+                f'{request.endpoint} ran {stats.count} queries, budget is {budget}: '
+                + '; '.join(f'{n} x {shape}' for shape, n in stats.shapes.most_common(5))
+            )
+        repeat_limit = config['QUERY_REPEAT_LIMIT']
+        if repeat_limit:
+            shape, n = stats.shapes.most_common(1)[0] if stats.shapes else (None, 0)
+            if n >= repeat_limit:
+                raise QueryBudgetExceeded(
+                    f'{request.endpoint} ran the same statement {n} times '
+                    f'(limit {repeat_limit}), likely an N+1 loop: {shape}'
+                )
+
+
+query_stats = QueryStats()
@@ -0,0 +1,177 @@
+"""Token-bucket rate limiting for expensive routes.
+
+A limit is a config value such as ``'5/minute'``: a bucket holds up to 5
+tokens and refills at 5 per minute, so a client can burst 5 requests and is
+then held to the average rate. Views opt in with::
+
+    @rate_limiter.limit('LOGIN_RATE_LIMIT_IP', key=client_ip)
+
+which checks the bucket for ``key()`` before the view (and so before any
+database or hashing work) runs. Decorators stack, e.g. one per IP and one
+per email address. An empty config value switches that limit off.
+
+Backends (``RATELIMIT_BACKEND``):
+
+* ``'memory'`` - per-process buckets, bounded by ``RATELIMIT_MAX_KEYS``
+  (least recently used keys are dropped, which refills them);
+* ``'redis'`` - buckets shared by every worker, updated atomically by a Lua
+  script; built from ``RATELIMIT_REDIS_URL``. ``RedisBucketStore`` accepts
+  any client with an ``eval`` method;
+* ``'null'`` - no limiting.
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache, wraps
+
+from flask import current_app, jsonify, request
+
+_PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+_LIMIT_RE = re.compile(r'^\s*(\d+)\s*/\s*(\d*)\s*(second|minute|hour|day)s?\s*$')
+
+
+@lru_cache(maxsize=64)
+def parse_limit(value):
+    """``'5/minute'`` or ``'100/10 minutes'`` -> ``(capacity, tokens_per_second)``."""
+    m = _LIMIT_RE.match(value)
+    if not m:
+        raise ValueError(f'bad rate limit {value!r}')
+    count, multiplier, unit = m.groups()
+    period = int(multiplier or 1) * _PERIODS[unit]
+    return int(count), int(count) / period
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after):
+        super().__init__(retry_after)
+        self.retry_after = retry_after
+
+
+class MemoryBucketStore:
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()        # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate, cost=1):
+        """Take ``cost`` tokens; return 0 if allowed, else seconds to wait."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            if tokens >= cost:
+                tokens -= cost
+                wait = 0
+            else:
+                wait = (cost - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+class RedisBucketStore:
+    _SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local now = tonumber(ARGV[4])
+local b = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(b[1]) or capacity
+local ts = tonumber(b[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+return tostring(wait)
+"""
+
+    def __init__(self, client, prefix='legal_sheba:ratelimit:'):
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("RATELIMIT_BACKEND='redis' requires the 'redis' package")
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    def take(self, key, capacity, rate, cost=1):
+        wait = self.client.eval(self._SCRIPT, 1, self.prefix + key, capacity, rate, cost, time.time())
+        return float(wait)
+
+
+class NullBucketStore:
+    def take(self, key, capacity, rate, cost=1):
+        return 0
+
+
+def client_ip():
+    # behind a proxy, wrap the app in werkzeug's ProxyFix so this is the client
+    return request.remote_addr or 'unknown'
+
+
+class RateLimiter:
+    def __init__(self, app=None):
+        self.store = NullBucketStore()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RATELIMIT_BACKEND', 'memory')
+        app.config.setdefault('RATELIMIT_MAX_KEYS', 10000)
+        app.config.setdefault('RATELIMIT_REDIS_URL', None)
+
+        kind = app.config['RATELIMIT_BACKEND']
+        if kind == 'memory':
+            self.store = MemoryBucketStore(app.config['RATELIMIT_MAX_KEYS'])
+        elif kind == 'redis':
+            self.store = RedisBucketStore.from_url(app.config['RATELIMIT_REDIS_URL'])
+        elif kind == 'null':
+            self.store = NullBucketStore()
+        else:
+            raise ValueError(f'unknown RATELIMIT_BACKEND {kind!r}')
+        app.extensions['rate_limiter'] = self
+
+    def hit(self, scope, key, limit, cost=1):
+        """Charge one request against ``scope:key``; raise ``RateLimited`` if over ``limit``."""
+        capacity, rate = parse_limit(limit)
+        wait = self.store.take(f'{scope}:{key}', capacity, rate, cost)
+        if wait > 0:
+            raise RateLimited(wait)
+
+    def limit(self, config_key, key=client_ip):
+        """Rate-limit the decorated view by the limit stored in ``config_key``.
+
+        ``key`` returns the bucket key for the current request (client IP by
+        default); returning None skips the check for that request.
+        """
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                limit = current_app.config.get(config_key)
+                if limit:
+                    bucket = key()
+                    if bucket is not None:
+                        self.hit(config_key, bucket, limit)
+                return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+
+def rate_limited_response(e):
+    resp = jsonify({'message': 'Too many requests, try again later'})
+    resp.headers['Retry-After'] = str(max(1, int(e.retry_after + 0.999)))
+    return resp, 429
+
+
+rate_limiter = RateLimiter()
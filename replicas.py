@@ -0,0 +1,165 @@
+"""Read-replica routing for the public directory.
+
+With ``DATABASE_REPLICA_URL`` set, ``init_database`` adds the replica as the
+``'replica'`` bind. Views decorated with ``@replica_reads`` send their
+SELECTs there. Everything else goes to the primary, and that includes the
+reads a routed view makes once it has flushed or executed a write.
+
+Read-your-writes: when a request commits a write, its client is pinned
+to the primary for ``DATABASE_REPLICA_STICKY_SECONDS``. That period
+should be longer than the replica is expected to lag. A client is its
+user id when the request carried a token, and its address otherwise.
+Pins are kept per process by default. ``DATABASE_REPLICA_STICKY_REDIS_URL``
+shares them between workers.
+
+Responses built from replica reads must not be shared across clients:
+``response_cache.cached`` doesn't store them and ``conditional(tags=...)``
+gives them a body-hash ETag instead of a tag-version one (see
+``served_from_replica``). Otherwise a stale body would be cached under the
+version a fresh write just bumped, and the writer would be served it.
+
+``RoutingSession`` is the ``db.session`` class (see extensions.py). It only
+reads ``flask.g`` and the app's extensions, so it does not import ``db``.
+"""
+from functools import wraps
+
+from flask import current_app, g, has_app_context, has_request_context
+from flask_jwt_extended import get_jwt, verify_jwt_in_request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.sql.elements import TextClause
+
+from cache import LRUBackend, RedisBackend
+from ratelimit import client_ip
+
+REPLICA_BIND = 'replica'
+
+
+def _is_read(clause):
+    if clause is None:
+        return False
+    if isinstance(clause, TextClause):
+        return clause.text.lstrip()[:6].upper() == 'SELECT'
+    return bool(getattr(clause, 'is_select', False))
+
+
+class RoutingSession(Session):
+    """``db.session`` that sends the reads of ``@replica_reads`` views to the replica."""
+
+    def _reads_from_replica(self, clause):
+        return (
+            has_app_context()
+            and g.get('_db_replica_reads', False)
+            and not self.info.get('wrote')
+            and not self._flushing
+            and not (self.new or self.dirty or self.deleted)
+            and _is_read(clause)
+        )
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._reads_from_replica(clause):
+            engine = self._db.engines.get(REPLICA_BIND)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _flushed(session, flush_context):
+    session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _executed(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _committed(session):
+    if session.info.pop('wrote', False) and has_request_context():
+        router = current_app.extensions.get('replica_router')
+        if router is not None:
+            router.pin()
+
+
+@event.listens_for(RoutingSession, 'after_soft_rollback')
+def _rolled_back(session, previous_transaction):
+    if not previous_transaction.nested:
+        session.info.pop('wrote', None)
+
+
+def _client_keys():
+    keys = ['ip:' + client_ip()]
+    try:
+        verify_jwt_in_request(optional=True)
+        sub = get_jwt().get('sub')
+    except Exception:
+        # a bad or expired token only matters to the views that require one
+        sub = None
+    if sub is not None:
+        keys.append(f'user:{sub}')
+    return keys
+
+
+class ReplicaRouter:
+    def __init__(self, app=None):
+        self.pins = LRUBackend(10000)
+        self.sticky_seconds = 5
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('DATABASE_REPLICA_URL', '')
+        app.config.setdefault('DATABASE_REPLICA_STICKY_SECONDS', 5)
+        app.config.setdefault('DATABASE_REPLICA_STICKY_REDIS_URL', None)
+
+        url = app.config['DATABASE_REPLICA_STICKY_REDIS_URL']
+        if url:
+            self.pins = RedisBackend.from_url(url, prefix='legal_sheba:replica:')
+        else:
+            self.pins = LRUBackend(10000)
+        self.sticky_seconds = app.config['DATABASE_REPLICA_STICKY_SECONDS']
+        app.before_request(self._reset)
+        app.extensions['replica_router'] = self
+
+    def _reset(self):
+        # g outlives the request when an app context was already pushed
+        g.pop('_db_replica_served', None)
+
+    def pin(self):
+        """Keep the current client on the primary for the next few seconds."""
+        for key in _client_keys():
+            self.pins.set(key, 1, self.sticky_seconds)
+
+    def pinned(self):
+        return any(self.pins.get(key) for key in _client_keys())
+
+    def use_replica(self):
+        return bool(current_app.config.get('DATABASE_REPLICA_URL')) and not self.pinned()
+
+
+replica_router = ReplicaRouter()
+
+
+def served_from_replica():
+    """True when the current request's view read from the replica."""
+    return has_app_context() and g.get('_db_replica_served', False)
+
+
+def replica_reads(fn):
+    """Run the view's reads against the replica, unless its client just wrote.
+
+    Put it directly above the view function.
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not replica_router.use_replica():
+            return fn(*args, **kwargs)
+        g._db_replica_reads = True
+        g._db_replica_served = True
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            g.pop('_db_replica_reads', None)
+    return wrapper
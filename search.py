@@ -0,0 +1,371 @@
+"""Full-text search over the lawyer directory.
+
+The index covers the lawyer's name, location, court of practice and
+specialty names. On SQLite it lives in an FTS5 virtual table inside the
+main database, so it is updated in the same transaction as the profile
+it describes. Other databases (or SQLite builds without FTS5) fall back
+to an in-process inverted index. It is rebuilt from the tables on first
+use and again once it is ``SEARCH_INDEX_MAX_AGE`` seconds old, which is
+how other workers' edits reach it. This worker's edits are applied when
+their transaction commits.
+
+Queries are tokenized the same way for both backends, following FTS5's
+``unicode61 remove_diacritics 2``: every term is a prefix match, multiple
+terms are ANDed together, and results are ranked best-first.
+"""
+import math
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+from flask import current_app
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from extensions import db
+from models import LawyerProfile, User, Specialty
+
+FIELDS = ('name', 'location', 'court_of_practice', 'specialties')
+FTS_TABLE = 'lawyer_search'
+
+
+def _fold(ch):
+    """Lower-case ``ch`` and strip a Latin letter's diacritics (\u00e9 -> e)."""
+    base = unicodedata.normalize('NFD', ch)[0]
+    if base != ch and unicodedata.name(base, '').startswith('LATIN'):
+        ch = base
+    return ch.lower()
+
+
+def tokenize(value):
+    """Split free text into folded word tokens the way FTS5's unicode61 does.
+
+    Letters, digits and private-use characters make up tokens; a combining
+    mark is dropped after a Latin letter and separates tokens anywhere
+    else; everything else, underscore included, is a separator.
+    """
+    tokens, current = [], []
+    for ch in unicodedata.normalize('NFC', value or ''):
+        cat = unicodedata.category(ch)
+        if cat[0] in 'LN' or cat == 'Co':
+            current.append(_fold(ch))
+            continue
+        if cat[0] == 'M' and current and unicodedata.name(current[-1], '').startswith('LATIN'):
+            continue
+        if current:
+            tokens.append(''.join(current))
+            current = []
+    if current:
+        tokens.append(''.join(current))
+    return tokens
+
+
+def profile_documents(profile_ids=None):
+    """Yield ``(profile_id, {field: text})`` for the given (or all) profiles."""
+    q = db.session.query(
+        LawyerProfile.id, User.f_name, LawyerProfile.location, LawyerProfile.court_of_practice
+    ).join(User, User.id == LawyerProfile.user_id)
+    sq = db.session.query(Specialty.lawyer_id, Specialty.name)
+    if profile_ids is not None:
+        q = q.filter(LawyerProfile.id.in_(profile_ids))
+        sq = sq.filter(Specialty.lawyer_id.in_(profile_ids))
+
+    specs = defaultdict(list)
+    for lawyer_id, name in sq.all():
+        specs[lawyer_id].append(name)
+
+    for pid, name, location, court in q.all():
+        yield pid, {
+            'name': name or '',
+            'location': location or '',
+            'court_of_practice': court or '',
+            'specialties': ' '.join(specs.get(pid, [])),
+        }
+
+
+class FTS5Backend:
+    """Search backed by an SQLite FTS5 table keyed by ``rowid = lawyer_profiles.id``."""
+
+    name = 'fts5'
+
+    CREATE_SQL = (
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        "name, location, court_of_practice, specialties, "
+        "tokenize = 'unicode61 remove_diacritics 2')"
+    )
+
+    def _write(self, docs):
+        for pid, doc in docs:
+            db.session.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :id"), {'id': pid})
+            db.session.execute(
+                text(
+                    f"INSERT INTO {FTS_TABLE} (rowid, name, location, court_of_practice, specialties) "
+                    "VALUES (:id, :name, :location, :court_of_practice, :specialties)"
+                ),
+                dict(doc, id=pid),
+            )
+
+    @staticmethod
+    def available():
+        """True when the virtual table exists in the bound database."""
+        return db.session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :n"),
+            {'n': FTS_TABLE},
+        ).first() is not None
+
+    def index(self, profile_ids):
+        self._write(profile_documents(profile_ids))
+
+    def remove(self, profile_ids):
+        for pid in profile_ids:
+            db.session.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :id"), {'id': pid})
+
+    def rebuild(self):
+        db.session.execute(text(f"DELETE FROM {FTS_TABLE}"))
+        self._write(profile_documents())
+
+    @staticmethod
+    def match_expression(terms):
+        parts = []
+        for field, token in terms:
+            phrase = f'"{token}"*'
+            parts.append(f'{field} : {phrase}' if field else phrase)
+        return ' AND '.join(parts)
+
+    def search(self, terms, limit=None, after=None):
+        sql = f"SELECT rowid, rank FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :q"
+        params = {'q': self.match_expression(terms)}
+        if after is not None:
+            sql += " AND (rank > :after_rank OR (rank = :after_rank AND rowid > :after_id))"
+            params['after_rank'], params['after_id'] = after
+        sql += " ORDER BY rank, rowid"
+        if limit is not None:
+            sql += " LIMIT :limit"
+            params['limit'] = limit
+        return [(row[1], row[0]) for row in db.session.execute(text(sql), params)]
+
+
+class _Index:
+    """Postings for one snapshot of the directory."""
+
+    def __init__(self):
+        self.built = time.monotonic()
+        self.docs = {}                                   # id -> {field: [tokens]}
+        self.postings = defaultdict(dict)                # token -> {id: {field: tf}}
+        self.vocab = []                                  # sorted tokens, for prefix lookup
+
+    def add(self, pid, doc):
+        fields = {f: tokenize(doc.get(f)) for f in FIELDS}
+        self.docs[pid] = fields
+        for field, tokens in fields.items():
+            for tok in tokens:
+                posting = self.postings.get(tok)
+                if posting is None:
+                    posting = self.postings[tok] = {}
+                    insort(self.vocab, tok)
+                tf = posting.setdefault(pid, {})
+                tf[field] = tf.get(field, 0) + 1
+
+    def drop(self, pid):
+        fields = self.docs.pop(pid, None)
+        if not fields:
+            return
+        for tokens in fields.values():
+            for tok in tokens:
+                self.postings.get(tok, {}).pop(pid, None)
+
+
+class InvertedIndexBackend:
+    """In-process inverted index for databases without FTS5.
+
+    The index is per process. ``index``/``remove`` read the new documents
+    inside the caller's transaction but only apply them once it commits
+    (see ``_apply_pending``), so a rolled-back edit never shows up. Edits
+    made by other workers arrive with the next rebuild, at most
+    ``max_age`` seconds later; a rebuild is computed outside the lock and
+    swapped in.
+    """
+
+    name = 'memory'
+
+    def __init__(self, max_age=None):
+        self.max_age = max_age
+        self._lock = threading.RLock()
+        self._index = None
+
+    def _build(self):
+        index = _Index()
+        for pid, doc in profile_documents():
+            index.add(pid, doc)
+        with self._lock:
+            self._index = index
+        return index
+
+    def ensure(self):
+        index = self._index
+        if index is None or (self.max_age and time.monotonic() - index.built > self.max_age):
+            index = self._build()
+        return index
+
+    def _defer(self, changes):
+        pending = db.session.info.setdefault('search_index_pending', [])
+        pending.append((self, changes))
+
+    def apply(self, changes):
+        """Apply ``[(pid, doc or None), ...]``; None removes the profile."""
+        with self._lock:
+            if self._index is None:
+                return          # built from the committed tables on first use
+            for pid, doc in changes:
+                self._index.drop(pid)
+                if doc is not None:
+                    self._index.add(pid, doc)
+
+    def index(self, profile_ids):
+        docs = dict(profile_documents(profile_ids))
+        self._defer([(pid, docs.get(pid)) for pid in profile_ids])
+
+    def remove(self, profile_ids):
+        self._defer([(pid, None) for pid in profile_ids])
+
+    def rebuild(self):
+        self._build()
+
+    def _expand(self, index, prefix):
+        i = bisect_left(index.vocab, prefix)
+        while i < len(index.vocab) and index.vocab[i].startswith(prefix):
+            yield index.vocab[i]
+            i += 1
+
+    def search(self, terms, limit=None, after=None):
+        index = self.ensure()
+        with self._lock:
+            total = max(len(index.docs), 1)
+            scores = None
+            for field, prefix in terms:
+                term_scores = defaultdict(float)
+                for tok in self._expand(index, prefix):
+                    posting = index.postings[tok]
+                    if not posting:
+                        continue
+                    idf = math.log(1 + total / len(posting))
+                    for pid, tf in posting.items():
+                        hits = tf.get(field, 0) if field else sum(tf.values())
+                        if hits:
+                            term_scores[pid] += hits * idf
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {pid: s + term_scores[pid] for pid, s in scores.items() if pid in term_scores}
+                if not scores:
+                    return []
+
+        # lower rank is better, matching FTS5's convention
+        ranked = sorted((-s, pid) for pid, s in scores.items())
+        if after is not None:
+            after = tuple(after)
+            ranked = [r for r in ranked if r > after]
+        return ranked[:limit] if limit is not None else ranked
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_pending(session):
+    for backend, changes in session.info.pop('search_index_pending', ()):
+        backend.apply(changes)
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _discard_pending(session, transaction):
+    # Runs after ``after_commit``; anything left over was rolled back.
+    if transaction.parent is None:
+        session.info.pop('search_index_pending', None)
+
+
+class LawyerSearchIndex:
+    """Facade used by the routes; picks a backend from ``SEARCH_BACKEND``.
+
+    ``SEARCH_BACKEND`` may be ``'auto'`` (FTS5 on SQLite, otherwise the
+    in-process index), ``'fts5'`` or ``'memory'``.
+    """
+
+    def __init__(self, app=None):
+        self._backends = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SEARCH_BACKEND', 'auto')
+        app.config.setdefault('SEARCH_INDEX_MAX_AGE', 60)
+        app.extensions['lawyer_search'] = self
+
+    def _backend(self):
+        engine = db.engine
+        backend = self._backends.get(engine)
+        if backend is not None:
+            return backend
+
+        choice = current_app.config.get('SEARCH_BACKEND', 'auto')
+        if choice == 'auto':
+            choice = 'fts5' if engine.dialect.name == 'sqlite' else 'memory'
+        if choice == 'fts5' and FTS5Backend.available():
+            backend = FTS5Backend()
+        else:
+            backend = InvertedIndexBackend(current_app.config.get('SEARCH_INDEX_MAX_AGE'))
+        self._backends[engine] = backend
+        return backend
+
+    @property
+    def backend_name(self):
+        return self._backend().name
+
+    def index_profile(self, profile_id):
+        """(Re)index one profile. Call after flush, before commit.
+
+        FTS5 writes join the caller's transaction; the in-process index
+        applies the change when that transaction commits.
+        """
+        self._backend().index([profile_id])
+
+    def remove_profile(self, profile_id):
+        self._backend().remove([profile_id])
+
+    def rebuild(self):
+        """Reindex every profile, e.g. after a bulk load that bypassed the routes. Caller commits."""
+        self._backend().rebuild()
+
+    def search(self, q=None, location=None, specialty=None, limit=None, after=None):
+        """Return ``[(rank, profile_id), ...]`` best match first.
+
+        ``q`` matches any indexed field; ``location`` and ``specialty`` are
+        restricted to their own columns. ``after`` is a ``(rank, profile_id)``
+        pair from a previous page. Returns ``[]`` when no usable search terms
+        were given.
+        """
+        terms = [(None, t) for t in tokenize(q)]
+        terms += [('location', t) for t in tokenize(location)]
+        terms += [('specialties', t) for t in tokenize(specialty)]
+        if not terms:
+            return []
+        return self._backend().search(terms, limit=limit, after=after)
+
+
+@event.listens_for(LawyerProfile.__table__, 'after_create')
+def _create_fts_table(target, connection, **kw):
+    """Create the FTS5 table alongside ``lawyer_profiles`` under ``db.create_all()``.
+
+    Migrated databases get it from the ``lawyer_search`` migration instead.
+    """
+    if connection.dialect.name != 'sqlite':
+        return
+    try:
+        with connection.begin_nested():
+            connection.execute(text(FTS5Backend.CREATE_SQL))
+    except OperationalError:
+        # SQLite compiled without FTS5; the in-process index is used instead
+        pass
+
+
+search_index = LawyerSearchIndex()
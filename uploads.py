@@ -0,0 +1,242 @@
+"""Resumable chunked uploads into a content-addressed blob store.
+
+Layout under ``UPLOAD_FOLDER``::
+
+    incoming/<upload_id>.part   bytes received so far
+    incoming/<upload_id>.json   who started the upload and for which appointment
+    blobs/<aa>/<sha256>         finished files, named by their SHA-256
+
+Chunks are appended straight from the request stream to the ``.part`` file
+in ``UPLOAD_BUFFER_SIZE`` pieces, so a worker never holds more than one
+buffer of a file in memory. A client that loses its connection asks for the
+current offset and continues from there. On completion the file is hashed
+(again streaming) and moved into ``blobs/``; if that blob already exists the
+upload is discarded, so identical documents are stored once.
+
+Everything lives on disk, so any worker sharing the folder can serve any
+step of an upload. Uploads that receive no bytes for
+``UPLOAD_EXPIRE_SECONDS`` are deleted: by ``start_upload`` at most once
+per ``_SWEEP_INTERVAL`` per process, and by ``flask expire-uploads``.
+"""
+import hashlib
+import json
+import os
+import re
+import time
+import uuid
+from contextlib import contextmanager
+
+import click
+from flask import current_app
+
+try:
+    import fcntl
+except ImportError:          # not available on Windows
+    fcntl = None
+
+_UPLOAD_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+_SWEEP_INTERVAL = 3600
+_last_sweep = None
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400, **extra):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.extra = extra
+
+
+def upload_root():
+    return current_app.config.get('UPLOAD_FOLDER') or os.path.join(os.getcwd(), 'uploads')
+
+
+def _incoming(upload_id, suffix):
+    if not _UPLOAD_ID_RE.match(upload_id):
+        raise UploadError('Upload not found', 404)
+    return os.path.join(upload_root(), 'incoming', upload_id + suffix)
+
+
+def blob_relpath(sha256):
+    """Path of a blob relative to ``UPLOAD_FOLDER`` (what ``Message.file_path`` stores)."""
+    return f'blobs/{sha256[:2]}/{sha256}'
+
+
+@contextmanager
+def _locked(path, blocking=True):
+    """Exclusive lock on an upload so two requests can't append at once.
+
+    Opens without creating, so a request racing a completed or expired
+    upload gets a 404 instead of a fresh orphan ``.part``. With
+    ``blocking=False`` an upload that is locked elsewhere raises
+    ``BlockingIOError``.
+    """
+    try:
+        fh = open(path, 'r+b')
+    except FileNotFoundError:
+        raise UploadError('Upload not found', 404)
+    with fh:
+        if fcntl is not None:
+            fcntl.flock(fh, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        try:
+            yield fh
+        finally:
+            fh.flush()          # buffered bytes must reach the file before others see its size
+            if fcntl is not None:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def clean_filename(name):
+    """The client's file name reduced to a bare, printable name, or None."""
+    if not name:
+        return None
+    name = os.path.basename(name.replace('\\', '/'))
+    name = ''.join(ch for ch in name if ch.isprintable()).strip()
+    return name[:255] or None
+
+
+def start_upload(owner_id, appointment_id, filename=None, file_type=None, size=None):
+    """Register a new upload and return its id.
+
+    ``filename`` is kept (see ``clean_filename``) and later stored on the
+    message, so downloads carry the name the file was uploaded under.
+    """
+    max_bytes = current_app.config.get('UPLOAD_MAX_BYTES')
+    if size is not None and max_bytes and size > max_bytes:
+        raise UploadError(f'file exceeds {max_bytes} bytes', 413)
+
+    _maybe_expire_uploads()
+    upload_id = uuid.uuid4().hex
+    os.makedirs(os.path.join(upload_root(), 'incoming'), exist_ok=True)
+    meta = {
+        'owner_id': owner_id,
+        'appointment_id': appointment_id,
+        'filename': clean_filename(filename),
+        'file_type': file_type,
+        'size': size,
+        'created': time.time(),
+    }
+    with open(_incoming(upload_id, '.json'), 'w') as fh:
+        json.dump(meta, fh)
+    open(_incoming(upload_id, '.part'), 'wb').close()
+    return upload_id
+
+
+def load_upload(upload_id, owner_id):
+    """Return ``(meta, offset)`` for an upload owned by ``owner_id``."""
+    try:
+        with open(_incoming(upload_id, '.json')) as fh:
+            meta = json.load(fh)
+    except FileNotFoundError:
+        raise UploadError('Upload not found', 404)
+    if meta['owner_id'] != owner_id:
+        raise UploadError('Not authorized', 403)
+    try:
+        return meta, os.path.getsize(_incoming(upload_id, '.part'))
+    except FileNotFoundError:
+        raise UploadError('Upload not found', 404)
+
+
+def append_chunk(upload_id, meta, offset, stream):
+    """Append ``stream`` at ``offset`` and return the new offset.
+
+    ``offset`` must equal the number of bytes already received; a retry of a
+    chunk that partly arrived gets a 409 carrying the real offset.
+    """
+    buffer_size = current_app.config.get('UPLOAD_BUFFER_SIZE', 64 * 1024)
+    max_bytes = meta.get('size') or current_app.config.get('UPLOAD_MAX_BYTES')
+
+    with _locked(_incoming(upload_id, '.part')) as fh:
+        # the size only counts once the lock is held; a concurrent PUT with
+        # the same offset may have appended while this one waited
+        current = os.fstat(fh.fileno()).st_size
+        if offset != current:
+            raise UploadError('Offset mismatch', 409, offset=current)
+        fh.seek(current)
+        while True:
+            chunk = stream.read(buffer_size)
+            if not chunk:
+                break
+            if max_bytes and current + len(chunk) > max_bytes:
+                fh.truncate(offset)
+                raise UploadError(f'file exceeds {max_bytes} bytes', 413, offset=offset)
+            fh.write(chunk)
+            current += len(chunk)
+    return current
+
+
+def finish_upload(upload_id, meta):
+    """Move a complete upload into the blob store; return ``(sha256, relpath, size)``."""
+    part = _incoming(upload_id, '.part')
+    buffer_size = current_app.config.get('UPLOAD_BUFFER_SIZE', 64 * 1024)
+
+    with _locked(part):
+        size = os.path.getsize(part)
+        if meta.get('size') is not None and size != meta['size']:
+            raise UploadError('Upload incomplete', 409, offset=size)
+
+        digest = hashlib.sha256()
+        with open(part, 'rb') as fh:
+            for chunk in iter(lambda: fh.read(buffer_size), b''):
+                digest.update(chunk)
+        sha256 = digest.hexdigest()
+
+        relpath = blob_relpath(sha256)
+        target = os.path.join(upload_root(), relpath)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if os.path.exists(target):
+            os.remove(part)          # same content already stored
+        else:
+            os.replace(part, target)
+
+    os.remove(_incoming(upload_id, '.json'))
+    return sha256, relpath, size
+
+
+def expire_uploads(max_age):
+    """Delete uploads that have received no bytes for ``max_age`` seconds; return how many."""
+    incoming = os.path.join(upload_root(), 'incoming')
+    try:
+        names = os.listdir(incoming)
+    except FileNotFoundError:
+        return 0
+    cutoff = time.time() - max_age
+    expired = 0
+    for name in names:
+        upload_id, ext = os.path.splitext(name)
+        if ext != '.json' or not _UPLOAD_ID_RE.match(upload_id):
+            continue
+        meta_path, part = _incoming(upload_id, '.json'), _incoming(upload_id, '.part')
+        try:
+            # appends touch the .part, so an upload in progress stays fresh
+            touched = os.path.getmtime(part if os.path.exists(part) else meta_path)
+            if touched >= cutoff:
+                continue
+            if os.path.exists(part):
+                with _locked(part, blocking=False):
+                    os.remove(part)
+            os.remove(meta_path)
+        except (FileNotFoundError, BlockingIOError, UploadError):
+            continue          # finished, expired or being written by another request
+        expired += 1
+    return expired
+
+
+def _maybe_expire_uploads():
+    global _last_sweep
+    max_age = current_app.config.get('UPLOAD_EXPIRE_SECONDS')
+    now = time.monotonic()
+    if not max_age or (_last_sweep is not None and now - _last_sweep < _SWEEP_INTERVAL):
+        return
+    _last_sweep = now
+    expire_uploads(max_age)
+
+
+@click.command('expire-uploads')
+@click.option('--max-age', type=int, default=None,
+              help='Seconds without new bytes before an upload is deleted (default: UPLOAD_EXPIRE_SECONDS).')
+def expire_uploads_command(max_age):
+    """Delete abandoned resumable uploads from UPLOAD_FOLDER/incoming."""
+    if max_age is None:
+        max_age = current_app.config['UPLOAD_EXPIRE_SECONDS']
+    click.echo(f'{expire_uploads(max_age)} abandoned uploads removed')
@@ -0,0 +1,11 @@
+"""Checks for values taken from request JSON before they reach a query."""
+
+
+def is_id(value):
+    """True if ``value`` is a positive integer usable as a primary key.
+
+    bool is an int subclass, so ``true`` is rejected explicitly; strings,
+    lists and dicts would otherwise reach an IN list, a dict lookup or
+    ``get_or_404`` and fail there with a 500.
+    """
+    return isinstance(value, int) and not isinstance(value, bool) and value > 0